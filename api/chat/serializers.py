@@ -0,0 +1,29 @@
+from rest_framework import serializers
+
+from core.models import ChatMessage
+
+
+class ChatHistoryQuerySerializer(serializers.Serializer):
+    before = serializers.CharField(
+        required=False,
+        max_length=32,
+        help_text="Only the messages sent before the message having this message id "
+                  "are returned. Should be the message id of the oldest message of "
+                  "the previous page.",
+    )
+    limit = serializers.IntegerField(
+        required=False, default=50, min_value=1, max_value=100
+    )
+
+
+class ChatMessageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChatMessage
+        fields = (
+            "message_id",
+            "conversation_id",
+            "sender_id",
+            "receiver_id",
+            "message",
+            "created_at",
+        )
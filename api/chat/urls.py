@@ -0,0 +1,11 @@
+from django.urls import re_path
+
+from api.chat.views import ChatHistoryApiView
+
+app_name = "api.chat"
+
+urlpatterns = [
+    re_path(
+        r"^history/(?P<user_id>[0-9]+)$", ChatHistoryApiView.as_view(), name="history"
+    ),
+]
@@ -0,0 +1,37 @@
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from api.chat.serializers import ChatHistoryQuerySerializer, ChatMessageSerializer
+from core.chat.handler import ChatHandler
+from core.chat.utils import get_conversation_id
+from core.decorators import validate_query_parameters
+
+
+class ChatHistoryApiView(APIView):
+    permission_classes = (IsAuthenticated,)
+
+    @validate_query_parameters(ChatHistoryQuerySerializer)
+    def get(self, request, user_id, query_params):
+        """
+        Returns a page of the messages between the user and the provided user, newest
+        first. The next page is requested by providing the message id of the oldest
+        message as `before`.
+        """
+
+        limit = query_params["limit"]
+        conversation_id = get_conversation_id(request.user.id, int(user_id))
+        messages = ChatHandler().get_history(
+            conversation_id,
+            before_message_id=query_params.get("before"),
+            limit=limit,
+        )
+        serializer = ChatMessageSerializer(messages, many=True)
+        response = {
+            "payload": serializer.data,
+            "page_info": {
+                "before": messages[-1].message_id if len(messages) == limit else None,
+                "limit": limit,
+            },
+        }
+        return Response(response, status=200)
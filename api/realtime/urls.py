@@ -0,0 +1,9 @@
+from django.urls import re_path
+
+from api.realtime.views import WebSocketMetricsApiView
+
+app_name = "api.realtime"
+
+urlpatterns = [
+    re_path(r"^metrics$", WebSocketMetricsApiView.as_view(), name="metrics"),
+]
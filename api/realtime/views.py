@@ -0,0 +1,17 @@
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from ws.queues import send_queue_metrics
+
+
+class WebSocketMetricsApiView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        """
+        Returns the send queue metrics of the web socket connections served by the
+        process that handles the request.
+        """
+
+        return Response({"payload": send_queue_metrics.snapshot()}, status=200)
@@ -4,6 +4,8 @@ from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 
+from .chat import urls as chat_urls
+from .realtime import urls as realtime_urls
 from .webhooks import urls as webhook_urls
 # from .auth import urls as auth_urls
 # from .user import urls as user_urls
@@ -38,6 +40,8 @@ urlpatterns = (
         ),
         # webhook
         path("webhooks/", include(webhook_urls, namespace="webhooks")),
+        path("chat/", include(chat_urls, namespace="chat")),
+        path("realtime/", include(realtime_urls, namespace="realtime")),
         # path("auth/", include(auth_urls, namespace="auth")),
         # path("user/", include(user_urls, namespace="user")),
 
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import re_path
 
 from api.user.views import (
@@ -6,11 +7,23 @@ from api.user.views import (
     ForgotPasswordView,
     ListUserApiView,
     DetailUserApiView,
-    SearchUserChatApiView
+    SearchUserChatApiView,
+    AsyncUserView,
+    AsyncListUserApiView,
+    AsyncDetailUserApiView,
 )
 
 app_name = "api.user"
 
+if settings.ASYNC_USER_READ_VIEWS:
+    user_view = AsyncUserView
+    list_user_view = AsyncListUserApiView
+    detail_user_view = AsyncDetailUserApiView
+else:
+    user_view = UserView
+    list_user_view = ListUserApiView
+    detail_user_view = DetailUserApiView
+
 urlpatterns = [
     # re_path(r"^token-auth/$", ObtainJSONWebToken.as_view(), name="token_auth"),
     # re_path(r"^token-refresh/$", RefreshJSONWebToken.as_view(), name="token_refresh"),
@@ -24,9 +37,9 @@ urlpatterns = [
     re_path(
         r"^change-password/$", ChangePasswordView.as_view(), name="change_password"
     ),
-    re_path(r"^$", UserView.as_view(), name="index"),
+    re_path(r"^$", user_view.as_view(), name="index"),
     # sample
     re_path(r"^search-user-chat$", SearchUserChatApiView.as_view(), name="search_user_chat"),
-    re_path(r"^list$", ListUserApiView.as_view(), name="index"),
-    re_path(r"^detail/(?P<user_id>[0-9]+)$", DetailUserApiView.as_view(), name="index"),
+    re_path(r"^list$", list_user_view.as_view(), name="index"),
+    re_path(r"^detail/(?P<user_id>[0-9]+)$", detail_user_view.as_view(), name="index"),
 ]
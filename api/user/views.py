@@ -44,7 +44,8 @@ from core.exceptions import (
 from core.jwt import user_data_registry
 from core.models import UserPin, User, UserType
 from core.users.handler import UserHandler, OptimizeUserHandler
-from utils.base_views import PaginationApiView
+from utils.base_views import AsyncApiViewMixin, PaginationApiView
+from ws.presence import is_online
 
 jwt_payload_handler = api_settings.JWT_PAYLOAD_HANDLER
 jwt_encode_handler = api_settings.JWT_ENCODE_HANDLER
@@ -66,10 +67,14 @@ class SearchUserChatApiView(PaginationApiView):
         serializer = GetUserChatSerializer(paginated_data, many=True)
         payload = []
         if len(serializer.data):
+            online = is_online(item['info']['user_id'] for item in serializer.data)
             for item in serializer.data:
                 payload.append({
-                    **item['info']
+                    **item['info'],
+                    'is_online': online[item['info']['user_id']],
                 })
+            # The online users of the page are listed first.
+            payload.sort(key=lambda item: not item['is_online'])
         response = {
             'payload': payload,
             'page_info': page_info
@@ -109,6 +114,10 @@ class ListUserApiView(PaginationApiView):
         return Response(response, status=200)
 
 
+class AsyncListUserApiView(AsyncApiViewMixin, ListUserApiView):
+    """The `ListUserApiView` with the reads running in the database executor."""
+
+
 class DetailUserApiView(APIView):
     permission_classes = (IsAuthenticated,)
 
@@ -158,6 +167,10 @@ class DetailUserApiView(APIView):
             )
 
 
+class AsyncDetailUserApiView(AsyncApiViewMixin, DetailUserApiView):
+    """The `DetailUserApiView` with the reads running in the database executor."""
+
+
 class UserView(APIView):
     permission_classes = (IsAuthenticated,)
 
@@ -199,7 +212,7 @@ class UserView(APIView):
             DisabledSignupError: ERROR_DISABLED_SIGNUP,
         }
     )
-    @validate_body(RegisterSerializer)
+    @validate_body(RegisterSerializer, compiled=True)
     def post(self, request, data):
         """Registers a new user."""
 
@@ -229,6 +242,10 @@ class UserView(APIView):
         return Response(response, status=200)
 
 
+class AsyncUserView(AsyncApiViewMixin, UserView):
+    """The `UserView` with the reads running in the database executor."""
+
+
 class ChangePasswordView(APIView):
     permission_classes = (IsAuthenticated,)
 
@@ -256,7 +273,7 @@ class ChangePasswordView(APIView):
             InvalidPassword: ERROR_INVALID_OLD_PASSWORD,
         }
     )
-    @validate_body(ChangePasswordBodyValidationSerializer)
+    @validate_body(ChangePasswordBodyValidationSerializer, compiled=True)
     def post(self, request, data):
         """Changes the authenticated user's password if the old password is correct."""
 
@@ -333,7 +350,7 @@ class ResetPasswordView(APIView):
             UserNotFound: ERROR_USER_NOT_FOUND,
         }
     )
-    @validate_body(ResetPasswordBodyValidationSerializer)
+    @validate_body(ResetPasswordBodyValidationSerializer, compiled=True)
     def post(self, request, data):
         """Changes users password if the provided token is valid."""
 
@@ -367,7 +384,7 @@ class SendResetPasswordEmailView(APIView):
         auth=[None],
     )
     @transaction.atomic
-    @validate_body(SendResetPasswordEmailBodyValidationSerializer)
+    @validate_body(SendResetPasswordEmailBodyValidationSerializer, compiled=True)
     @map_exceptions({BaseURLHostnameNotAllowed: ERROR_HOSTNAME_IS_NOT_ALLOWED})
     def post(self, request, data):
         """
@@ -1,6 +1,8 @@
 from __future__ import absolute_import
 import os
 from celery import Celery
+from celery.exceptions import WorkerShutdown
+from celery.signals import celeryd_init
 from django.conf import settings
 
 # set the default Django settings module for the 'celery' program.
@@ -12,3 +14,46 @@ app = Celery('django_template')
 # pickle the object when using Windows.
 app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks(lambda: settings.INSTALLED_APPS)
+
+
+def get_worker_profile(name):
+    """
+    :param name: The name of the profile, selected with the `CELERY_WORKER_PROFILE`
+        environment variable.
+    :type name: str or None
+    :return: The profile or None if no existing profile is selected.
+    :rtype: dict or None
+    """
+
+    if not name:
+        return None
+
+    return settings.CELERY_WORKER_PROFILES.get(name)
+
+
+worker_profile_name = os.getenv("CELERY_WORKER_PROFILE")
+worker_profile = get_worker_profile(worker_profile_name)
+
+if worker_profile:
+    # The command line options of the worker default to these values, so they must
+    # be set before the options are parsed.
+    app.conf.update(
+        worker_concurrency=worker_profile["concurrency"],
+        worker_prefetch_multiplier=worker_profile["prefetch_multiplier"],
+        task_acks_late=worker_profile.get("acks_late", False),
+    )
+
+
+@celeryd_init.connect
+def select_worker_profile_queues(instance=None, options=None, **kwargs):
+    # Only a worker fails on an unknown profile, other processes importing the app
+    # don't use it. Exceptions of signal handlers are only logged, so the worker is
+    # shut down explicitly.
+    if worker_profile_name and not worker_profile:
+        raise WorkerShutdown(
+            f"The Celery worker profile {worker_profile_name} does not exist."
+        )
+
+    # Queues passed with -Q take precedence over the ones of the profile.
+    if worker_profile and not (options or {}).get("queues"):
+        instance.app.amqp.queues.select(worker_profile["queues"])
@@ -3,6 +3,34 @@ from pathlib import Path
 import os
 from urllib.parse import urljoin
 
+from kombu import Queue
+
+
+def env_bool(name, default=False):
+    """
+    Reads a boolean from the environment. "1", "true", "yes" and "on" are true, "0",
+    "false", "no", "off" and an empty value are false, case insensitive.
+
+    :param name: The name of the environment variable.
+    :type name: str
+    :param default: The value when the environment variable is not set.
+    :type default: bool
+    :raises ValueError: When the value is not one of the above.
+    :rtype: bool
+    """
+
+    value = os.getenv(name)
+    if value is None:
+        return default
+
+    value = value.strip().lower()
+    if value in ("1", "true", "yes", "on"):
+        return True
+    if value in ("", "0", "false", "no", "off"):
+        return False
+    raise ValueError(f"{name} must be a boolean, got {value!r}.")
+
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -99,7 +127,65 @@ REDIS_URL = os.getenv(
 CELERY_BROKER_URL = REDIS_URL
 CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_TRANSPORT = REDIS_URL
+# Tasks are routed to dedicated queues, so that a burst of bulk mails can't delay
+# the real time events or the authentication mails like PINs. Tasks that are not
+# routed go to the default "celery" queue. A worker started without a profile or
+# -Q consumes all the queues.
+CELERY_TASK_DEFAULT_QUEUE = "celery"
+CELERY_TASK_QUEUES = [
+    Queue(name)
+    for name in ("realtime", "auth-mail", "celery", "bulk-mail", "maintenance")
+]
 CELERY_TASK_ROUTES = {
+    "ws.tasks.*": {"queue": "realtime", "priority": 0},
+    "custom_service.task.send_email_from_celery": {"queue": "auth-mail", "priority": 0},
+    "djcelery_email_send_multiple": {"queue": "bulk-mail", "priority": 6},
+    "core.tasks.send_bulk_mail": {"queue": "bulk-mail", "priority": 6},
+    "celery.backend_cleanup": {"queue": "maintenance", "priority": 9},
+}
+# Redis emulates the message priorities with a list per priority step, where 0 is the
+# highest priority. A worker that consumes multiple queues empties them in the order
+# they are listed in its profile.
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    "priority_steps": list(range(10)),
+    "sep": ":",
+    "queue_order_strategy": "priority",
+}
+CELERY_TASK_DEFAULT_PRIORITY = 3
+# The profiles a worker can be started with by setting the CELERY_WORKER_PROFILE
+# environment variable, for example `CELERY_WORKER_PROFILE=realtime celery -A config
+# worker`. Real time tasks are short, so they are prefetched, while long running
+# mail tasks are fetched one at a time and only acknowledged when done so that they
+# are not hoarded by a busy process. Command line options take precedence.
+CELERY_WORKER_PROFILES = {
+    "realtime": {
+        "queues": ["realtime"],
+        "concurrency": 4,
+        "prefetch_multiplier": 4,
+    },
+    "auth-mail": {
+        "queues": ["auth-mail"],
+        "concurrency": 2,
+        "prefetch_multiplier": 1,
+    },
+    "bulk-mail": {
+        "queues": ["bulk-mail"],
+        "concurrency": 2,
+        "prefetch_multiplier": 1,
+        "acks_late": True,
+    },
+    "maintenance": {
+        "queues": ["maintenance", "celery"],
+        "concurrency": 1,
+        "prefetch_multiplier": 1,
+        "acks_late": True,
+    },
+    # A single worker for development that consumes everything, most urgent first.
+    "all": {
+        "queues": ["realtime", "auth-mail", "celery", "bulk-mail", "maintenance"],
+        "concurrency": 4,
+        "prefetch_multiplier": 1,
+    },
 }
 CELERY_SOFT_TIME_LIMIT = 60 * 5
 CELERY_TIME_LIMIT = CELERY_SOFT_TIME_LIMIT + 60
@@ -127,14 +213,56 @@ CELERY_REDBEAT_LOCK_TIMEOUT = os.getenv(
     "CELERY_REDBEAT_LOCK_TIMEOUT", int(CELERY_BEAT_MAX_LOOP_INTERVAL) + 60
 )
 
+# The groups and channels are spread over all these comma separated Redis URLs with a
+# consistent hash ring. Several databases of one local Redis, for example
+# "redis://localhost:6379/1,redis://localhost:6379/2", can stand in for the shards.
+CHANNEL_REDIS_URLS = [
+    url.strip()
+    for url in os.getenv("CHANNEL_REDIS_URLS", REDIS_URL).split(",")
+    if url.strip()
+]
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "BACKEND": "ws.layers.ShardedRedisChannelLayer",
         "CONFIG": {
-            "hosts": [REDIS_URL],
+            "hosts": CHANNEL_REDIS_URLS,
+            # Group messages for consumers of the same process that are waiting for
+            # a message skip Redis.
+            "local_fast_path": env_bool("CHANNEL_LOCAL_FAST_PATH"),
         },
     },
 }
+# Real time events are written to the channel layer directly from the process that
+# triggered them. Celery is only used when the channel layer is unavailable.
+WS_DIRECT_PUBLISH = env_bool("WS_DIRECT_PUBLISH", True)
+# Events for the same channel group are collected for this many milliseconds and then
+# sent as one message. Set to 0 to send the events right after the commit.
+WS_COALESCE_WINDOW_MS = int(os.getenv("WS_COALESCE_WINDOW_MS", 25))
+# The number of encoded broadcast frames that are kept per process, so that every
+# connection in the process can send the same frame without encoding it again.
+WS_FRAME_CACHE_SIZE = int(os.getenv("WS_FRAME_CACHE_SIZE", 1024))
+# Events broadcasted via Celery with the `delay_broadcast_*` functions are collected
+# for this many milliseconds, or until this many are pending, and then sent as one
+# task.
+WS_TASK_BATCH_WINDOW_MS = int(os.getenv("WS_TASK_BATCH_WINDOW_MS", 50))
+WS_TASK_BATCH_SIZE = int(os.getenv("WS_TASK_BATCH_SIZE", 500))
+# The Celery tasks send to the channel layer via one long lived event loop per
+# worker process, which keeps the channel layer connections open between tasks.
+WS_ASYNC_RUNTIME = env_bool("WS_ASYNC_RUNTIME", True)
+# The number of seconds a task waits for a coroutine submitted to that event loop
+# before it's cancelled. It's kept below CELERY_SOFT_TIME_LIMIT so that a hanging
+# send fails the task before Celery has to interrupt it.
+WS_ASYNC_RUNTIME_TIMEOUT = min(
+    float(os.getenv("WS_ASYNC_RUNTIME_TIMEOUT", 60)), CELERY_SOFT_TIME_LIMIT / 2
+)
+
+# Serves the user read endpoints via their async counterparts. Their ORM work runs in
+# a dedicated thread pool of ASYNC_DB_POOL_SIZE threads. When
+# ASYNC_DB_POOL_MAX_PENDING calls are already running or waiting, new requests are
+# answered with a 503 right away.
+ASYNC_USER_READ_VIEWS = env_bool("ASYNC_USER_READ_VIEWS")
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", 8))
+ASYNC_DB_POOL_MAX_PENDING = int(os.getenv("ASYNC_DB_POOL_MAX_PENDING", 64))
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
@@ -313,7 +441,7 @@ if os.getenv("EMAIL_SMTP", "SMTP"):
     EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'  # "django_smtp_ssl.SSLEmailBackend"  # 'django.core.mail.backends.smtp.EmailBackend'
     # EMAIL_SMTP_USE_TLS for backwards compatibility after
     # fixing #448.
-    EMAIL_USE_TLS = True
+    EMAIL_USE_TLS = env_bool("EMAIL_SMTP_USE_TLS", True)
     EMAIL_HOST = os.getenv("EMAIL_SMTP_HOST", "")
     EMAIL_PORT = os.getenv("EMAIL_SMTP_PORT", "")
     EMAIL_HOST_USER = os.getenv("EMAIL_SMTP_USER", '')
@@ -327,6 +455,28 @@ CELERY_EMAIL_TASK_CONFIG = {
     'ignore_result': False,
 }
 CELERY_EMAIL_CHUNK_SIZE = 1
+# Bulk mails are sent by the `send_bulk_mail` task in chunks of this many messages,
+# every chunk over a single SMTP connection. Messages that fail with a transient
+# error are retried with an exponential backoff starting at BULK_MAIL_RETRY_DELAY
+# seconds. A local stand-in like `python -m aiosmtpd -n -l localhost:1025` can be
+# used by setting EMAIL_SMTP_HOST, EMAIL_SMTP_PORT and EMAIL_SMTP_USE_TLS=false.
+BULK_MAIL_BACKEND = os.getenv("BULK_MAIL_BACKEND", CELERY_EMAIL_BACKEND)
+BULK_MAIL_CHUNK_SIZE = int(os.getenv("BULK_MAIL_CHUNK_SIZE", 100))
+BULK_MAIL_MAX_RETRIES = int(os.getenv("BULK_MAIL_MAX_RETRIES", 3))
+BULK_MAIL_RETRY_DELAY = float(os.getenv("BULK_MAIL_RETRY_DELAY", 1))
+# Email templates are compiled once per process, after which only their variables
+# and loops are rendered and the plain text alternative is filled in instead of
+# stripping the tags of every message. Set to false to compile them every time.
+EMAIL_TEMPLATE_CACHE = env_bool("EMAIL_TEMPLATE_CACHE", True)
+# The `send_grade_reports` command processes GRADE_REPORT_BATCH_SIZE students per
+# batch and renders their reports in GRADE_REPORT_WORKERS processes, one renders
+# them in the process itself. The progress of a job, which is also the checkpoint
+# it's resumed from, expires after GRADE_REPORT_CHECKPOINT_TTL seconds.
+GRADE_REPORT_BATCH_SIZE = int(os.getenv("GRADE_REPORT_BATCH_SIZE", 1000))
+GRADE_REPORT_WORKERS = int(os.getenv("GRADE_REPORT_WORKERS", os.cpu_count() or 1))
+GRADE_REPORT_CHECKPOINT_TTL = int(
+    os.getenv("GRADE_REPORT_CHECKPOINT_TTL", 7 * 24 * 60 * 60)
+)
 
 # Configurable thumbnails that are going to be generated when a user uploads an image
 # file.
@@ -355,3 +505,43 @@ MAX_FIELD_LIMIT = 1500
 DEFAULT_PAGINATION_PAGE_SIZE = 100
 
 CHANNEL_CHAT_REDIS = os.getenv("CHANNEL_CHAT_REDIS", "private-chat-app")
+# The maximum number of frames that can wait to be sent to a web socket connection.
+# Realtime updates are dropped oldest first when the queue is full, chat connections
+# are closed instead. A connection is closed when a frame hasn't been written within
+# the slow consumer timeout in seconds, even if nothing else is sent to it.
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", 256))
+WS_SLOW_CONSUMER_TIMEOUT = float(os.getenv("WS_SLOW_CONSUMER_TIMEOUT", 10))
+WS_CHAT_OUTBOUND_QUEUE_SIZE = int(os.getenv("WS_CHAT_OUTBOUND_QUEUE_SIZE", 256))
+# The users of the web socket handshakes are cached per process for this many
+# seconds. With batch loading all the handshakes in the same event loop iteration
+# select their users with a single query. Changed users are only invalidated in the
+# process that changed them, the other processes use them until they expire.
+WS_AUTH_USER_CACHE_TTL = int(os.getenv("WS_AUTH_USER_CACHE_TTL", 30))
+WS_AUTH_USER_CACHE_SIZE = int(os.getenv("WS_AUTH_USER_CACHE_SIZE", 10000))
+WS_AUTH_BATCH_LOADING = env_bool("WS_AUTH_BATCH_LOADING", True)
+# Where the live connections of the users are stored, either "redis" or "local" for
+# single process deployments. Every process refreshes its connections once per
+# heartbeat interval in seconds, they expire after three missed heartbeats.
+WS_PRESENCE_BACKEND = os.getenv("WS_PRESENCE_BACKEND", "redis")
+WS_PRESENCE_HEARTBEAT_INTERVAL = int(os.getenv("WS_PRESENCE_HEARTBEAT_INTERVAL", 25))
+# How long in seconds and for how many (user, page) combinations the page permission
+# checks are cached per process. Invalidations are published via Redis pub/sub once
+# the transaction that changed the permissions commits, the TTL only bounds the
+# staleness while Redis is unreachable.
+WS_PAGE_PERMISSION_CACHE_TTL = int(os.getenv("WS_PAGE_PERMISSION_CACHE_TTL", 60))
+WS_PAGE_PERMISSION_CACHE_SIZE = int(os.getenv("WS_PAGE_PERMISSION_CACHE_SIZE", 10000))
+# The members of the groups that are broadcasted to are kept in an index that is
+# updated when group users change. "redis" shares it between processes, "local" is
+# only meant for a single process. Sets that haven't been read for
+# WS_GROUP_MEMBERS_TTL seconds expire and are then loaded from the database again.
+# Without a group user model in the database the sets never expire.
+WS_GROUP_MEMBERS_BACKEND = os.getenv("WS_GROUP_MEMBERS_BACKEND", "redis")
+WS_GROUP_MEMBERS_TTL = int(os.getenv("WS_GROUP_MEMBERS_TTL", 60 * 60))
+# Chat messages are inserted in bulk every interval, or as soon as the batch size is
+# reached.
+CHAT_WRITE_BUFFER_INTERVAL_MS = int(os.getenv("CHAT_WRITE_BUFFER_INTERVAL_MS", 20))
+CHAT_WRITE_BUFFER_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BUFFER_BATCH_SIZE", 500))
+# The number of recent messages per conversation that are kept in Redis and how long
+# in seconds they are kept after the last message.
+CHAT_RECENT_MESSAGES_SIZE = int(os.getenv("CHAT_RECENT_MESSAGES_SIZE", 50))
+CHAT_RECENT_MESSAGES_TTL = int(os.getenv("CHAT_RECENT_MESSAGES_TTL", 60 * 60 * 24))
@@ -0,0 +1,193 @@
+import json
+
+from channels.layers import channel_layers
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+BENCHMARK_USERNAME_PREFIX = "benchmark-"
+
+
+def percentile(values, percent):
+    """
+    :param values: The measured values.
+    :type values: list
+    :param percent: The percentile between 0 and 100.
+    :type percent: int
+    :return: The value below which `percent` of the values fall or None if there
+        are no values.
+    :rtype: float or None
+    """
+
+    if not values:
+        return None
+
+    values = sorted(values)
+    index = min(len(values) - 1, round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def summarize(seconds):
+    """
+    Summarizes durations in seconds as milliseconds.
+
+    :param seconds: The measured durations.
+    :type seconds: list
+    :rtype: dict
+    """
+
+    milliseconds = [value * 1000 for value in seconds]
+    return {
+        "count": len(milliseconds),
+        "p50_ms": percentile(milliseconds, 50),
+        "p99_ms": percentile(milliseconds, 99),
+        "max_ms": max(milliseconds) if milliseconds else None,
+    }
+
+
+def use_local_backends(fake_redis=False):
+    """
+    Replaces the channel layer with an in memory layer, so that the results only
+    depend on the measured code, and optionally Redis with fakeredis.
+
+    :param fake_redis: Whether `utils.redis` must return a fakeredis connection.
+    :type fake_redis: bool
+    """
+
+    settings.CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+            "CONFIG": {"capacity": 100000},
+        }
+    }
+    channel_layers.backends = {}
+
+    from ws.presence import LocalPresenceStore, presence_tracker
+
+    # The presence is not measured, so it's kept in memory.
+    presence_tracker.store = LocalPresenceStore()
+
+    if fake_redis:
+        try:
+            import fakeredis
+        except ImportError:
+            raise CommandError("fakeredis must be installed for --fake-redis.")
+
+        import utils.redis
+
+        utils.redis._connection = fakeredis.FakeRedis()
+
+
+def create_users(count):
+    """
+    Creates `count` temporary users without a usable password. Users left behind by
+    an earlier run are deleted first.
+
+    :param count: The number of users.
+    :type count: int
+    :return: The created users.
+    :rtype: list
+    """
+
+    User = get_user_model()
+    delete_users()
+
+    users = []
+    for index in range(count):
+        user = User(
+            username=f"{BENCHMARK_USERNAME_PREFIX}{index}",
+            email=f"{BENCHMARK_USERNAME_PREFIX}{index}@example.com",
+        )
+        user.set_unusable_password()
+        users.append(user)
+
+    User.objects.bulk_create(users)
+    return list(
+        User.objects.filter(username__startswith=BENCHMARK_USERNAME_PREFIX)
+    )
+
+
+def delete_users():
+    """Deletes the temporary users created by `create_users`."""
+
+    from core.chat.buffers import write_buffer
+
+    # Messages that are still buffered would otherwise be inserted for users that no
+    # longer exist.
+    write_buffer.flush()
+
+    get_user_model().objects.filter(
+        username__startswith=BENCHMARK_USERNAME_PREFIX
+    ).delete()
+
+
+class BenchmarkCommand(BaseCommand):
+    """
+    A management command that measures something and writes the results as JSON,
+    so that runs can be compared. Subclasses set `report_name`, add their options in
+    `add_benchmark_arguments` and pass their results to `write_report`.
+    """
+
+    report_name = None
+
+    def add_arguments(self, parser):
+        self.add_benchmark_arguments(parser)
+        parser.add_argument(
+            "--output",
+            help="The JSON file the results are written to, defaults to "
+                 f"{self.report_name}-<timestamp>.json.",
+        )
+        parser.add_argument(
+            "--compare",
+            help="A JSON file of a previous run the results are compared with.",
+        )
+
+    def add_benchmark_arguments(self, parser):
+        pass
+
+    def write_report(self, options, started_at, results, **details):
+        """
+        Writes the results with the details of the run to the output file, prints
+        them and compares them with a previous run if requested.
+
+        :param options: The options of the command.
+        :type options: dict
+        :param started_at: When the run was started, also used for the file name.
+        :type started_at: datetime
+        :param results: The measured results.
+        :type results: dict
+        :param details: The parameters of the run that are written with the results.
+        """
+
+        report = {"started_at": started_at.isoformat(), **details, "results": results}
+        output = options["output"] or (
+            f"{self.report_name}-{started_at.strftime('%Y%m%d%H%M%S')}.json"
+        )
+        with open(output, "w") as file:
+            json.dump(report, file, indent=2)
+
+        self.stdout.write(json.dumps(results, indent=2))
+        self.stdout.write(self.style.SUCCESS(f"The results are written to {output}."))
+
+        if options["compare"]:
+            self.compare(options["compare"], results)
+
+    def compare(self, path, results):
+        """Prints the relative change of every numeric result of a previous run."""
+
+        with open(path) as file:
+            previous = json.load(file)["results"]
+
+        def walk(current, before, prefix):
+            for key, value in current.items():
+                name = f"{prefix}{key}"
+                old = before.get(key) if isinstance(before, dict) else None
+                if isinstance(value, dict):
+                    walk(value, old, f"{name}.")
+                elif isinstance(value, (int, float)) and isinstance(old, (int, float)):
+                    change = (value - old) / old * 100 if old else 0
+                    self.stdout.write(
+                        f"{name}: {old:.2f} -> {value:.2f} ({change:+.1f}%)"
+                    )
+
+        walk(results, previous, "")
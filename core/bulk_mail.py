@@ -0,0 +1,191 @@
+import logging
+import smtplib
+import time
+
+import djcelery_email.conf  # noqa: F401 loads the defaults of the settings.
+from celery.exceptions import SoftTimeLimitExceeded
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from djcelery_email.utils import email_to_dict
+
+logger = logging.getLogger(__name__)
+
+SENT = "sent"
+FAILED = "failed"
+
+
+def is_transient_error(error):
+    """
+    Checks whether sending a message might succeed when it's retried, like when the
+    connection has dropped or the server replied with a 4xx code.
+
+    :param error: The error raised while sending.
+    :type error: Exception
+    :rtype: bool
+    """
+
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+
+    if isinstance(error, smtplib.SMTPException):
+        return False
+
+    # Socket errors and timeouts.
+    return isinstance(error, OSError)
+
+
+class BulkMailSender:
+    """
+    Sends many messages over a single connection of the mail backend, instead of
+    authenticating a new SMTP session for every message. Messages that fail with a
+    transient error are retried on a new connection with an exponential backoff,
+    the other messages are not affected by a failing one. When the soft time limit
+    of the task is exceeded, `processed` tells how many messages have been handled.
+    """
+
+    def __init__(self, backend=None, max_retries=None, retry_delay=None):
+        self.backend = backend or settings.BULK_MAIL_BACKEND
+        self.max_retries = (
+            settings.BULK_MAIL_MAX_RETRIES if max_retries is None else max_retries
+        )
+        self.retry_delay = (
+            settings.BULK_MAIL_RETRY_DELAY if retry_delay is None else retry_delay
+        )
+        self.processed = 0
+
+    def send(self, messages):
+        """
+        :param messages: The email messages.
+        :type messages: list
+        :return: The result of every recipient, a dict containing the `recipient`,
+            the `status`, the number of `attempts` and the `error` if it failed.
+        :rtype: list
+        """
+
+        connection = get_connection(backend=self.backend, fail_silently=False)
+        results = []
+        self.processed = 0
+
+        try:
+            for message in messages:
+                results.extend(self.send_message(connection, message))
+                self.processed += 1
+        finally:
+            self.close(connection)
+
+        return results
+
+    def send_message(self, connection, message):
+        attempt = 0
+
+        while True:
+            attempt += 1
+            try:
+                # Opening an already open connection doesn't do anything, the
+                # backend keeps it open between the messages.
+                connection.open()
+                connection.send_messages([message])
+            except SoftTimeLimitExceeded:
+                raise
+            except Exception as e:
+                if attempt > self.max_retries or not is_transient_error(e):
+                    logger.warning(
+                        "Failed to send email message to %r. (%r)", message.to, e
+                    )
+                    return self.get_results(message, FAILED, attempt, e)
+
+                # The connection might be broken, so the retry uses a new one.
+                self.close(connection)
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+            else:
+                return self.get_results(message, SENT, attempt)
+
+    def get_results(self, message, status, attempts, error=None):
+        return [
+            {
+                "recipient": recipient,
+                "status": status,
+                "attempts": attempts,
+                "error": repr(error) if error else None,
+            }
+            for recipient in message.recipients()
+        ]
+
+    def close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+class BulkMailQueue:
+    """
+    Groups outgoing messages into chunks of `BULK_MAIL_CHUNK_SIZE` messages and
+    hands every chunk to the `send_bulk_mail` task after the current transaction
+    commits. Messages can be added while they are generated, a chunk is queued as
+    soon as it's full.
+
+    Example:
+        with BulkMailQueue() as queue:
+            for email in emails:
+                queue.add(email)
+    """
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or settings.BULK_MAIL_CHUNK_SIZE
+        self.chunk = []
+        self.queued_chunks = 0
+
+    def add(self, message):
+        """
+        :param message: The email message.
+        :type message: EmailMessage
+        """
+
+        self.chunk.append(email_to_dict(message))
+
+        if len(self.chunk) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Queues the messages that are not in a full chunk yet."""
+
+        if not self.chunk:
+            return
+
+        from core.tasks import send_bulk_mail
+
+        chunk, self.chunk = self.chunk, []
+        self.queued_chunks += 1
+        transaction.on_commit(lambda: send_bulk_mail.delay(chunk))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+
+def send_bulk_mail(messages):
+    """
+    Sends the messages in chunks via the bulk mail queue.
+
+    :param messages: The email messages.
+    :type messages: iterable
+    :return: The number of queued chunks.
+    :rtype: int
+    """
+
+    with BulkMailQueue() as queue:
+        for message in messages:
+            queue.add(message)
+
+    return queue.queued_chunks
@@ -0,0 +1,284 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+from django.db import DatabaseError, connection
+
+from core.models import ChatMessage
+from utils.redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+
+class ChatMessageWriteBuffer:
+    """
+    Collects the chat messages of this process and inserts them with one bulk insert
+    per flush instead of one insert per message. The messages are flushed `interval`
+    milliseconds after the first pending message was added, or right away once
+    `batch_size` messages are pending. Adding a message never touches the database,
+    so it can be called from the event loop.
+
+    The inserts are done by one long lived flusher thread per process that waits on
+    a condition until messages are due, so its database connection is reused by all
+    the flushes. The thread is started on the first add and again in a forked child
+    process.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._pending = []
+        self._deadline = None
+        self._inserting = False
+        self._thread = None
+        self._pid = None
+
+    def add(self, message, interval, batch_size):
+        """
+        Adds a message that must be inserted with the next flush.
+
+        :param message: The unsaved message.
+        :type message: ChatMessage
+        :param interval: The number of milliseconds after which the pending messages
+            are inserted.
+        :type interval: int
+        :param batch_size: The number of pending messages that triggers a flush.
+        :type batch_size: int
+        """
+
+        with self._condition:
+            self._ensure_flusher()
+            self._pending.append(message)
+
+            if len(self._pending) >= batch_size:
+                self._deadline = 0
+            elif self._deadline is None:
+                self._deadline = time.monotonic() + interval / 1000
+            else:
+                return
+
+            self._condition.notify_all()
+
+    def flush(self):
+        """
+        Inserts all the pending messages in the calling thread. Waits for an insert of
+        the flusher thread that is in progress, so that all the messages added before
+        are in the database when it returns.
+        """
+
+        with self._condition:
+            if self._pid != os.getpid():
+                # Nothing was added in this process.
+                return
+
+            self._condition.wait_for(lambda: not self._inserting)
+            pending = self._take_pending()
+
+        if pending:
+            self.insert(pending)
+
+    def _ensure_flusher(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+
+        # The thread of a parent process doesn't exist in a forked child and the
+        # messages it copied are inserted by the parent.
+        self._pending = []
+        self._deadline = None
+        self._inserting = False
+        self._pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._run, name="chat-write-buffer", daemon=True
+        )
+        self._thread.start()
+
+    def _take_pending(self):
+        pending, self._pending = self._pending, []
+        self._deadline = None
+        return pending
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._deadline is None or self._deadline > time.monotonic():
+                    self._condition.wait(
+                        None
+                        if self._deadline is None
+                        else self._deadline - time.monotonic()
+                    )
+                pending = self._take_pending()
+                self._inserting = True
+
+            try:
+                self.insert(pending)
+            except Exception:
+                logger.exception("Could not insert %s chat messages.", len(pending))
+            finally:
+                with self._condition:
+                    self._inserting = False
+                    self._condition.notify_all()
+
+    def insert(self, messages):
+        """
+        Inserts the messages with one bulk insert.
+
+        :param messages: The unsaved messages.
+        :type messages: list
+        """
+
+        try:
+            ChatMessage.objects.bulk_create(messages)
+        except DatabaseError:
+            # A single invalid message, for example one to a user that has just been
+            # deleted, fails the whole batch. The messages are inserted one by one so
+            # that only the invalid ones are lost. The connection is closed in case
+            # it's broken, the next query opens a new one.
+            logger.exception(
+                "Could not insert %s chat messages in bulk.", len(messages)
+            )
+            connection.close()
+            self.insert_one_by_one(messages)
+
+    def insert_one_by_one(self, messages):
+        for message in messages:
+            try:
+                message.save(force_insert=True)
+            except DatabaseError:
+                logger.exception(
+                    "Could not insert chat message %s.", message.message_id
+                )
+
+
+class RecentMessageStore:
+    """
+    Keeps the last `size` messages of every conversation in a Redis list, so that
+    reconnecting clients get the recent history without a database query. Messages
+    are appended when they are sent, before they are inserted in the database.
+
+    A list is only considered complete when its `loaded` key exists. If it doesn't,
+    then the list only contains the messages sent since it expired, so the recent
+    messages are loaded from the database once and merged with the list.
+
+    The sender, receiver and creation time of every appended message are also kept
+    in a key per message, so that a single message can be looked up without reading
+    the list.
+    """
+
+    key_prefix = "chat:recent"
+    message_key_prefix = "chat:message"
+
+    def get_keys(self, conversation_id):
+        key = f"{self.key_prefix}:{conversation_id}"
+        return key, f"{key}:loaded"
+
+    def get_message_key(self, message_id):
+        return f"{self.message_key_prefix}:{message_id}"
+
+    def append(self, message, size, ttl):
+        """
+        Appends a message to the list of its conversation.
+
+        :param message: The serialized message.
+        :type message: dict
+        :param size: The maximum number of messages in the list.
+        :type size: int
+        :param ttl: The number of seconds after which an unused list expires.
+        :type ttl: int
+        """
+
+        key, loaded_key = self.get_keys(message["conversation_id"])
+
+        with get_redis_connection().pipeline() as pipe:
+            pipe.rpush(key, json.dumps(message))
+            pipe.ltrim(key, -size, -1)
+            pipe.expire(key, ttl)
+            pipe.expire(loaded_key, ttl)
+            pipe.set(
+                self.get_message_key(message["message_id"]),
+                json.dumps(
+                    {
+                        "sender_id": message["sender_id"],
+                        "receiver_id": message["receiver_id"],
+                        "created_at": message["created_at"],
+                    }
+                ),
+                ex=ttl,
+            )
+            pipe.execute()
+
+    def get_message(self, message_id):
+        """
+        Returns the sender, receiver and creation time of a message that has been
+        appended in the last `ttl` seconds.
+
+        :param message_id: The id of the message.
+        :type message_id: str
+        :return: The sender id, receiver id and created at or None if the message is
+            not known.
+        :rtype: dict or None
+        """
+
+        message = get_redis_connection().get(self.get_message_key(message_id))
+        return json.loads(message) if message is not None else None
+
+    def get(self, conversation_id, load_messages, size, ttl):
+        """
+        Returns the recent messages of a conversation, oldest first.
+
+        :param conversation_id: The id of the conversation.
+        :type conversation_id: str
+        :param load_messages: Called without arguments if the list is not complete.
+            Must return the last `size` serialized messages from the database.
+        :type load_messages: callable
+        :param size: The maximum number of messages in the list.
+        :type size: int
+        :param ttl: The number of seconds after which an unused list expires.
+        :type ttl: int
+        :return: The serialized messages.
+        :rtype: list
+        """
+
+        key, loaded_key = self.get_keys(conversation_id)
+        redis = get_redis_connection()
+
+        with redis.pipeline() as pipe:
+            pipe.exists(loaded_key)
+            pipe.lrange(key, 0, -1)
+            loaded, cached = pipe.execute()
+
+        if loaded:
+            return [json.loads(message) for message in cached]
+
+        stored = load_messages()
+
+        def merge(pipe):
+            # Messages that are appended while merging abort the transaction, which
+            # is then retried with the new list.
+            message_ids = {message["message_id"] for message in stored}
+            messages = stored + [
+                message
+                for message in map(json.loads, pipe.lrange(key, 0, -1))
+                if message["message_id"] not in message_ids
+            ]
+            messages.sort(
+                key=lambda message: (message["created_at"], message["message_id"])
+            )
+            messages = messages[-size:]
+
+            pipe.multi()
+            pipe.delete(key)
+            if messages:
+                pipe.rpush(key, *[json.dumps(message) for message in messages])
+            pipe.expire(key, ttl)
+            pipe.set(loaded_key, 1, ex=ttl)
+            return messages
+
+        return redis.transaction(merge, key, value_from_callable=True)
+
+
+write_buffer = ChatMessageWriteBuffer()
+atexit.register(write_buffer.flush)
+
+recent_messages = RecentMessageStore()
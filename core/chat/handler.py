@@ -0,0 +1,167 @@
+import logging
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from redis.exceptions import RedisError
+
+from core.chat.buffers import recent_messages, write_buffer
+from core.models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+
+class ChatHandler:
+    def store_message(self, message):
+        """
+        Stores a message that has just been sent. It is appended to the recent
+        messages of the conversation right away and inserted in the database with
+        the next flush of the write buffer.
+
+        :param message: The serialized message containing the message id,
+            conversation id, sender id, receiver id, message and created at.
+        :type message: dict
+        """
+
+        write_buffer.add(
+            ChatMessage(
+                message_id=message["message_id"],
+                conversation_id=message["conversation_id"],
+                sender_id=message["sender_id"],
+                receiver_id=message["receiver_id"],
+                message=message["message"],
+                created_at=datetime.fromisoformat(message["created_at"]),
+            ),
+            settings.CHAT_WRITE_BUFFER_INTERVAL_MS,
+            settings.CHAT_WRITE_BUFFER_BATCH_SIZE,
+        )
+
+        try:
+            recent_messages.append(
+                message,
+                settings.CHAT_RECENT_MESSAGES_SIZE,
+                settings.CHAT_RECENT_MESSAGES_TTL,
+            )
+        except RedisError:
+            logger.warning(
+                "Could not add message %s to the recent messages.",
+                message["message_id"],
+                exc_info=True,
+            )
+
+    def get_history(self, conversation_id, before_message_id=None, limit=50):
+        """
+        Returns a page of the messages of a conversation, newest first. The pages are
+        keyset paginated by (created_at, message_id), the order in which the recent
+        messages are cached as well, so every page is a single index range scan no
+        matter how far back it is.
+
+        :param conversation_id: The id of the conversation.
+        :type conversation_id: str
+        :param before_message_id: If provided, only the messages sent before the
+            message having this id are returned.
+        :type before_message_id: str or None
+        :param limit: The maximum number of messages.
+        :type limit: int
+        :return: The messages.
+        :rtype: list
+        """
+
+        queryset = ChatMessage.objects.filter(conversation_id=conversation_id)
+
+        if before_message_id is not None:
+            before_created_at = self.get_created_at(before_message_id)
+            if before_created_at is None:
+                return []
+            queryset = queryset.filter(
+                Q(created_at__lt=before_created_at)
+                | Q(created_at=before_created_at, message_id__lt=before_message_id)
+            )
+
+        return list(queryset.order_by("-created_at", "-message_id")[:limit])
+
+    def get_created_at(self, message_id):
+        """
+        Returns when a message was sent. Recent messages are looked up in Redis first,
+        because a message that has just been sent might not be inserted in the
+        database yet.
+
+        :param message_id: The id of the message.
+        :type message_id: str
+        :return: The creation time or None if the message doesn't exist.
+        :rtype: datetime or None
+        """
+
+        try:
+            message = recent_messages.get_message(message_id)
+        except RedisError:
+            logger.warning("Could not get message %s.", message_id, exc_info=True)
+            message = None
+
+        if message is not None:
+            return datetime.fromisoformat(message["created_at"])
+
+        return (
+            ChatMessage.objects.filter(message_id=message_id)
+            .values_list("created_at", flat=True)
+            .first()
+        )
+
+    def get_recent_messages(self, conversation_id):
+        """
+        Returns the recent messages of a conversation, oldest first. They are served
+        from Redis, the database is only queried if they are not cached yet.
+
+        :param conversation_id: The id of the conversation.
+        :type conversation_id: str
+        :return: The serialized messages.
+        :rtype: list
+        """
+
+        size = settings.CHAT_RECENT_MESSAGES_SIZE
+
+        def load_messages():
+            messages = self.get_history(conversation_id, limit=size)
+            return [message.to_dict() for message in reversed(messages)]
+
+        try:
+            return recent_messages.get(
+                conversation_id,
+                load_messages,
+                size,
+                settings.CHAT_RECENT_MESSAGES_TTL,
+            )
+        except RedisError:
+            logger.warning("Could not get the recent messages.", exc_info=True)
+            return load_messages()
+
+    def is_sent_message(self, message_id, sender_id, receiver_id):
+        """
+        Checks whether the message exists and was sent by the sender to the receiver.
+        Recent messages are looked up in Redis first, because a message that has just
+        been sent might not be inserted in the database yet.
+
+        :param message_id: The id of the message.
+        :type message_id: str
+        :param sender_id: The id of the user that must have sent the message.
+        :type sender_id: int
+        :param receiver_id: The id of the user that must have received the message.
+        :type receiver_id: int
+        :rtype: bool
+        """
+
+        try:
+            message = recent_messages.get_message(message_id)
+        except RedisError:
+            logger.warning("Could not get message %s.", message_id, exc_info=True)
+            message = None
+
+        if message is not None:
+            return (
+                message["sender_id"] == sender_id
+                and message["receiver_id"] == receiver_id
+            )
+
+        return ChatMessage.objects.filter(
+            message_id=message_id, sender_id=sender_id, receiver_id=receiver_id
+        ).exists()
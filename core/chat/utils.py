@@ -0,0 +1,14 @@
+def get_conversation_id(user_id, other_user_id):
+    """
+    Returns the id of the conversation between two users. It's the same no matter
+    which of the users is the sender.
+
+    :param user_id: The id of one of the users.
+    :type user_id: int
+    :param other_user_id: The id of the other user.
+    :type other_user_id: int
+    :return: The conversation id.
+    :rtype: str
+    """
+
+    return "-".join(str(i) for i in sorted((user_id, other_user_id)))
@@ -5,9 +5,11 @@ from .exceptions import (
     RequestBodyValidationException,
 )
 from .utils import (
-    map_exceptions_utility,
+    CompiledExceptionMapping,
+    raise_mapped_exception,
     get_request,
     validate_data,
+    validate_data_compiled,
     validate_data_custom_fields,
     ExceptionMappingType,
 )
@@ -71,10 +73,14 @@ def map_exceptions(exceptions: ExceptionMappingType):
       # SomeException will be thrown directly if the provided callable returns None.
     """
 
+    compiled_exceptions = CompiledExceptionMapping(exceptions)
+
     def map_exceptions_decorator(func):
         def func_wrapper(*args, **kwargs):
-            with map_exceptions_utility(exceptions):
+            try:
                 return func(*args, **kwargs)
+            except compiled_exceptions.exception_classes as e:
+                raise_mapped_exception(e, compiled_exceptions)
 
         return func_wrapper
 
@@ -143,7 +149,7 @@ def validate_query_parameters(serializer: serializers.Serializer):
     return validate_decorator
 
 
-def validate_body(serializer_class, partial=False):
+def validate_body(serializer_class, partial=False, compiled=False):
     """
     This decorator can validate the request body using a serializer. If the body is
     valid it will add the data to the kwargs. If not it will raise an APIException with
@@ -173,12 +179,18 @@ def validate_body(serializer_class, partial=False):
 
     :param serializer_class: The serializer that must be used for validating.
     :param partial: Whether partial data passed to the serializer is considered valid.
+    :param compiled: Whether the body must be validated via the precompiled
+        validation plan of the serializer instead of instantiating the serializer for
+        every request. Serializers that aren't supported by the plan are still
+        validated by the serializer itself.
     :type serializer_class: Serializer
     :raises ValueError: When the `data` attribute is already in the kwargs. This
         decorator tries to add the `data` attribute, but cannot do that if it is
         already present.
     """
 
+    validate = validate_data_compiled if compiled else validate_data
+
     def validate_decorator(func):
         def func_wrapper(*args, **kwargs):
             request = get_request(args)
@@ -187,9 +199,9 @@ def validate_body(serializer_class, partial=False):
                 raise ValueError("The data attribute is already in the kwargs.")
 
             if len(request.data) > 0:
-                kwargs["data"] = validate_data(serializer_class, request.data, partial)
+                kwargs["data"] = validate(serializer_class, request.data, partial)
             else:
-                kwargs["data"] = validate_data(serializer_class, request.GET, partial)
+                kwargs["data"] = validate(serializer_class, request.GET, partial)
             return func(*args, **kwargs)
 
         return func_wrapper
@@ -0,0 +1,603 @@
+import re
+import threading
+from collections import namedtuple
+from datetime import date, time
+from functools import lru_cache
+
+from django.conf import settings
+from django.dispatch import receiver
+from django.template.base import TextNode, VariableNode
+from django.template.context import make_context
+from django.template.defaulttags import (
+    AutoEscapeControlNode,
+    CommentNode,
+    ForNode,
+    LoadNode,
+)
+from django.template.loader import get_template
+from django.utils.autoreload import file_changed
+from django.utils.formats import localize
+from django.utils.html import conditional_escape, escape, strip_tags
+from django.utils.timezone import template_localtime
+from django.utils.translation import get_language
+
+RenderedEmail = namedtuple("RenderedEmail", ["html", "text"])
+
+# Marks the position of a dynamic part while the plain text of the static parts is
+# derived, the private use characters don't occur in the templates.
+PLACEHOLDER = "\ue000{}\ue001"
+PLACEHOLDER_RE = re.compile("\ue000(\\d+)\ue001")
+
+# Returned by `get_name` if the name isn't in the context.
+MISSING = object()
+
+
+def get_name(dicts, name):
+    for values in reversed(dicts):
+        if name in values:
+            return values[name]
+    return MISSING
+
+
+def render_localized(value, autoescape):
+    if autoescape:
+        return conditional_escape(value if isinstance(value, str) else str(value))
+    return str(value)
+
+
+@lru_cache(maxsize=4096)
+def render_cached_value(value_type, value, autoescape, language):
+    # The type is part of the key because `1`, `1.0` and `True` are equal keys.
+    return render_localized(localize(value), autoescape)
+
+
+def render_value(value, autoescape, language):
+    """
+    Does the same as `render_value_in_context` of Django, but the rendered numbers,
+    dates and times are cached because report mails contain many of the same
+    grades and times.
+    """
+
+    value_type = type(value)
+
+    if value_type is str:
+        return escape(value) if autoescape else value
+
+    # `-0.0` is an equal key of `0.0` that's rendered differently and only naive
+    # times don't depend on the time zone.
+    if (
+        value_type is int
+        or (value_type is float and value)
+        or value_type is date
+        or (value_type is time and value.tzinfo is None)
+    ):
+        return render_cached_value(value_type, value, autoescape, language)
+
+    return render_localized(localize(template_localtime(value)), autoescape)
+
+
+class Name(str):
+    """The name of a local variable of a render function."""
+
+
+class CodeWriter:
+    """Collects the source code and the constants of a render function."""
+
+    def __init__(self):
+        self.lines = []
+        self.constants = []
+        self.names = 0
+
+    def line(self, indent, code):
+        self.lines.append("    " * indent + code)
+
+    def constant(self, value):
+        self.constants.append(value)
+        return f"C[{len(self.constants) - 1}]"
+
+    def name(self, prefix):
+        self.names += 1
+        return Name(f"{prefix}{self.names}")
+
+    def strip(self, indent, html):
+        """Writes the code that derives the plain text of a rendered value."""
+
+        text = self.name("t")
+        self.line(
+            indent, f'{text} = {html} if "<" not in {html} else strip_tags({html})'
+        )
+        return text
+
+
+class CompiledBlock:
+    """
+    A sequence of static strings and dynamic parts. Rendering only computes the
+    dynamic parts and joins them with the static strings, which are constants of
+    the render function. The plain text alternative is derived once as well, by
+    stripping the tags of the block with a placeholder for every dynamic part. A
+    dynamic part of which the placeholder was stripped, like a variable in an
+    attribute, isn't part of the plain text.
+    """
+
+    def __init__(self, parts):
+        self.parts = merge_static_parts(parts)
+        self.dynamic_parts = [part for part in self.parts if not isinstance(part, str)]
+
+        marked = []
+        index = 0
+        for part in self.parts:
+            if isinstance(part, str):
+                marked.append(part)
+            else:
+                marked.append(PLACEHOLDER.format(index))
+                index += 1
+
+        # The static strings of the plain text alternate with the indexes of the
+        # dynamic parts that are part of it.
+        self.text_parts = [
+            int(piece) if position % 2 else piece
+            for position, piece in enumerate(
+                PLACEHOLDER_RE.split(strip_tags("".join(marked)))
+            )
+        ]
+
+    def write(self, writer, indent, scope, text):
+        """
+        Writes the code that computes the dynamic parts.
+
+        :param scope: The local names of the variables of the enclosing loops.
+        :type scope: dict
+        :param text: Whether the plain text is needed.
+        :type text: bool
+        :return: The expressions of the html and of the plain text.
+        :rtype: tuple
+        """
+
+        text_indexes = {part for part in self.text_parts if isinstance(part, int)}
+        html_names = []
+        text_names = []
+
+        for index, part in enumerate(self.dynamic_parts):
+            part_text = text and index in text_indexes
+            html_name, text_name = part.write(writer, indent, scope, part_text)
+            html_names.append(html_name)
+            text_names.append(text_name)
+
+        html_names = iter(html_names)
+        html = join_expression(
+            [
+                part if isinstance(part, str) else next(html_names)
+                for part in self.parts
+            ]
+        )
+
+        if not text:
+            return html, None
+
+        return html, join_expression(
+            [
+                part if isinstance(part, str) else text_names[part]
+                for part in self.text_parts
+            ]
+        )
+
+    def uses_forloop(self):
+        return any(part.uses_forloop() for part in self.dynamic_parts)
+
+
+def join_expression(parts):
+    """
+    :param parts: The static strings and the names of the dynamic parts.
+    :type parts: list
+    :return: The expression that joins them.
+    :rtype: str
+    """
+
+    parts = [part if isinstance(part, Name) else repr(part) for part in parts if part]
+
+    if not parts:
+        return "''"
+    if len(parts) == 1:
+        return parts[0]
+    return f'"".join(({", ".join(parts)},))'
+
+
+def merge_static_parts(parts):
+    merged = []
+    for part in parts:
+        if isinstance(part, str) and merged and isinstance(merged[-1], str):
+            merged[-1] += part
+        elif part != "":
+            merged.append(part)
+    return merged
+
+
+class CompiledVariable:
+    """
+    A `{{ variable }}`. Without filters, its lookups into the loop variables and
+    into dicts, which is what the report mails are made of, are done inline.
+    Everything else, like attributes, callables and missing values, goes through
+    the regular resolving of Django.
+    """
+
+    def __init__(self, filter_expression, autoescape):
+        self.filter_expression = filter_expression
+        self.autoescape = autoescape
+        variable = filter_expression.var
+        self.lookups = (
+            None
+            if filter_expression.filters or not hasattr(variable, "lookups")
+            else variable.lookups
+        )
+
+    def write(self, writer, indent, scope, text):
+        value = writer.name("v")
+        resolve = f"{writer.constant(self.filter_expression)}.resolve(context)"
+
+        if self.lookups is None:
+            writer.line(indent, f"{value} = {resolve}")
+        else:
+            first, *bits = self.lookups
+            lookup = scope.get(first) or f"get_name(dicts, {first!r})"
+            writer.line(indent, f"{value} = {lookup}")
+            for bit in bits:
+                writer.line(
+                    indent,
+                    f"{value} = {value}.get({bit!r}, MISSING) "
+                    f"if type({value}) is dict else MISSING",
+                )
+            writer.line(indent, f"if {value} is MISSING or callable({value}):")
+            writer.line(indent + 1, f"{value} = {resolve}")
+
+        html = writer.name("h")
+        writer.line(
+            indent,
+            f"{html} = {f'escape({value})' if self.autoescape else value} "
+            f"if type({value}) is str "
+            f"else render_value({value}, {self.autoescape}, language)",
+        )
+
+        return html, writer.strip(indent, html) if text else None
+
+    def uses_forloop(self):
+        return self.lookups is None or self.lookups[0] == "forloop"
+
+
+class CompiledLoop:
+    """
+    A `{% for %}` of which the body is compiled as well. The loop variables are
+    local variables of the render function and are also put in the context, for
+    the parts of the body that Django resolves.
+    """
+
+    def __init__(self, node, body, empty):
+        self.node = node
+        self.body = body
+        self.empty = empty
+        self.forloop = body.uses_forloop()
+
+    def write(self, writer, indent, scope, text):
+        node = self.node
+        html = writer.name("h")
+        text_name = writer.name("t") if text else None
+        loop_scope = writer.name("s")
+        values = writer.name("q")
+        length = writer.name("n")
+        counter = writer.name("c")
+        item = writer.name("i")
+        htmls = writer.name("hs")
+        texts = writer.name("ts")
+
+        writer.line(indent, f"with context.push() as {loop_scope}:")
+        indent += 1
+        writer.line(
+            indent,
+            f"{values} = {writer.constant(node.sequence)}.resolve("
+            f"context, ignore_failures=True)",
+        )
+        writer.line(indent, f"if {values} is None:")
+        writer.line(indent + 1, f"{values} = []")
+        writer.line(indent, f'if not hasattr({values}, "__len__"):')
+        writer.line(indent + 1, f"{values} = list({values})")
+        writer.line(indent, f"{length} = len({values})")
+
+        writer.line(indent, f"if {length} < 1:")
+        empty_html, empty_text = self.empty.write(writer, indent + 1, scope, text)
+        writer.line(indent + 1, f"{html} = {empty_html}")
+        if text:
+            writer.line(indent + 1, f"{text_name} = {empty_text}")
+
+        writer.line(indent, "else:")
+        indent += 1
+        if self.forloop:
+            parentloop = writer.name("p")
+            writer.line(
+                indent,
+                f'{parentloop} = context["forloop"] if "forloop" in context else {{}}',
+            )
+        if node.is_reversed:
+            writer.line(indent, f"{values} = reversed({values})")
+        writer.line(indent, f"{htmls} = []")
+        if text:
+            writer.line(indent, f"{texts} = []")
+
+        writer.line(indent, f"for {counter}, {item} in enumerate({values}):")
+        indent += 1
+        if self.forloop:
+            writer.line(
+                indent,
+                f'{loop_scope}["forloop"] = {{"parentloop": {parentloop}, '
+                f'"counter0": {counter}, "counter": {counter} + 1, '
+                f'"revcounter": {length} - {counter}, '
+                f'"revcounter0": {length} - {counter} - 1, '
+                f'"first": {counter} == 0, "last": {counter} == {length} - 1}}',
+            )
+
+        scope = dict(scope)
+        loopvars = node.loopvars
+        if len(loopvars) > 1:
+            item_length = writer.name("n")
+            writer.line(indent, "try:")
+            writer.line(indent + 1, f"{item_length} = len({item})")
+            writer.line(indent, "except TypeError:")
+            writer.line(indent + 1, f"{item_length} = 1")
+            writer.line(indent, f"if {item_length} != {len(loopvars)}:")
+            writer.line(
+                indent + 1,
+                f'raise ValueError("Need {len(loopvars)} values to unpack in for '
+                f'loop; got {{}}. ".format({item_length}))',
+            )
+            names = [writer.name("l") for _ in loopvars]
+            writer.line(indent, f"{', '.join(names)} = {item}")
+            for loopvar, name in zip(loopvars, names):
+                writer.line(indent, f"{loop_scope}[{loopvar!r}] = {name}")
+                scope[loopvar] = name
+        else:
+            writer.line(indent, f"{loop_scope}[{loopvars[0]!r}] = {item}")
+            scope[loopvars[0]] = item
+
+        body_html, body_text = self.body.write(writer, indent, scope, text)
+        writer.line(indent, f"{htmls}.append({body_html})")
+        if text:
+            writer.line(indent, f"{texts}.append({body_text})")
+
+        indent -= 1
+        writer.line(indent, f'{html} = "".join({htmls})')
+        if text:
+            writer.line(indent, f'{text_name} = "".join({texts})')
+
+        return html, text_name
+
+    def uses_forloop(self):
+        # A nested loop refers to this one as its `parentloop`.
+        return self.forloop or self.empty.uses_forloop()
+
+
+class CompiledNode:
+    """Any other node, it's rendered by Django every time."""
+
+    def __init__(self, node, autoescape, default_autoescape):
+        self.node = node
+        self.autoescape = autoescape
+        self.default_autoescape = default_autoescape
+
+    def write(self, writer, indent, scope, text):
+        html = writer.name("h")
+        node = writer.constant(self.node)
+        switch = self.autoescape != self.default_autoescape
+
+        if switch:
+            writer.line(indent, f"context.autoescape = {self.autoescape}")
+        writer.line(indent, f"{html} = {node}.render_annotated(context)")
+        if switch:
+            writer.line(indent, f"context.autoescape = {self.default_autoescape}")
+
+        return html, writer.strip(indent, html) if text else None
+
+    def uses_forloop(self):
+        return True
+
+
+def compile_nodelist(nodelist, autoescape, default_autoescape):
+    """
+    :return: The static strings and the dynamic parts of the nodes. The nodes of an
+        `{% autoescape %}` are inlined, so that the static strings around and
+        inside it can be merged.
+    :rtype: list
+    """
+
+    parts = []
+
+    for node in nodelist:
+        if isinstance(node, TextNode):
+            parts.append(node.s)
+        elif isinstance(node, (CommentNode, LoadNode)):
+            continue
+        elif isinstance(node, VariableNode):
+            parts.append(CompiledVariable(node.filter_expression, autoescape))
+        elif isinstance(node, AutoEscapeControlNode):
+            parts.extend(
+                compile_nodelist(node.nodelist, node.setting, default_autoescape)
+            )
+        elif isinstance(node, ForNode):
+            body = compile_nodelist(node.nodelist_loop, autoescape, default_autoescape)
+            empty = compile_nodelist(
+                node.nodelist_empty, autoescape, default_autoescape
+            )
+            parts.append(CompiledLoop(node, CompiledBlock(body), CompiledBlock(empty)))
+        else:
+            parts.append(CompiledNode(node, autoescape, default_autoescape))
+
+    return parts
+
+
+def slice_body(parts):
+    """
+    Keeps the parts from the `<body>` up to the `</body>` of the static skeleton,
+    like the email messages did with the rendered html.
+
+    :return: The sliced parts or None if the tags are not both in the top level
+        static text, for example because they are in a block of a parent template
+        or inside an `{% if %}`.
+    :rtype: list or None
+    """
+
+    static = [
+        (index, part) for index, part in enumerate(parts) if isinstance(part, str)
+    ]
+
+    for start, part in static:
+        if "<body>" in part:
+            first = part[part.index("<body>"):]
+            break
+    else:
+        return None
+
+    for end, part in static:
+        if end < start:
+            continue
+        if end == start:
+            part = first
+        if "</body>" in part:
+            last = part[:part.index("</body>")]
+            break
+    else:
+        return None
+
+    if start == end:
+        return [last]
+
+    return [first] + parts[start + 1:end] + [last]
+
+
+class EmailTemplate:
+    """
+    A template compiled for rendering email messages. The template is loaded and
+    parsed once and turned into a Python function, in which the static parts are
+    format strings and only the variables and loops are computed for every
+    message, together with the plain text alternative.
+
+    When the body tags can't be found in the static skeleton, the rendered html is
+    sliced and its tags are stripped for every message instead.
+    """
+
+    def __init__(self, template, body=True):
+        """
+        :param template: The parsed template.
+        :type template: django.template.base.Template
+        :param body: Whether only the part between the body tags is rendered.
+        :type body: bool
+        """
+
+        self.template = template
+        self.autoescape = template.engine.autoescape
+
+        parts = compile_nodelist(template.nodelist, self.autoescape, self.autoescape)
+        sliced = slice_body(parts) if body else parts
+        self.slice_rendered = sliced is None
+        block = CompiledBlock(parts if sliced is None else sliced)
+
+        writer = CodeWriter()
+        writer.line(0, "def render(context, language):")
+        writer.line(1, "dicts = context.dicts")
+        html, text = block.write(writer, 1, {}, True)
+        writer.line(1, f"return {html}, {text}")
+        self.source = "\n".join(writer.lines)
+
+        namespace = {
+            "C": writer.constants,
+            "MISSING": MISSING,
+            "escape": escape,
+            "get_name": get_name,
+            "render_value": render_value,
+            "strip_tags": strip_tags,
+        }
+        code = compile(self.source, f"<email template {template.name}>", "exec")
+        exec(code, namespace)
+        self.function = namespace["render"]
+
+    def render(self, context=None):
+        """
+        :param context: The variables of the template.
+        :type context: dict
+        :return: The html and the plain text alternative.
+        :rtype: RenderedEmail
+        """
+
+        template = self.template
+        context = make_context(context, autoescape=self.autoescape)
+
+        with context.render_context.push_state(template):
+            with context.bind_template(template):
+                context.template_name = template.name
+                html, text = self.function(context, get_language())
+
+        if self.slice_rendered:
+            try:
+                html = html[html.index("<body>"):html.index("</body>")]
+            except ValueError:
+                return RenderedEmail(html, text)
+            text = strip_tags(html)
+
+        return RenderedEmail(html, text)
+
+
+class EmailTemplates:
+    """
+    Keeps the compiled email templates by name, unless `EMAIL_TEMPLATE_CACHE` is
+    disabled, in which case the template is compiled on every render.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._templates = {}
+
+    def get(self, template_name, body=True):
+        """
+        :param template_name: The name of the template.
+        :type template_name: str
+        :param body: Whether only the part between the body tags is rendered, like
+            the email messages do. If the template doesn't have a body, then all of
+            it is rendered.
+        :type body: bool
+        :rtype: EmailTemplate
+        """
+
+        if not settings.EMAIL_TEMPLATE_CACHE:
+            return EmailTemplate(get_template(template_name).template, body)
+
+        key = (template_name, body)
+        try:
+            return self._templates[key]
+        except KeyError:
+            pass
+
+        template = EmailTemplate(get_template(template_name).template, body)
+        with self._lock:
+            return self._templates.setdefault(key, template)
+
+    def render(self, template_name, context=None, body=True):
+        """
+        :param template_name: The name of the template.
+        :type template_name: str
+        :param context: The variables of the template.
+        :type context: dict
+        :param body: Whether only the part between the body tags is rendered.
+        :type body: bool
+        :rtype: RenderedEmail
+        """
+
+        return self.get(template_name, body).render(context)
+
+    def clear(self):
+        with self._lock:
+            self._templates = {}
+
+
+email_templates = EmailTemplates()
+
+
+@receiver(file_changed)
+def clear_email_templates(sender, file_path, **kwargs):
+    # The development server reloads changed templates without restarting.
+    email_templates.clear()
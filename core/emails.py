@@ -1,18 +1,18 @@
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
 from django.utils.translation import gettext as _
 from django.db import transaction
 
+from core.email_templates import email_templates
+
 
 class BaseEmailMessage(EmailMultiAlternatives):
     """
     The base email message class can be used to create reusable email classes for
     each email. The template_name is rendered to a string and attached as html
-    alternative. This content is automatically converted to plain text. The get_context
-    method can be extended to add additional context variables while rendering the
-    template.
+    alternative. This content is automatically converted to plain text. The template
+    is compiled once and reused by all the messages. The get_context method can be
+    extended to add additional context variables while rendering the template.
 
     Example:
         class TestEmail(BaseEmailMessage):
@@ -33,16 +33,7 @@ class BaseEmailMessage(EmailMultiAlternatives):
         subject = self.get_subject()
         template_name = self.get_template_name()
         context = self.get_context()
-        html_content = render_to_string(template_name, context)
-
-        try:
-            body_start_index = html_content.index("<body>")
-            body_end_index = html_content.index("</body>")
-            html_content = html_content[body_start_index:body_end_index]
-        except ValueError:
-            pass
-
-        text_content = strip_tags(html_content)
+        html_content, text_content = email_templates.render(template_name, context)
 
         super().__init__(
             subject=subject, body=text_content, from_email=from_email, to=to
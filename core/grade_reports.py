@@ -0,0 +1,511 @@
+import json
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import django
+import numpy as np
+from django.apps import apps
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.db import connections
+
+from core.bulk_mail import BulkMailQueue
+from core.email_templates import email_templates
+from utils.helper import ass_weight, fin_weight, mid_weight
+from utils.redis import get_redis_connection
+
+TEMPLATE_NAME = "report-grade.html"
+
+ASSIGNMENT = "ASSIGNMENT"
+MIDDLE = "MIDDLE"
+FINAL = "FINAL"
+GRADE_TYPES = (ASSIGNMENT, MIDDLE, FINAL)
+GRADE_WEIGHTS = np.array([ass_weight, mid_weight, fin_weight])
+
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class GradeReportJobError(Exception):
+    """Raised when a grade report job can't be started or resumed."""
+
+
+def round_grades(values):
+    """
+    Rounds to one decimal like `round(value, 1)` of Python, which `cal_avg_grade`
+    and `cal_gpa` use. Rounding of NumPy scales by ten first, so it only differs
+    when the scaled value lands exactly on a half, those values are rounded by
+    Python instead.
+
+    :param values: The grades, NaN if there is none.
+    :type values: numpy.ndarray
+    :rtype: numpy.ndarray
+    """
+
+    scaled = values * 10
+    rounded = np.round(values, 1)
+    halves = np.flatnonzero(scaled - np.floor(scaled) == 0.5)
+    rounded[halves] = [round(value, 1) for value in values[halves].tolist()]
+    return rounded
+
+
+def compute_averages(scores):
+    """
+    Computes the average of every subject like `cal_avg_grade`, the grades that are
+    missing or zero don't count.
+
+    :param scores: The assignment, middle and final grade of every subject, NaN if
+        the grade is missing.
+    :type scores: numpy.ndarray
+    :return: The averages, NaN if a subject doesn't have any grades.
+    :rtype: numpy.ndarray
+    """
+
+    counted = ~np.isnan(scores) & (scores != 0)
+    weighted = np.where(counted, scores * GRADE_WEIGHTS, 0.0)
+    weights = np.where(counted, GRADE_WEIGHTS, 0.0)
+
+    # Summed in the same order as `weight_average`, so the results are the same.
+    weight_sums = weights[:, 0] + weights[:, 1] + weights[:, 2]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        averages = (weighted[:, 0] + weighted[:, 1] + weighted[:, 2]) / weight_sums
+
+    averages[weight_sums == 0] = np.nan
+    return round_grades(averages)
+
+
+def compute_gpas(averages, groups, size):
+    """
+    Computes the GPA of every student and term like `cal_gpa`. Subjects without an
+    average don't count.
+
+    :param averages: The average of every subject.
+    :type averages: numpy.ndarray
+    :param groups: The index of the student and term of every subject.
+    :type groups: numpy.ndarray
+    :param size: The number of students and terms.
+    :type size: int
+    :return: The GPAs, NaN if none of the subjects has an average.
+    :rtype: numpy.ndarray
+    """
+
+    counted = ~np.isnan(averages)
+    sums = np.bincount(groups[counted], weights=averages[counted], minlength=size)
+    counts = np.bincount(groups[counted], minlength=size)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        gpas = sums / counts
+
+    return round_grades(gpas)
+
+
+def build_report_contexts(students, grades, terms):
+    """
+    Builds the context of `report-grade.html` for every student.
+
+    :param students: The id, full name and email of every student.
+    :type students: list
+    :param grades: The student id, term, subject name, grade type and value of
+        every grade, ordered by the subject.
+    :type grades: iterable
+    :param terms: The terms of the report.
+    :type terms: tuple
+    :return: The student and the context of every report.
+    :rtype: list
+    """
+
+    term_indexes = {term: index for index, term in enumerate(terms)}
+    student_indexes = {student[0]: index for index, student in enumerate(students)}
+    type_indexes = {grade_type: index for index, grade_type in enumerate(GRADE_TYPES)}
+
+    subjects = {}
+    rows = []
+    scores = []
+
+    for student_id, term, subject_name, grade_type, value in grades:
+        if term not in term_indexes or grade_type not in type_indexes:
+            continue
+
+        key = (student_id, term, subject_name)
+        index = subjects.get(key)
+        if index is None:
+            index = subjects[key] = len(rows)
+            rows.append({"subject_name": subject_name})
+            scores.append([np.nan, np.nan, np.nan])
+
+        if value is not None:
+            rows[index][grade_type] = value
+            scores[index][type_indexes[grade_type]] = float(value)
+
+    groups = np.array(
+        [
+            student_indexes[student_id] * len(terms) + term_indexes[term]
+            for student_id, term, _ in subjects
+        ],
+        dtype=np.int64,
+    )
+    averages = compute_averages(np.array(scores, dtype=float).reshape(-1, 3))
+    gpas = compute_gpas(averages, groups, len(students) * len(terms))
+
+    def to_python(value):
+        return None if np.isnan(value) else value
+
+    term_rows = [[[] for _ in terms] for _ in students]
+    for row, group, average in zip(rows, groups.tolist(), averages.tolist()):
+        row["AVG"] = to_python(average)
+        term_rows[group // len(terms)][group % len(terms)].append(row)
+
+    gpas = gpas.tolist()
+    contexts = []
+    for index, student in enumerate(students):
+        context = {"full_name": student[1]}
+        for term_index in range(len(terms)):
+            context[f"term{term_index + 1}"] = term_rows[index][term_index]
+            context[f"gpa{term_index + 1}"] = to_python(
+                gpas[index * len(terms) + term_index]
+            )
+        contexts.append((student, context))
+
+    return contexts
+
+
+def render_reports(contexts):
+    """
+    Renders the reports, it's called in the processes of the pool.
+
+    :param contexts: The contexts of `report-grade.html`.
+    :type contexts: list
+    :return: The html and plain text of every report.
+    :rtype: list
+    """
+
+    return [
+        tuple(email_templates.render(TEMPLATE_NAME, context)) for context in contexts
+    ]
+
+
+class GradeReportSource:
+    """
+    Selects the students and their grades with a query per batch of students. The
+    models belong to the `custom_service` app, the attributes below describe the
+    fields that are used.
+    """
+
+    student_model = "custom_service.Student"
+    grade_model = "custom_service.Grade"
+    class_field = "my_class_id"
+    student_fields = ("id", "user__first_name", "user__last_name", "user__email")
+    grade_fields = ("student_id", "term", "subject__name", "grade_type", "value")
+    terms = (1, 2)
+
+    def get_model(self, name):
+        try:
+            return apps.get_model(name)
+        except LookupError:
+            raise GradeReportJobError(f"The {name} model is not installed.")
+
+    def get_students_queryset(self, class_id):
+        queryset = self.get_model(self.student_model).objects.all()
+        if class_id is not None:
+            queryset = queryset.filter(**{self.class_field: class_id})
+        return queryset
+
+    def count_students(self, class_id):
+        return self.get_students_queryset(class_id).count()
+
+    def get_students(self, class_id, after, limit):
+        """
+        :param class_id: The id of the class or None for the whole school.
+        :type class_id: int or None
+        :param after: Only the students with a higher id are selected.
+        :type after: int
+        :param limit: The maximum number of students.
+        :type limit: int
+        :return: The id, full name and email of the students ordered by id.
+        :rtype: list
+        """
+
+        students = (
+            self.get_students_queryset(class_id)
+            .filter(id__gt=after)
+            .order_by("id")
+            .values_list(*self.student_fields)[:limit]
+        )
+
+        return [
+            (student_id, f"{first_name} {last_name}".strip(), email)
+            for student_id, first_name, last_name, email in students
+        ]
+
+    def get_grades(self, student_ids):
+        """
+        :param student_ids: The ids of the students.
+        :type student_ids: list
+        :return: The student id, term, subject name, grade type and value of all
+            their grades, ordered by the subject.
+        :rtype: iterable
+        """
+
+        return (
+            self.get_model(self.grade_model)
+            .objects.filter(student_id__in=student_ids)
+            .order_by(self.grade_fields[2], "id")
+            .values_list(*self.grade_fields)
+            .iterator()
+        )
+
+
+class GradeReportProgress:
+    """
+    Keeps the progress of the grade report jobs in a Redis hash, which is also the
+    checkpoint a job resumes from. The checkpoint is written after every chunk of
+    reports that is handed to the bulk mail queue and after the last student of a
+    batch, so a resumed job starts after the last queued chunk. Only a chunk that
+    was interrupted between being queued and its checkpoint can be sent again.
+    """
+
+    key_prefix = "grade_report"
+
+    def get_key(self, job_id):
+        return f"{self.key_prefix}:{job_id}"
+
+    def create(self, class_id, total):
+        """
+        :return: The id of the new job.
+        :rtype: str
+        """
+
+        job_id = uuid.uuid4().hex
+        self.update(
+            job_id,
+            class_id=class_id,
+            status=RUNNING,
+            total=total,
+            processed=0,
+            skipped=0,
+            queued_chunks=0,
+            last_student_id=0,
+            started_at=datetime.utcnow().isoformat(),
+        )
+        return job_id
+
+    def get(self, job_id):
+        """
+        :return: The progress of the job or None if it doesn't exist (anymore).
+        :rtype: dict or None
+        """
+
+        values = get_redis_connection().hgetall(self.get_key(job_id))
+        if not values:
+            return None
+
+        return {
+            key.decode() if isinstance(key, bytes) else key: json.loads(value)
+            for key, value in values.items()
+        }
+
+    def update(self, job_id, **fields):
+        fields["updated_at"] = datetime.utcnow().isoformat()
+        key = self.get_key(job_id)
+
+        with get_redis_connection().pipeline() as pipe:
+            pipe.hset(
+                key, mapping={name: json.dumps(value) for name, value in fields.items()}
+            )
+            pipe.expire(key, settings.GRADE_REPORT_CHECKPOINT_TTL)
+            pipe.execute()
+
+
+grade_report_progress = GradeReportProgress()
+
+
+class GradeReportJob:
+    """
+    Sends the grade report of every student of a class, or of the whole school, via
+    the bulk mail queue. The students are processed in batches ordered by id. A
+    batch takes two queries, its averages are computed with NumPy and its reports
+    are rendered by a pool of processes. The progress is saved after every queued
+    chunk of reports.
+
+    Example:
+        job = GradeReportJob(class_id=1)
+        job.run()
+
+        # Continues where an interrupted job stopped.
+        GradeReportJob(job_id=job.job_id).run()
+    """
+
+    def __init__(
+        self,
+        class_id=None,
+        job_id=None,
+        batch_size=None,
+        workers=None,
+        source=None,
+        progress=None,
+    ):
+        self.class_id = class_id
+        self.job_id = job_id
+        self.batch_size = batch_size or settings.GRADE_REPORT_BATCH_SIZE
+        self.workers = workers or settings.GRADE_REPORT_WORKERS
+        self.source = source or GradeReportSource()
+        self.progress = progress or grade_report_progress
+
+    def get_checkpoint(self):
+        if self.job_id is None:
+            total = self.source.count_students(self.class_id)
+            self.job_id = self.progress.create(self.class_id, total)
+            return self.progress.get(self.job_id)
+
+        checkpoint = self.progress.get(self.job_id)
+        if checkpoint is None:
+            raise GradeReportJobError(f"The job {self.job_id} does not exist.")
+        if checkpoint["status"] == COMPLETED:
+            raise GradeReportJobError(f"The job {self.job_id} is already completed.")
+
+        self.class_id = checkpoint["class_id"]
+        self.progress.update(self.job_id, status=RUNNING)
+        return checkpoint
+
+    def run(self, on_progress=None):
+        """
+        :param on_progress: Called with the progress after every batch.
+        :type on_progress: callable
+        :return: The progress of the completed job.
+        :rtype: dict
+        """
+
+        checkpoint = self.get_checkpoint()
+
+        try:
+            if self.workers > 1:
+                # The processes must not share the database connections of this one.
+                connections.close_all()
+                with ProcessPoolExecutor(
+                    max_workers=self.workers, initializer=django.setup
+                ) as executor:
+                    checkpoint = self.run_batches(checkpoint, executor, on_progress)
+            else:
+                checkpoint = self.run_batches(checkpoint, None, on_progress)
+        except BaseException:
+            self.progress.update(self.job_id, status=FAILED)
+            raise
+
+        self.progress.update(self.job_id, status=COMPLETED)
+        checkpoint["status"] = COMPLETED
+        return checkpoint
+
+    def run_batches(self, checkpoint, executor, on_progress):
+        while True:
+            students = self.source.get_students(
+                self.class_id, checkpoint["last_student_id"], self.batch_size
+            )
+            if not students:
+                return checkpoint
+
+            grades = self.source.get_grades([student[0] for student in students])
+            reports = build_report_contexts(students, grades, self.source.terms)
+            self.send_reports(reports, executor, checkpoint)
+
+            if on_progress:
+                on_progress(checkpoint)
+
+    def save_checkpoint(self, checkpoint, last_student_id, processed, sent, chunks):
+        """
+        Adds the students that have been handled since the previous checkpoint to
+        the checkpoint and saves it.
+
+        :param last_student_id: The id of the last handled student.
+        :type last_student_id: int
+        :param processed: The number of handled students.
+        :type processed: int
+        :param sent: The number of those students whose report was queued.
+        :type sent: int
+        :param chunks: The number of queued chunks.
+        :type chunks: int
+        """
+
+        checkpoint.update(
+            processed=checkpoint["processed"] + processed,
+            skipped=checkpoint["skipped"] + processed - sent,
+            queued_chunks=checkpoint["queued_chunks"] + chunks,
+            last_student_id=last_student_id,
+        )
+        self.progress.update(
+            self.job_id,
+            **{
+                key: checkpoint[key]
+                for key in ("processed", "skipped", "queued_chunks", "last_student_id")
+            },
+        )
+
+    def render(self, contexts, executor):
+        if executor is None:
+            return render_reports(contexts)
+
+        # Every process gets a few tasks, so that they finish around the same time.
+        size = max(1, -(-len(contexts) // (self.workers * 4)))
+        rendered = []
+        for reports in executor.map(
+            render_reports,
+            [contexts[index:index + size] for index in range(0, len(contexts), size)],
+        ):
+            rendered.extend(reports)
+        return rendered
+
+    def send_reports(self, reports, executor, checkpoint):
+        """
+        Renders the reports of the students that have an email address and adds
+        them to the bulk mail queue. The checkpoint is saved every time the queue
+        queues a chunk and after the last student.
+
+        :param reports: The student and the context of every report, ordered by the
+            id of the student.
+        :type reports: list
+        :param checkpoint: The progress of the job, it's updated in place.
+        :type checkpoint: dict
+        """
+
+        rendered = iter(
+            self.render(
+                [context for student, context in reports if student[2]], executor
+            )
+        )
+        queue = BulkMailQueue()
+        processed = sent = saved_chunks = 0
+
+        for student, _ in reports:
+            processed += 1
+            if student[2]:
+                html, text = next(rendered)
+                message = EmailMultiAlternatives(
+                    subject=f"Report card - {student[1]}",
+                    body=text,
+                    from_email=settings.FROM_EMAIL,
+                    to=[student[2]],
+                )
+                message.attach_alternative(html, "text/html")
+                queue.add(message)
+                sent += 1
+
+            if queue.queued_chunks > saved_chunks:
+                self.save_checkpoint(
+                    checkpoint,
+                    student[0],
+                    processed,
+                    sent,
+                    queue.queued_chunks - saved_chunks,
+                )
+                saved_chunks = queue.queued_chunks
+                processed = sent = 0
+
+        queue.flush()
+        self.save_checkpoint(
+            checkpoint,
+            reports[-1][0][0],
+            processed,
+            sent,
+            queue.queued_chunks - saved_chunks,
+        )
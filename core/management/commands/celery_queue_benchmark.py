@@ -0,0 +1,165 @@
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from datetime import datetime
+
+from celery import Celery
+from django.conf import settings
+from django.core.management.base import CommandError
+
+from core.benchmark import BenchmarkCommand, summarize
+
+REALTIME_TASK = "ws.tasks.broadcast_to_users"
+BULK_MAIL_TASK = "djcelery_email_send_multiple"
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Measures how long real time tasks wait behind a burst of bulk mail tasks, "
+        "once with all the tasks in the default queue and once routed by "
+        "CELERY_TASK_ROUTES to the queues of the worker profiles. The workers run in "
+        "this process using the in memory transport of the broker and the tasks "
+        "only sleep. The results are written as JSON so that runs can be compared."
+    )
+    report_name = "celery-queue-benchmark"
+
+    def add_benchmark_arguments(self, parser):
+        parser.add_argument(
+            "--bulk",
+            type=int,
+            default=200,
+            help="The number of bulk mail tasks that are sent first.",
+        )
+        parser.add_argument(
+            "--bulk-ms",
+            type=float,
+            default=20,
+            help="How many milliseconds a bulk mail task takes.",
+        )
+        parser.add_argument(
+            "--realtime",
+            type=int,
+            default=50,
+            help="The number of real time tasks sent after the bulk mail tasks.",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=120,
+            help="The number of seconds the workers get to process all the tasks.",
+        )
+
+    def handle(self, *args, **options):
+        from celery.contrib.testing.worker import start_worker
+
+        self.timeout = options["timeout"]
+        self.options = options
+        started_at = datetime.utcnow()
+        self.waited = defaultdict(list)
+        self.app, self.sleep = self.create_app("producer")
+
+        # Both topologies get two workers, only the routing differs. All the workers
+        # are started up front, the shared ones only consume the default queue.
+        profiles = settings.CELERY_WORKER_PROFILES
+        workers = {
+            "shared-1": [settings.CELERY_TASK_DEFAULT_QUEUE],
+            "shared-2": [settings.CELERY_TASK_DEFAULT_QUEUE],
+            "realtime": profiles["realtime"]["queues"],
+            "bulk-mail": profiles["bulk-mail"]["queues"],
+        }
+
+        with ExitStack() as stack:
+            for name, queues in workers.items():
+                worker_app, _ = self.create_app(name)
+                stack.enter_context(
+                    start_worker(
+                        worker_app,
+                        pool="solo",
+                        perform_ping_check=False,
+                        queues=queues,
+                    )
+                )
+
+            results = {
+                "shared": self.run_workload(routed=False),
+                "routed": self.run_workload(routed=True),
+            }
+
+        self.write_report(
+            options,
+            started_at,
+            results,
+            bulk=options["bulk"],
+            bulk_ms=options["bulk_ms"],
+            realtime=options["realtime"],
+        )
+
+    def create_app(self, name):
+        """
+        Creates a Celery app using the routing of the project and the in memory
+        transport, with a task that records how long it has been waiting.
+        """
+
+        app = Celery(f"celery-queue-benchmark-{name}", set_as_current=False)
+        app.conf.update(
+            broker_url="memory://",
+            broker_transport_options={"polling_interval": 0.001},
+            result_backend=None,
+            task_ignore_result=True,
+            task_default_queue=settings.CELERY_TASK_DEFAULT_QUEUE,
+            task_routes=settings.CELERY_TASK_ROUTES,
+            worker_prefetch_multiplier=1,
+            worker_hijack_root_logger=False,
+        )
+
+        waited = self.waited
+
+        @app.task(name="core.benchmark.sleep")
+        def sleep(kind, sent_at, seconds):
+            waited[kind].append(time.perf_counter() - sent_at)
+            time.sleep(seconds)
+
+        return app, sleep
+
+    def run_workload(self, routed):
+        """
+        Sends the bulk mail tasks followed by the real time tasks and measures how
+        long the tasks have been waiting before they were started.
+        """
+
+        self.waited.clear()
+        bulk = self.options["bulk"]
+        realtime = self.options["realtime"]
+
+        def get_queue(task_name):
+            if not routed:
+                return settings.CELERY_TASK_DEFAULT_QUEUE
+            return self.app.amqp.router.route({}, task_name)["queue"].name
+
+        for _ in range(bulk):
+            self.sleep.apply_async(
+                ("bulk", time.perf_counter(), self.options["bulk_ms"] / 1000),
+                queue=get_queue(BULK_MAIL_TASK),
+            )
+        for _ in range(realtime):
+            self.sleep.apply_async(
+                ("realtime", time.perf_counter(), 0),
+                queue=get_queue(REALTIME_TASK),
+            )
+
+        deadline = time.monotonic() + self.timeout
+        while len(self.waited["bulk"]) + len(self.waited["realtime"]) < (
+            bulk + realtime
+        ):
+            if time.monotonic() > deadline:
+                raise CommandError("The workers did not process all the tasks.")
+            time.sleep(0.01)
+
+        return {
+            "queues": {
+                "bulk": get_queue(BULK_MAIL_TASK),
+                "realtime": get_queue(REALTIME_TASK),
+            },
+            "bulk_wait": summarize(self.waited["bulk"]),
+            "realtime_wait": summarize(self.waited["realtime"]),
+        }
@@ -0,0 +1,127 @@
+import random
+import time
+from datetime import datetime
+from datetime import time as datetime_time
+
+from django.template.loader import render_to_string
+from django.utils.html import strip_tags
+
+from core.benchmark import BenchmarkCommand
+from core.email_templates import email_templates
+
+SUBJECTS = ["Math", "Physics", "Chemistry", "Literature", "English", "History"]
+
+
+def render_uncompiled(template_name, context):
+    """Renders like the email messages did before the templates were compiled."""
+
+    html = render_to_string(template_name, context)
+
+    try:
+        html = html[html.index("<body>"):html.index("</body>")]
+    except ValueError:
+        pass
+
+    return html, strip_tags(html)
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Measures how many report mails per second are rendered, including their "
+        "plain text alternative, once with `render_to_string` and `strip_tags` and "
+        "once with the compiled email templates. The contexts are generated and "
+        "both renderers must produce the same output. The results are written as "
+        "JSON so that runs can be compared."
+    )
+    report_name = "email-render-benchmark"
+
+    def add_benchmark_arguments(self, parser):
+        parser.add_argument(
+            "--messages",
+            type=int,
+            default=2000,
+            help="The number of messages rendered per template and renderer.",
+        )
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=10,
+            help="The number of subjects per term or time table rows per message.",
+        )
+
+    def handle(self, *args, **options):
+        messages = options["messages"]
+        rows = options["rows"]
+        started_at = datetime.utcnow()
+        contexts = {
+            "report-grade.html": [self.get_report_context(rows) for _ in range(100)],
+            "info-class.html": [self.get_class_context(rows) for _ in range(100)],
+        }
+
+        results = {}
+        for template_name, template_contexts in contexts.items():
+            identical = all(
+                render_uncompiled(template_name, context)
+                == tuple(email_templates.render(template_name, context))
+                for context in template_contexts
+            )
+            results[template_name] = {
+                "identical": identical,
+                "uncompiled": self.measure(
+                    messages, template_contexts, render_uncompiled, template_name
+                ),
+                "compiled": self.measure(
+                    messages, template_contexts, email_templates.render, template_name
+                ),
+            }
+
+        self.write_report(options, started_at, results, messages=messages, rows=rows)
+
+    def get_report_context(self, rows):
+        def get_term():
+            return [
+                {
+                    "subject_name": SUBJECTS[index % len(SUBJECTS)],
+                    "ASSIGNMENT": round(random.uniform(0, 10), 1),
+                    "MIDDLE": round(random.uniform(0, 10), 1),
+                    "FINAL": round(random.uniform(0, 10), 1),
+                    "AVG": round(random.uniform(0, 10), 1),
+                }
+                for index in range(rows)
+            ]
+
+        return {
+            "full_name": f"Student {random.randint(1, 100000)}",
+            "term1": get_term(),
+            "term2": get_term(),
+            "gpa1": round(random.uniform(0, 10), 1),
+            "gpa2": round(random.uniform(0, 10), 1),
+        }
+
+    def get_class_context(self, rows):
+        return {
+            "list_time_table_res": [
+                {
+                    "name_subject": SUBJECTS[index % len(SUBJECTS)],
+                    "name_teacher": f"Teacher {random.randint(1, 50)}",
+                    "time_table": {
+                        "day_of_week": random.randint(2, 7),
+                        "time_start": datetime_time(random.randint(7, 16), 0),
+                        "time_end": datetime_time(random.randint(17, 20), 30),
+                    },
+                }
+                for index in range(rows)
+            ]
+        }
+
+    def measure(self, messages, contexts, render, template_name):
+        started = time.perf_counter()
+        for index in range(messages):
+            render(template_name, contexts[index % len(contexts)])
+        duration = time.perf_counter() - started
+
+        return {
+            "duration_ms": duration * 1000,
+            "messages_per_second": messages / duration,
+            "us_per_message": duration / messages * 1000000,
+        }
@@ -0,0 +1,133 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import CommandError
+
+from core.benchmark import BenchmarkCommand
+from core.registry import Instance, ModelInstanceMixin, ModelRegistryMixin, Registry
+
+
+class BenchmarkRegistry(ModelRegistryMixin, Registry):
+    name = "benchmark"
+
+
+def get_by_model_linear(registry, model_instance):
+    """
+    The lookup `ModelRegistryMixin.get_by_model` did before it was indexed, a walk
+    over every registered value.
+    """
+
+    most_specific_value = None
+    for value in registry.registry.values():
+        value_model_class = value.model_class
+        if value_model_class == model_instance or isinstance(
+                model_instance, value_model_class
+        ):
+            if most_specific_value is None:
+                most_specific_value = value
+            else:
+                most_specific_num_base_classes = len(
+                    most_specific_value.model_class.mro()
+                )
+                value_num_base_classes = len(value_model_class.mro())
+                if value_num_base_classes > most_specific_num_base_classes:
+                    most_specific_value = value
+
+    if most_specific_value is not None:
+        return most_specific_value
+
+    raise registry.does_not_exist_exception_class(model_instance)
+
+
+def create_registry(types):
+    """
+    Creates a registry with `types` registered types. Every other model class
+    extends the previous one, so that the most specific type must be chosen. The
+    returned lookups are instances of unregistered subclasses and model classes.
+    """
+
+    registry = BenchmarkRegistry()
+    lookups = []
+    base_class = object
+
+    for index in range(types):
+        if index % 2 == 0:
+            base_class = object
+        model_class = type(f"BenchmarkModel{index}", (base_class,), {})
+        base_class = model_class
+
+        registry.register(
+            type(
+                f"BenchmarkType{index}",
+                (ModelInstanceMixin, Instance),
+                {"type": f"benchmark-{index}", "model_class": model_class},
+            )()
+        )
+        lookups.append(type(f"BenchmarkModel{index}Proxy", (model_class,), {})())
+        lookups.append(model_class)
+
+    return registry, lookups
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Measures `ModelRegistryMixin.get_by_model` with a growing number of "
+        "registered types, once with the model class index and once with the "
+        "linear walk over all the registered types it replaced. Both must resolve "
+        "the same types. The results are written as JSON so that runs can be "
+        "compared."
+    )
+    report_name = "registry-benchmark"
+
+    def add_benchmark_arguments(self, parser):
+        parser.add_argument(
+            "--types",
+            type=int,
+            nargs="+",
+            default=[10, 100, 500, 1000],
+            help="The numbers of registered types that are measured.",
+        )
+        parser.add_argument(
+            "--lookups",
+            type=int,
+            default=20000,
+            help="The number of lookups per number of types and implementation.",
+        )
+
+    def handle(self, *args, **options):
+        if min(options["types"]) < 1:
+            raise CommandError("At least 1 type must be registered.")
+
+        started_at = datetime.utcnow()
+        results = {}
+
+        for types in options["types"]:
+            registry, lookups = create_registry(types)
+            identical = all(
+                registry.get_by_model(lookup) is get_by_model_linear(registry, lookup)
+                for lookup in lookups
+            )
+            results[str(types)] = {
+                "identical": identical,
+                "indexed": self.measure(
+                    options["lookups"], lookups, registry.get_by_model
+                ),
+                "linear": self.measure(
+                    options["lookups"],
+                    lookups,
+                    lambda lookup: get_by_model_linear(registry, lookup),
+                ),
+            }
+
+        self.write_report(options, started_at, results, lookups=options["lookups"])
+
+    def measure(self, count, lookups, get_by_model):
+        started = time.perf_counter()
+        for index in range(count):
+            get_by_model(lookups[index % len(lookups)])
+        duration = time.perf_counter() - started
+
+        return {
+            "duration_ms": duration * 1000,
+            "us_per_lookup": duration / count * 1000000,
+        }
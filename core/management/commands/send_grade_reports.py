@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.grade_reports import GradeReportJob, GradeReportJobError
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends the grade report of every student of a class or of the whole school "
+        "via the bulk mail queue. The progress is saved after every chunk of "
+        "reports, an interrupted job can be continued with --resume."
+    )
+
+    def add_arguments(self, parser):
+        scope = parser.add_mutually_exclusive_group(required=True)
+        scope.add_argument(
+            "--class",
+            dest="class_id",
+            type=int,
+            help="The id of the class of which the students get their report.",
+        )
+        scope.add_argument(
+            "--school",
+            action="store_true",
+            help="All the students get their report.",
+        )
+        scope.add_argument(
+            "--resume",
+            dest="job_id",
+            help="The id of an interrupted job that must be continued.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            help="The number of students per batch, defaults to "
+                 "GRADE_REPORT_BATCH_SIZE.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="The number of processes rendering the reports, defaults to "
+                 "GRADE_REPORT_WORKERS.",
+        )
+
+    def handle(self, *args, **options):
+        job = GradeReportJob(
+            class_id=options["class_id"],
+            job_id=options["job_id"],
+            batch_size=options["batch_size"],
+            workers=options["workers"],
+        )
+
+        def on_progress(progress):
+            self.stdout.write(
+                f"Job {job.job_id}: {progress['processed']} of {progress['total']} "
+                f"students processed, {progress['skipped']} without an email address."
+            )
+
+        try:
+            progress = job.run(on_progress)
+        except GradeReportJobError as e:
+            raise CommandError(str(e))
+        except KeyboardInterrupt:
+            raise CommandError(
+                f"Job {job.job_id} was interrupted, continue it with "
+                f"--resume {job.job_id}."
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Job {job.job_id} is completed, {progress['queued_chunks']} chunks "
+                f"of reports are queued."
+            )
+        )
@@ -0,0 +1,208 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from django.conf import settings
+from django.core.management.base import CommandError
+from rest_framework_jwt.settings import api_settings
+
+from core.benchmark import BenchmarkCommand, create_users, delete_users, summarize
+
+jwt_payload_handler = api_settings.JWT_PAYLOAD_HANDLER
+jwt_encode_handler = api_settings.JWT_ENCODE_HANDLER
+
+MODES = {"sync": "no", "async": "yes"}
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Measures the throughput of a user read endpoint served by Daphne, once with "
+        "the sync views and once with the async views of ASYNC_USER_READ_VIEWS. A "
+        "server is started per mode with the Daphne based `runserver` of channels, "
+        "unless the URL of an already running server is provided. The user API must "
+        "be routed in the url conf. A temporary user is created and deleted "
+        "afterwards. The results are written as JSON so that runs can be compared."
+    )
+    report_name = "user-view-benchmark"
+
+    def add_benchmark_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=2000,
+            help="The number of requests per mode.",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=32,
+            help="The number of requests that are in flight at the same time.",
+        )
+        parser.add_argument(
+            "--path",
+            default="/api/user/list",
+            help="The path of the endpoint that is requested.",
+        )
+        parser.add_argument(
+            "--port",
+            type=int,
+            default=8765,
+            help="The port of the first Daphne server that is started, the second "
+                 "one gets the next port.",
+        )
+        parser.add_argument(
+            "--sync-url",
+            help="The URL of a running server with the sync views, instead of "
+                 "starting one.",
+        )
+        parser.add_argument(
+            "--async-url",
+            help="The URL of a running server with the async views, instead of "
+                 "starting one.",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=30,
+            help="The number of seconds a server gets to start and a request gets "
+                 "to complete.",
+        )
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1:
+            raise CommandError("The concurrency must be at least 1.")
+
+        self.timeout = options["timeout"]
+        started_at = datetime.utcnow()
+
+        user = create_users(1)[0]
+        token = jwt_encode_handler(jwt_payload_handler(user))
+        prefix = settings.JWT_AUTH["JWT_AUTH_HEADER_PREFIX"]
+        headers = {"Authorization": f"{prefix} {token}"}
+
+        results = {}
+        try:
+            for index, (mode, async_views) in enumerate(MODES.items()):
+                url = options[f"{mode}_url"]
+                server = None
+                if not url:
+                    port = options["port"] + index
+                    server = self.start_server(port, async_views)
+                    url = f"http://127.0.0.1:{port}"
+
+                try:
+                    results[mode] = self.run_workload(
+                        url.rstrip("/") + options["path"],
+                        headers,
+                        options["requests"],
+                        options["concurrency"],
+                    )
+                finally:
+                    if server is not None:
+                        server.terminate()
+                        server.wait()
+        finally:
+            delete_users()
+
+        self.write_report(
+            options,
+            started_at,
+            results,
+            requests=options["requests"],
+            concurrency=options["concurrency"],
+            path=options["path"],
+            settings={
+                "ASYNC_DB_POOL_SIZE": settings.ASYNC_DB_POOL_SIZE,
+                "ASYNC_DB_POOL_MAX_PENDING": settings.ASYNC_DB_POOL_MAX_PENDING,
+            },
+        )
+
+    def start_server(self, port, async_views):
+        """
+        Starts the ASGI application with the Daphne based `runserver` of channels, like
+        docker-compose does, and waits until its health check responds.
+
+        :param port: The port the server listens on.
+        :type port: int
+        :param async_views: The value of ASYNC_USER_READ_VIEWS for the server.
+        :type async_views: str
+        :rtype: subprocess.Popen
+        """
+
+        environment = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE,
+            ASYNC_USER_READ_VIEWS=async_views,
+        )
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "manage.py",
+                "runserver",
+                "--noreload",
+                f"127.0.0.1:{port}",
+            ],
+            cwd=settings.BASE_DIR.parent,
+            env=environment,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+        deadline = time.monotonic() + self.timeout
+        while True:
+            if server.poll() is not None:
+                raise CommandError(f"The Daphne server on port {port} exited.")
+            try:
+                requests.get(f"http://127.0.0.1:{port}/_health", timeout=1)
+                return server
+            except requests.ConnectionError:
+                if time.monotonic() > deadline:
+                    server.terminate()
+                    raise CommandError(
+                        f"The Daphne server on port {port} didn't start."
+                    )
+                time.sleep(0.1)
+
+    def run_workload(self, url, headers, count, concurrency):
+        """
+        Sends `count` GET requests with at most `concurrency` in flight and measures
+        the latency of the successful ones. Requests rejected with a 503 because the
+        database executor is full are counted separately.
+        """
+
+        response = requests.get(url, headers=headers, timeout=self.timeout)
+        if response.status_code != 200:
+            raise CommandError(
+                f"{url} responded with {response.status_code}, is the user API "
+                f"routed?"
+            )
+
+        sessions = threading.local()
+
+        def send(_):
+            if not hasattr(sessions, "session"):
+                sessions.session = requests.Session()
+            started = time.perf_counter()
+            status = sessions.session.get(
+                url, headers=headers, timeout=self.timeout
+            ).status_code
+            return status, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            responses = list(executor.map(send, range(count)))
+        duration = time.perf_counter() - started
+
+        latencies = [latency for status, latency in responses if status == 200]
+        return {
+            "latency": summarize(latencies),
+            "ok": len(latencies),
+            "overloaded": sum(1 for status, _ in responses if status == 503),
+            "failed": sum(1 for status, _ in responses if status not in (200, 503)),
+            "requests_per_second": len(latencies) / duration if duration else None,
+        }
@@ -0,0 +1,103 @@
+import time
+from datetime import datetime
+
+from api.user.serializers import (
+    ChangePasswordBodyValidationSerializer,
+    RegisterSerializer,
+    ResetPasswordBodyValidationSerializer,
+    SendResetPasswordEmailBodyValidationSerializer,
+)
+from core.benchmark import BenchmarkCommand
+from core.exceptions import RequestBodyValidationException
+from core.utils import validate_data, validate_data_compiled
+
+PAYLOADS = {
+    "register": (
+        RegisterSerializer,
+        {
+            "family_name": "Doe",
+            "given_name": "John",
+            "email": "john@example.com",
+            "password": "a-long-secret-1",
+            "authenticate": True,
+        },
+        {
+            "family_name": "D" * 151,
+            "given_name": "",
+            "email": "not-an-email",
+            "password": "123",
+        },
+    ),
+    "change_password": (
+        ChangePasswordBodyValidationSerializer,
+        {"old_password": "a-long-secret-1", "new_password": "a-long-secret-2"},
+        {"new_password": "123"},
+    ),
+    "reset_password": (
+        ResetPasswordBodyValidationSerializer,
+        {"token": "token", "password": "a-long-secret-1"},
+        {"token": "", "password": "password"},
+    ),
+    "send_reset_password_email": (
+        SendResetPasswordEmailBodyValidationSerializer,
+        {"email": "john@example.com", "base_url": "https://example.com/reset"},
+        {"email": "john", "base_url": "example"},
+    ),
+}
+
+
+def validate(validate_function, serializer_class, data):
+    try:
+        return validate_function(serializer_class, data)
+    except RequestBodyValidationException as e:
+        return e.detail
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Measures the validation of the request bodies of the user API that use the "
+        "compiled validation, once with `validate_data` and once with "
+        "`validate_data_compiled`, for valid and invalid bodies. Both must produce "
+        "the same data or errors. The results are written as JSON so that runs can "
+        "be compared."
+    )
+    report_name = "validation-benchmark"
+
+    def add_benchmark_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=5000,
+            help="The number of bodies validated per serializer, body and validator.",
+        )
+
+    def handle(self, *args, **options):
+        count = options["requests"]
+        started_at = datetime.utcnow()
+        results = {}
+
+        for name, (serializer_class, *bodies) in PAYLOADS.items():
+            for kind, data in zip(("valid", "invalid"), bodies):
+                results[f"{name}_{kind}"] = {
+                    "identical": validate(validate_data, serializer_class, data)
+                    == validate(validate_data_compiled, serializer_class, data),
+                    "serializer": self.measure(
+                        count, validate_data, serializer_class, data
+                    ),
+                    "compiled": self.measure(
+                        count, validate_data_compiled, serializer_class, data
+                    ),
+                }
+
+        self.write_report(options, started_at, results, requests=count)
+
+    def measure(self, count, validate_function, serializer_class, data):
+        started = time.perf_counter()
+        for _ in range(count):
+            validate(validate_function, serializer_class, data)
+        duration = time.perf_counter() - started
+
+        return {
+            "duration_ms": duration * 1000,
+            "us_per_request": duration / count * 1000000,
+        }
@@ -0,0 +1,420 @@
+import asyncio
+import time
+from datetime import datetime
+from importlib import import_module
+
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.management.base import CommandError
+from rest_framework_jwt.settings import api_settings
+
+from core.benchmark import (
+    BenchmarkCommand,
+    create_users,
+    delete_users,
+    summarize,
+    use_local_backends,
+)
+from ws.frames import MSGPACK_SUBPROTOCOL, decode_frame, frame_cache
+
+jwt_payload_handler = api_settings.JWT_PAYLOAD_HANDLER
+jwt_encode_handler = api_settings.JWT_ENCODE_HANDLER
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Measures the capacity of the web socket layer by connecting simulated "
+        "clients to the CoreConsumer and the ChatConsumer of the ASGI application, "
+        "using an in memory channel layer. The JWT handshakes are measured with and "
+        "without the cached users. The broadcasts are measured with JSON and "
+        "msgpack frames, shared by all the consumers of the process and encoded per "
+        "socket. Temporary users are created and deleted afterwards. The results "
+        "are written as JSON so that runs can be compared."
+    )
+    report_name = "ws-benchmark"
+
+    def add_benchmark_arguments(self, parser):
+        parser.add_argument(
+            "--clients",
+            type=int,
+            default=100,
+            help="The number of simulated clients per consumer, use 10000 to "
+                 "measure a broadcast to 10k sockets.",
+        )
+        parser.add_argument(
+            "--messages",
+            type=int,
+            default=50,
+            help="The number of broadcasts and chat messages per client pair.",
+        )
+        parser.add_argument(
+            "--workload",
+            choices=["all", "handshake", "broadcast", "chat"],
+            default="all",
+            help="Which workload must be run.",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=10,
+            help="The number of seconds a client waits for a frame.",
+        )
+        parser.add_argument(
+            "--fake-redis",
+            action="store_true",
+            help="Use fakeredis instead of REDIS_URL for the recent chat messages.",
+        )
+
+    def handle(self, *args, **options):
+        if options["clients"] < 2:
+            raise CommandError("At least 2 clients are required.")
+
+        self.timeout = options["timeout"]
+        self.session_keys = []
+        started_at = datetime.utcnow()
+        use_local_backends(options["fake_redis"])
+
+        users = create_users(options["clients"])
+        try:
+            results = asyncio.run(
+                self.run_workloads(users, options["workload"], options["messages"])
+            )
+        finally:
+            self.delete_users()
+
+        self.write_report(
+            options,
+            started_at,
+            results,
+            clients=options["clients"],
+            messages=options["messages"],
+            settings={
+                "WS_SEND_QUEUE_SIZE": settings.WS_SEND_QUEUE_SIZE,
+                "WS_FRAME_CACHE_SIZE": settings.WS_FRAME_CACHE_SIZE,
+                "CHAT_WRITE_BUFFER_INTERVAL_MS": (
+                    settings.CHAT_WRITE_BUFFER_INTERVAL_MS
+                ),
+            },
+        )
+
+    def delete_users(self):
+        session_store = import_module(settings.SESSION_ENGINE).SessionStore
+        for session_key in self.session_keys:
+            session_store(session_key).delete()
+        self.session_keys = []
+
+        delete_users()
+
+    def get_session_cookie(self, user):
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        self.session_keys.append(session.session_key)
+        return f"{settings.SESSION_COOKIE_NAME}={session.session_key}".encode()
+
+    async def connect(
+            self, application, path, headers, wait_for_frame, subprotocols=None
+    ):
+        """
+        Connects a simulated client and returns it with the connect latency. The
+        latency includes the first frame if the consumer sends one after accepting.
+        """
+
+        communicator = WebsocketCommunicator(
+            application, path, headers=headers, subprotocols=subprotocols
+        )
+        started = time.perf_counter()
+        connected, _ = await communicator.connect(timeout=self.timeout)
+
+        if not connected:
+            raise CommandError(f"A simulated client could not connect to {path}.")
+
+        if wait_for_frame:
+            await communicator.receive_output(timeout=self.timeout)
+
+        return communicator, time.perf_counter() - started
+
+    async def receive_timestamps(self, communicator, count, get_sent_at):
+        """
+        Receives `count` frames, text or binary, and returns the latency of every
+        frame based on the timestamp it was sent at and the number of bytes that were
+        received.
+        """
+
+        latencies = []
+        received_bytes = 0
+        for _ in range(count):
+            try:
+                output = await communicator.receive_output(timeout=self.timeout)
+            except asyncio.TimeoutError:
+                break
+            text_data, bytes_data = output.get("text"), output.get("bytes")
+            received_bytes += (
+                len(bytes_data) if bytes_data is not None else len(text_data.encode())
+            )
+            sent_at = get_sent_at(decode_frame(text_data, bytes_data))
+            if sent_at is not None:
+                latencies.append(time.perf_counter() - sent_at)
+        return latencies, received_bytes
+
+    async def run_workloads(self, users, workload, messages):
+        from asgiref.sync import sync_to_async
+
+        cookies = await sync_to_async(
+            lambda: [self.get_session_cookie(user) for user in users]
+        )()
+
+        results = {}
+        if workload in ("all", "handshake"):
+            results["handshake"] = await self.run_handshakes(users)
+        if workload in ("all", "broadcast"):
+            # Every encoding is measured once with the frames shared via the frame
+            # cache and once encoded by every consumer, like before the cache.
+            results["broadcast"] = {}
+            for binary, encoding in ((False, "json"), (True, "msgpack")):
+                for cached in (True, False):
+                    name = encoding if cached else f"{encoding}_per_socket"
+                    results["broadcast"][name] = await self.run_broadcast(
+                        users, messages, binary, cached
+                    )
+        if workload in ("all", "chat"):
+            results["chat"] = await self.run_chat(users, cookies, messages)
+        return results
+
+    async def run_handshakes(self, users):
+        """
+        Connects every user twice at the same time to the CoreConsumer, like a
+        reconnect storm, and measures the JWT handshakes. It's done with an empty
+        user cache with and without batch loading, and with the users cached. The
+        number of user queries is counted.
+        """
+
+        from config.asgi import application
+        from ws import auth
+
+        paths = [
+            f"/ws/core/?jwt_token={jwt_encode_handler(jwt_payload_handler(user))}"
+            for user in users
+        ] * 2
+        queries = []
+        get_users_by_username = auth.get_users_by_username
+        batch_loading = settings.WS_AUTH_BATCH_LOADING
+
+        def count_queries(usernames):
+            queries.append(len(usernames))
+            return get_users_by_username(usernames)
+
+        auth.get_users_by_username = count_queries
+        results = {}
+
+        try:
+            for name, batched, cold in (
+                ("cold_batched", True, True),
+                ("cold_unbatched", False, True),
+                ("warm", True, False),
+            ):
+                settings.WS_AUTH_BATCH_LOADING = batched
+                if cold:
+                    auth.user_loader.clear()
+                queries.clear()
+
+                started = time.perf_counter()
+                connections = await asyncio.gather(
+                    *[
+                        self.connect(application, path, [], wait_for_frame=True)
+                        for path in paths
+                    ]
+                )
+                duration = time.perf_counter() - started
+
+                for communicator, _ in connections:
+                    await communicator.disconnect()
+
+                results[name] = {
+                    "handshake": summarize([latency for _, latency in connections]),
+                    "handshakes_per_second": len(paths) / duration,
+                    "queries": len(queries),
+                }
+        finally:
+            auth.get_users_by_username = get_users_by_username
+            settings.WS_AUTH_BATCH_LOADING = batch_loading
+
+        return results
+
+    async def run_broadcast(self, users, messages, binary, cached):
+        """
+        Connects every user to the CoreConsumer and broadcasts `messages` events to
+        the group all the connections are in.
+
+        :param binary: Whether the clients request the msgpack subprotocol.
+        :type binary: bool
+        :param cached: Whether the consumers share the encoded frames via the frame
+            cache. If not, then every consumer encodes every event itself.
+        :type cached: bool
+        """
+
+        from config.asgi import application
+
+        subprotocols = [MSGPACK_SUBPROTOCOL] if binary else None
+        connections = await asyncio.gather(
+            *[
+                self.connect(
+                    application,
+                    f"/ws/core/?jwt_token={jwt_encode_handler(jwt_payload_handler(u))}",
+                    [],
+                    wait_for_frame=True,
+                    subprotocols=subprotocols,
+                )
+                for u in users
+            ]
+        )
+        communicators = [communicator for communicator, _ in connections]
+
+        receivers = [
+            asyncio.ensure_future(
+                self.receive_timestamps(
+                    communicator, messages, lambda content: content.get("sent_at")
+                )
+            )
+            for communicator in communicators
+        ]
+
+        channel_layer = get_channel_layer()
+        cache_size = frame_cache.max_size
+        if not cached:
+            frame_cache.max_size = 0
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+
+        for index in range(messages):
+            await channel_layer.group_send(
+                "users",
+                {
+                    "type": "broadcast_batch",
+                    "event_id": f"benchmark-{binary}-{cached}-{index}",
+                    "events": [
+                        {
+                            "payload": {
+                                "type": "benchmark",
+                                "sent_at": time.perf_counter(),
+                            },
+                            "ignore_web_socket_id": None,
+                        }
+                    ],
+                },
+            )
+
+        received = await asyncio.gather(*receivers)
+        duration = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        frame_cache.max_size = cache_size
+
+        latencies = [
+            latency for latency_list, _ in received for latency in latency_list
+        ]
+        received_bytes = sum(received_bytes for _, received_bytes in received)
+
+        for communicator in communicators:
+            await communicator.disconnect()
+
+        return {
+            "connect": summarize([latency for _, latency in connections]),
+            "fan_out": summarize(latencies),
+            "expected_deliveries": len(users) * messages,
+            "deliveries": len(latencies),
+            "deliveries_per_second": len(latencies) / duration if duration else None,
+            "cpu_us_per_delivery": (
+                cpu / len(latencies) * 1000000 if latencies else None
+            ),
+            "bytes_per_delivery": (
+                received_bytes / len(latencies) if latencies else None
+            ),
+        }
+
+    async def run_chat(self, users, cookies, messages):
+        """
+        Connects every user to the ChatConsumer via the ASGI application and lets the
+        users send `messages` messages to each other in pairs.
+        """
+
+        from config.asgi import application
+
+        connections = await asyncio.gather(
+            *[
+                self.connect(
+                    application,
+                    "/ws/chat/",
+                    [(b"cookie", cookie)],
+                    wait_for_frame=False,
+                )
+                for cookie in cookies
+            ]
+        )
+        communicators = [communicator for communicator, _ in connections]
+        pairs = [
+            (index, index + 1) for index in range(0, len(communicators) - 1, 2)
+        ]
+        sent_at = {}
+
+        def get_sent_at(content):
+            if content.get("event") != "message":
+                return None
+            return sent_at.get(content["message"])
+
+        # Every receiver gets the messages of its partner, every sender gets a
+        # `message_sent` acknowledgement per message.
+        receivers = [
+            asyncio.ensure_future(
+                self.receive_timestamps(communicators[receiver], messages, get_sent_at)
+            )
+            for _, receiver in pairs
+        ]
+        acknowledgements = [
+            asyncio.ensure_future(
+                self.receive_timestamps(
+                    communicators[sender], messages, lambda content: None
+                )
+            )
+            for sender, _ in pairs
+        ]
+
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+
+        for index in range(messages):
+            for sender, receiver in pairs:
+                message = f"{sender}-{index}"
+                sent_at[message] = time.perf_counter()
+                await communicators[sender].send_json_to(
+                    {
+                        "event": "message",
+                        "receiver_id": users[receiver].id,
+                        "message": message,
+                    }
+                )
+
+        latencies = [
+            latency for latency_list, _ in await asyncio.gather(*receivers)
+            for latency in latency_list
+        ]
+        await asyncio.gather(*acknowledgements)
+        duration = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+
+        for communicator in communicators:
+            await communicator.disconnect()
+
+        return {
+            "connect": summarize([latency for _, latency in connections]),
+            "delivery": summarize(latencies),
+            "expected_deliveries": len(pairs) * messages,
+            "deliveries": len(latencies),
+            "messages_per_second": len(latencies) / duration if duration else None,
+            "cpu_us_per_message": (
+                cpu / len(latencies) * 1000000 if latencies else None
+            ),
+        }
@@ -0,0 +1,231 @@
+import asyncio
+import threading
+import time
+from datetime import datetime
+
+from celery.signals import task_postrun
+from django.conf import settings
+from django.core.management.base import CommandError
+
+from config.celery import app
+from core.benchmark import BenchmarkCommand, use_local_backends
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "Measures the throughput of the broadcast tasks by sending events through a "
+        "Celery worker using the in memory transport of the broker, once with a task "
+        "per event and once with the batched task, and the overhead of sending from "
+        "sync code. The results are written as JSON so that runs can be compared."
+    )
+    report_name = "ws-task-benchmark"
+
+    def add_benchmark_arguments(self, parser):
+        parser.add_argument(
+            "--events",
+            type=int,
+            default=2000,
+            help="The number of events per workload.",
+        )
+        parser.add_argument(
+            "--recipients",
+            type=int,
+            default=10,
+            help="The number of users every event is broadcasted to.",
+        )
+        parser.add_argument(
+            "--workload",
+            choices=["all", "single", "batched", "overhead"],
+            default="all",
+            help="Which workload must be run.",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=60,
+            help="The number of seconds the worker gets to process all the events.",
+        )
+
+    def handle(self, *args, **options):
+        from celery.contrib.testing.worker import start_worker
+
+        import ws.tasks  # noqa: F401 registers the tasks.
+
+        self.timeout = options["timeout"]
+        started_at = datetime.utcnow()
+        use_local_backends()
+        # The app reads its configuration from the Django settings with the CELERY
+        # namespace, the namespaced keys take precedence over the plain ones.
+        app.conf.update(
+            CELERY_BROKER_URL="memory://",
+            # The memory transport polls once per second by default, which would
+            # dominate the duration of the batched workload.
+            CELERY_BROKER_TRANSPORT_OPTIONS={"polling_interval": 0.01},
+            CELERY_RESULT_BACKEND=None,
+            CELERY_TASK_ALWAYS_EAGER=False,
+            CELERY_TASK_IGNORE_RESULT=True,
+        )
+
+        # Every recipient gets a member in the channel layer, otherwise the group
+        # sends would not do anything.
+        asyncio.run(self.add_members(options["recipients"]))
+
+        self.processed = 0
+        self.processed_changed = threading.Condition()
+        task_postrun.connect(self.count_processed, weak=False)
+
+        results = {}
+        try:
+            with start_worker(app, pool="solo", perform_ping_check=False):
+                if options["workload"] in ("all", "single"):
+                    results["single"] = self.run_single(
+                        options["events"], options["recipients"]
+                    )
+                if options["workload"] in ("all", "batched"):
+                    results["batched"] = self.run_batched(
+                        options["events"], options["recipients"]
+                    )
+        finally:
+            task_postrun.disconnect(self.count_processed)
+
+        if options["workload"] in ("all", "overhead"):
+            results["overhead"] = self.run_overhead(options["events"])
+
+        self.write_report(
+            options,
+            started_at,
+            results,
+            events=options["events"],
+            recipients=options["recipients"],
+            settings={
+                "WS_TASK_BATCH_WINDOW_MS": settings.WS_TASK_BATCH_WINDOW_MS,
+                "WS_TASK_BATCH_SIZE": settings.WS_TASK_BATCH_SIZE,
+            },
+        )
+
+    async def add_members(self, recipients):
+        from channels.layers import get_channel_layer
+
+        from ws.utils import get_user_group_name
+
+        channel_layer = get_channel_layer()
+        for user_id in range(recipients):
+            await channel_layer.group_add(
+                get_user_group_name(user_id), f"ws-task-benchmark-{user_id}"
+            )
+
+    def count_processed(self, sender=None, args=None, **kwargs):
+        if sender.name == "ws.tasks.broadcast_batch":
+            count = len(args[0])
+        else:
+            count = 1
+
+        with self.processed_changed:
+            self.processed += count
+            self.processed_changed.notify_all()
+
+    def measure(self, events, send):
+        """
+        Calls `send` and waits until the worker has processed `events` events.
+        """
+
+        with self.processed_changed:
+            self.processed = 0
+
+        cpu_started = time.process_time()
+        started = time.perf_counter()
+        send()
+        enqueued = time.perf_counter() - started
+
+        with self.processed_changed:
+            if not self.processed_changed.wait_for(
+                lambda: self.processed >= events, timeout=self.timeout
+            ):
+                raise CommandError(
+                    f"Only {self.processed} of {events} events have been processed."
+                )
+
+        duration = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+
+        return {
+            "enqueue_ms": enqueued * 1000,
+            "duration_ms": duration * 1000,
+            "events_per_second": events / duration,
+            "cpu_us_per_event": cpu / events * 1000000,
+        }
+
+    def run_single(self, events, recipients):
+        """Sends a `broadcast_to_users` task per event."""
+
+        from ws.tasks import broadcast_to_users
+
+        def send():
+            for index in range(events):
+                broadcast_to_users.delay(
+                    list(range(recipients)), {"type": "benchmark", "index": index}
+                )
+
+        return dict(self.measure(events, send), tasks=events)
+
+    def run_batched(self, events, recipients):
+        """Collects the events with the task batcher of the publisher."""
+
+        from ws import publisher
+
+        tasks = []
+
+        def send():
+            for index in range(events):
+                publisher.delay_broadcast_to_users(
+                    list(range(recipients)), {"type": "benchmark", "index": index}
+                )
+            publisher.task_batcher.flush()
+
+        def count_task(sender=None, **kwargs):
+            if sender.name == "ws.tasks.broadcast_batch":
+                tasks.append(1)
+
+        task_postrun.connect(count_task, weak=False)
+        try:
+            result = self.measure(events, send)
+        finally:
+            task_postrun.disconnect(count_task)
+
+        return dict(result, tasks=len(tasks))
+
+    def run_overhead(self, events):
+        """
+        Measures what a single `group_send` from sync code costs, once wrapped in
+        `async_to_sync` and once submitted to the async runtime of the process.
+        """
+
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+
+        from ws.runtime import async_runtime
+
+        channel_layer = get_channel_layer()
+        message = {"type": "broadcast_batch", "event_id": "benchmark", "events": []}
+
+        def measure(send):
+            started = time.perf_counter()
+            for index in range(events):
+                send(f"user-{index % 10}", message)
+            return (time.perf_counter() - started) / events * 1000000
+
+        # Starts the loop of the runtime, so that it's not part of the measurement.
+        async_runtime.get_loop()
+
+        return {
+            "async_to_sync_us_per_send": measure(
+                lambda group, message: async_to_sync(channel_layer.group_send)(
+                    group, message
+                )
+            ),
+            "runtime_us_per_send": measure(
+                lambda group, message: async_runtime.submit(
+                    channel_layer.group_send, group, message
+                )
+            ),
+        }
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.10 on 2026-10-19 18:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_chatmessage'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='chatmessage',
+            name='chat_message_conv_id_idx',
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['conversation_id', 'created_at', 'message_id'], name='chat_message_conv_created_idx'),
+        ),
+    ]
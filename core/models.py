@@ -158,6 +158,45 @@ class UserPin(TimeStampMixin):
         self.save()
         return self
 
+
+class ChatMessage(models.Model):
+    """
+    A message sent from one user to another. Messages are append only, they are
+    written in bulk by the chat write buffer and never updated. The history of a
+    conversation is paginated by (conversation_id, created_at, message_id), because
+    the messages that are not inserted yet don't have an id.
+    """
+
+    message_id = models.CharField(max_length=32, unique=True)
+    conversation_id = models.CharField(max_length=64)
+    sender = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="sent_chat_messages"
+    )
+    receiver = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="received_chat_messages"
+    )
+    message = models.TextField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "chat_message"
+        indexes = [
+            models.Index(
+                fields=["conversation_id", "created_at", "message_id"],
+                name="chat_message_conv_created_idx",
+            ),
+        ]
+
+    def to_dict(self):
+        return {
+            "message_id": self.message_id,
+            "conversation_id": self.conversation_id,
+            "sender_id": self.sender_id,
+            "receiver_id": self.receiver_id,
+            "message": self.message,
+            "created_at": self.created_at.isoformat(),
+        }
+
 # class UserLogEntry(models.Model):
 #     actor = models.ForeignKey(User, on_delete=models.CASCADE)
 #     action = models.CharField(max_length=20, choices=(("SIGNED_IN", "Signed in"),))
@@ -31,9 +31,63 @@ class ModelInstanceMixin:
 
 
 class ModelRegistryMixin:
+    def register(self, instance):
+        super().register(instance)
+        self._build_model_index()
+
+    def unregister(self, value):
+        super().unregister(value)
+        self._build_model_index()
+
+    def _build_model_index(self):
+        """
+        Rebuilds the index of registered values keyed by their model class and resets
+        the lookup cache. Must be called every time the registry changes so that
+        `get_by_model` never returns a stale value.
+        """
+
+        model_index = {}
+        for value in self.registry.values():
+            # When the same model class is registered more than once the first
+            # registered value wins, which matches the previous linear lookup.
+            model_index.setdefault(value.model_class, value)
+
+        self._model_index = model_index
+        self._model_lookup_cache = {}
+
+    def _resolve_by_model_class(self, model_class, is_class):
+        """
+        Finds the most specific registered value for the provided class by walking
+        its mro. If `is_class` is true, then only an exact match is allowed because
+        the provided value was the class itself and not an instance of it.
+        """
+
+        model_index = self._model_index
+
+        if is_class:
+            return model_index.get(model_class)
+
+        most_specific_value = None
+        most_specific_num_base_classes = 0
+        for clazz in model_class.__mro__:
+            value = model_index.get(clazz)
+            if value is None:
+                continue
+            # There might be values where one is a sub type of another. The one with
+            # the longer mro is the more specific type (it inherits from more base
+            # classes)
+            value_num_base_classes = len(clazz.__mro__)
+            if value_num_base_classes > most_specific_num_base_classes:
+                most_specific_value = value
+                most_specific_num_base_classes = value_num_base_classes
+
+        return most_specific_value
+
     def get_by_model(self, model_instance):
         """
-        Returns a registered instance of the given model class.
+        Returns a registered instance of the given model class. The lookups are
+        memoized per model class, so resolving the same class again is a single dict
+        lookup. The memo is reset when an instance is registered or unregistered.
 
         :param model_instance: The value that must be or must be an instance of the
             model_class.
@@ -44,24 +98,18 @@ class ModelRegistryMixin:
         :rtype: Instance
         """
 
-        most_specific_value = None
-        for value in self.registry.values():
-            value_model_class = value.model_class
-            if value_model_class == model_instance or isinstance(
-                    model_instance, value_model_class
-            ):
-                if most_specific_value is None:
-                    most_specific_value = value
-                else:
-                    # There might be values where one is a sub type of another. The
-                    # one with the longer mro is the more specific type (it inherits
-                    # from more base classes)
-                    most_specific_num_base_classes = len(
-                        most_specific_value.model_class.mro()
-                    )
-                    value_num_base_classes = len(value_model_class.mro())
-                    if value_num_base_classes > most_specific_num_base_classes:
-                        most_specific_value = value
+        if getattr(self, "_model_index", None) is None:
+            self._build_model_index()
+
+        is_class = isinstance(model_instance, type)
+        model_class = model_instance if is_class else type(model_instance)
+        cache_key = (model_class, is_class)
+
+        try:
+            most_specific_value = self._model_lookup_cache[cache_key]
+        except KeyError:
+            most_specific_value = self._resolve_by_model_class(model_class, is_class)
+            self._model_lookup_cache[cache_key] = most_specific_value
 
         if most_specific_value is not None:
             return most_specific_value
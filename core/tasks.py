@@ -0,0 +1,44 @@
+from celery.exceptions import SoftTimeLimitExceeded
+from celery.utils.log import get_task_logger
+
+from config.celery import app
+
+logger = get_task_logger(__name__)
+
+
+@app.task(bind=True, ignore_result=False)
+def send_bulk_mail(self, messages):
+    """
+    Sends a chunk of email messages over a single SMTP connection.
+
+    :param messages: The messages as dicts, see `djcelery_email.utils.email_to_dict`.
+    :type messages: list
+    :return: The result of every recipient.
+    :rtype: list
+    """
+
+    from djcelery_email.utils import dict_to_email
+
+    from core.bulk_mail import FAILED, BulkMailSender
+
+    sender = BulkMailSender()
+    try:
+        results = sender.send([dict_to_email(message) for message in messages])
+    except SoftTimeLimitExceeded:
+        # The messages that have not been handled yet are sent by a new attempt of
+        # the task, instead of being lost when the hard time limit kills it.
+        remaining = messages[sender.processed:]
+        logger.warning(
+            "Soft time limit exceeded, retrying %s of %s messages.",
+            len(remaining),
+            len(messages),
+        )
+        raise self.retry(args=(remaining,), countdown=0)
+
+    failed = sum(1 for result in results if result["status"] == FAILED)
+    if failed:
+        logger.warning(
+            "%s of %s recipients did not receive their email.", failed, len(results)
+        )
+
+    return results
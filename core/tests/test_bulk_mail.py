@@ -0,0 +1,207 @@
+import re
+import socketserver
+import threading
+from unittest import mock
+
+from celery.exceptions import SoftTimeLimitExceeded
+from django.core.mail import EmailMessage
+from django.test import SimpleTestCase, override_settings
+from djcelery_email.utils import email_to_dict
+
+from core.bulk_mail import FAILED, SENT, BulkMailSender
+from core.tasks import send_bulk_mail
+
+SMTP_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+
+
+class SMTPStandInHandler(socketserver.StreamRequestHandler):
+    """
+    Speaks just enough SMTP for `smtplib`. Every connection is a session, the
+    replies to RCPT can be scripted per recipient.
+    """
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        session = self.server.start_session()
+        self.reply("220 localhost SMTP stand-in")
+        mail_from, recipients = None, []
+
+        for line in self.rfile:
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            address = re.search(r"<(.*?)>", command)
+            address = address.group(1) if address else None
+
+            if verb in ("EHLO", "HELO", "NOOP"):
+                self.reply("250 localhost")
+            elif verb == "MAIL":
+                mail_from, recipients = address, []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                reply = self.server.get_rcpt_reply(address)
+                if reply.startswith("250"):
+                    recipients.append(address)
+                self.reply(reply)
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                for data_line in self.rfile:
+                    if data_line == b".\r\n":
+                        break
+                self.server.received.append((session, mail_from, recipients))
+                self.reply("250 OK")
+            elif verb == "RSET":
+                mail_from, recipients = None, []
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), SMTPStandInHandler)
+        self.lock = threading.Lock()
+        self.sessions = 0
+        self.received = []
+        # The replies to RCPT per recipient, consumed in order. Recipients without
+        # a scripted reply are accepted.
+        self.rcpt_replies = {}
+
+    def start_session(self):
+        with self.lock:
+            self.sessions += 1
+            return self.sessions
+
+    def get_rcpt_reply(self, address):
+        with self.lock:
+            replies = self.rcpt_replies.get(address)
+            return replies.pop(0) if replies else "250 OK"
+
+
+def create_message(recipient):
+    return EmailMessage("Subject", "Body", "sender@example.com", [recipient])
+
+
+class BulkMailTestCase(SimpleTestCase):
+    def setUp(self):
+        self.server = SMTPStandIn()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        settings = override_settings(
+            EMAIL_HOST="127.0.0.1",
+            EMAIL_PORT=self.server.server_address[1],
+            EMAIL_HOST_USER="",
+            EMAIL_HOST_PASSWORD="",
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+            BULK_MAIL_BACKEND=SMTP_BACKEND,
+            BULK_MAIL_MAX_RETRIES=3,
+            BULK_MAIL_RETRY_DELAY=0,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def send(self, recipients):
+        return BulkMailSender().send([create_message(r) for r in recipients])
+
+    def get_statuses(self, results):
+        return [(r["recipient"], r["status"], r["attempts"]) for r in results]
+
+    def test_messages_of_a_chunk_share_a_session(self):
+        recipients = ["a@example.com", "b@example.com", "c@example.com"]
+        results = self.send(recipients)
+
+        self.assertEqual(
+            self.get_statuses(results), [(r, SENT, 1) for r in recipients]
+        )
+        self.assertEqual(self.server.sessions, 1)
+        self.assertEqual(
+            self.server.received,
+            [(1, "sender@example.com", [r]) for r in recipients],
+        )
+
+    def test_transient_error_is_retried_on_a_new_connection(self):
+        self.server.rcpt_replies["b@example.com"] = ["451 Try again later"]
+        results = self.send(["a@example.com", "b@example.com", "c@example.com"])
+
+        self.assertEqual(
+            self.get_statuses(results),
+            [
+                ("a@example.com", SENT, 1),
+                ("b@example.com", SENT, 2),
+                ("c@example.com", SENT, 1),
+            ],
+        )
+        # The retry and the messages after it use the new session.
+        self.assertEqual(self.server.sessions, 2)
+        self.assertEqual(
+            [(session, to) for session, _, to in self.server.received],
+            [(1, ["a@example.com"]), (2, ["b@example.com"]), (2, ["c@example.com"])],
+        )
+
+    def test_transient_error_gives_up_after_the_retries(self):
+        self.server.rcpt_replies["b@example.com"] = ["451 Try again later"] * 4
+        with self.assertLogs("core.bulk_mail", "WARNING"):
+            results = self.send(["b@example.com"])
+
+        self.assertEqual(self.get_statuses(results), [("b@example.com", FAILED, 4)])
+        self.assertIn("451", results[0]["error"])
+        self.assertEqual(self.server.sessions, 4)
+
+    def test_permanent_error_only_fails_its_recipient(self):
+        self.server.rcpt_replies["b@example.com"] = ["550 No such user"]
+        with self.assertLogs("core.bulk_mail", "WARNING"):
+            results = self.send(["a@example.com", "b@example.com", "c@example.com"])
+
+        self.assertEqual(
+            self.get_statuses(results),
+            [
+                ("a@example.com", SENT, 1),
+                ("b@example.com", FAILED, 1),
+                ("c@example.com", SENT, 1),
+            ],
+        )
+        self.assertIn("550", results[1]["error"])
+        # A refused recipient doesn't break the session, so it's not reopened.
+        self.assertEqual(self.server.sessions, 1)
+
+    def test_soft_time_limit_retries_the_remaining_messages(self):
+        recipients = [f"{index}@example.com" for index in range(5)]
+        send_message = BulkMailSender.send_message
+        calls = []
+
+        def send_message_until_time_limit(sender, connection, message):
+            calls.append(message.to)
+            if len(calls) == 3:
+                raise SoftTimeLimitExceeded()
+            return send_message(sender, connection, message)
+
+        with mock.patch.object(
+            BulkMailSender, "send_message", send_message_until_time_limit
+        ), mock.patch("core.tasks.logger") as logger:
+            result = send_bulk_mail.apply(
+                args=([email_to_dict(create_message(r)) for r in recipients],)
+            )
+
+        # The retry only gets the messages that were not handled, starting with the
+        # one that was interrupted.
+        logger.warning.assert_any_call(
+            "Soft time limit exceeded, retrying %s of %s messages.", 3, 5
+        )
+        self.assertEqual(
+            [to for _, _, to in self.server.received], [[r] for r in recipients]
+        )
+        self.assertEqual(self.server.sessions, 2)
+        # Eagerly applied tasks run the retry right away.
+        self.assertEqual(
+            self.get_statuses(result.get()), [(r, SENT, 1) for r in recipients[2:]]
+        )
@@ -0,0 +1,292 @@
+from collections import OrderedDict, defaultdict
+from datetime import date, time
+
+from django.template import Context, Engine
+from django.template.loader import render_to_string
+from django.test import SimpleTestCase, override_settings
+from django.utils import translation
+from django.utils.html import strip_tags
+
+from core.email_templates import EmailTemplate, email_templates, render_cached_value
+
+PARENT = (
+    "<html><head><style>p{color:red}</style></head>"
+    "{% block content %}{% endblock %}</html>"
+)
+
+
+class Pairs:
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+    def __iter__(self):
+        return iter(self.pairs)
+
+
+def slice_uncompiled(html):
+    """Slices like the email messages did before the templates were compiled."""
+
+    try:
+        html = html[html.index("<body>"):html.index("</body>")]
+    except ValueError:
+        pass
+    return html, strip_tags(html)
+
+
+class EmailTemplateTestCase(SimpleTestCase):
+    def get_template(self, name, **templates):
+        engine = Engine(
+            loaders=[("django.template.loaders.locmem.Loader", templates)],
+        )
+        return engine.get_template(name)
+
+    def assertRendersLikeUncompiled(self, template, context):
+        self.assertEqual(
+            tuple(EmailTemplate(template).render(context)),
+            slice_uncompiled(template.render(Context(context))),
+        )
+
+    def assertRendersSourceLikeUncompiled(self, source, contexts):
+        template = self.get_template("mail.html", **{"mail.html": source})
+        for context in contexts:
+            with self.subTest(source=source, context=context):
+                self.assertRendersLikeUncompiled(template, context)
+
+    def test_body_of_the_static_skeleton(self):
+        template = self.get_template(
+            "mail.html",
+            **{
+                "mail.html": "<html><head><style>p{color:red}</style></head><body>"
+                             "<p>Hi {{ name }}</p>{% for item in items %}<b>{{ item }}"
+                             "</b>{% endfor %}</body></html>"
+            },
+        )
+
+        self.assertFalse(EmailTemplate(template).slice_rendered)
+        self.assertRendersLikeUncompiled(template, {"name": "N", "items": [1, 2]})
+
+    def test_body_in_a_block_of_a_parent_template(self):
+        template = self.get_template(
+            "child.html",
+            **{
+                "parent.html": PARENT,
+                "child.html": "{% extends 'parent.html' %}{% block content %}"
+                              "<body><p>Hi {{ name }}</p></body>{% endblock %}",
+            },
+        )
+
+        rendered = EmailTemplate(template).render({"name": "N"})
+        self.assertEqual(rendered.html, "<body><p>Hi N</p>")
+        self.assertEqual(rendered.text, "Hi N")
+        self.assertRendersLikeUncompiled(template, {"name": "N"})
+
+    def test_body_inside_a_condition(self):
+        template = self.get_template(
+            "mail.html",
+            **{
+                "mail.html": "<html><head><style>p{color:red}</style></head>"
+                             "{% if name %}<body><p>Hi {{ name }}</p></body>"
+                             "{% endif %}</html>"
+            },
+        )
+
+        self.assertTrue(EmailTemplate(template).slice_rendered)
+        self.assertRendersLikeUncompiled(template, {"name": "N"})
+        self.assertRendersLikeUncompiled(template, {"name": ""})
+
+    def test_without_body(self):
+        template = self.get_template(
+            "mail.html", **{"mail.html": "<p>Hi {{ name }}</p>"}
+        )
+
+        self.assertRendersLikeUncompiled(template, {"name": "<N>"})
+
+    def test_without_slicing_the_body(self):
+        template = self.get_template(
+            "mail.html",
+            **{"mail.html": "<html><body><p>Hi {{ name }}</p></body></html>"},
+        )
+
+        rendered = EmailTemplate(template, body=False).render({"name": "N"})
+        self.assertEqual(rendered.html, "<html><body><p>Hi N</p></body></html>")
+
+    def test_project_templates(self):
+        contexts = {
+            "report-grade.html": {
+                "full_name": "Student",
+                "term1": [
+                    {
+                        "subject_name": "Math",
+                        "ASSIGNMENT": 7.5,
+                        "MIDDLE": 8,
+                        "FINAL": 9.25,
+                        "AVG": 8.6,
+                    }
+                ],
+                "term2": [],
+                "gpa1": 8.6,
+                "gpa2": 0,
+            },
+            "info-class.html": {
+                "list_time_table_res": [
+                    {
+                        "name_subject": "Math",
+                        "name_teacher": "Teacher <1>",
+                        "time_table": {
+                            "day_of_week": 2,
+                            "time_start": time(7, 0),
+                            "time_end": time(8, 30),
+                        },
+                    }
+                ]
+            },
+        }
+
+        for template_name, context in contexts.items():
+            with self.subTest(template_name):
+                self.assertEqual(
+                    tuple(email_templates.render(template_name, context)),
+                    slice_uncompiled(render_to_string(template_name, context)),
+                )
+
+    def test_empty_loops(self):
+        self.assertRendersSourceLikeUncompiled(
+            "<ul>{% for item in items %}<li>{{ item }}</li>{% empty %}<li>None for "
+            "{{ name }}</li>{% endfor %}</ul>",
+            [{"items": [], "name": "N"}, {"items": None}, {}, {"items": ["<a>"]}],
+        )
+
+    def test_loop_unpacking(self):
+        source = (
+            "{% for key, value in pairs %}<p>{{ key }}: {{ value }}</p>{% endfor %}"
+        )
+        self.assertRendersSourceLikeUncompiled(
+            source,
+            [
+                {"pairs": [("a", 1), ["b", 2.5]]},
+                {"pairs": {"a": 1, "b": None}.items()},
+                # An iterable without a length, it's iterated by both renders.
+                {"pairs": Pairs([("a", date(2022, 5, 1))])},
+            ],
+        )
+
+        # Both raise the same error for items of the wrong length.
+        template = self.get_template("mail.html", **{"mail.html": source})
+        for pairs in ([("a", 1, 2)], [1]):
+            with self.subTest(pairs=pairs):
+                with self.assertRaises(ValueError) as expected:
+                    template.render(Context({"pairs": pairs}))
+                with self.assertRaises(ValueError) as result:
+                    EmailTemplate(template).render({"pairs": pairs})
+                self.assertEqual(str(result.exception), str(expected.exception))
+
+    def test_nested_loops(self):
+        self.assertRendersSourceLikeUncompiled(
+            "{% for row in rows %}<tr>{% for cell in row %}<td>"
+            "{{ forloop.parentloop.counter }}.{{ forloop.counter }} "
+            "{{ forloop.parentloop.last }} {{ forloop.first }} "
+            "{{ forloop.revcounter0 }} {{ cell }}</td>{% empty %}<td>"
+            "{{ forloop.counter0 }}</td>{% endfor %}</tr>{% endfor %}"
+            "{{ forloop.counter }}",
+            [{"rows": [[1, 2], [], ["<3>"]]}, {"rows": []}],
+        )
+        self.assertRendersSourceLikeUncompiled(
+            "{% for a in outer %}{% for b in inner reversed %}"
+            "{% if forloop.parentloop.first %}{{ a }}{{ b }}{% endif %}"
+            "{% endfor %}{% endfor %}",
+            [{"outer": [1, 2], "inner": "xy"}],
+        )
+
+    def test_autoescape_off(self):
+        self.assertRendersSourceLikeUncompiled(
+            "<p>{{ html }}</p>{% autoescape off %}<p>{{ html }}"
+            "{% for item in items %}{{ item }}{{ item|upper }}{% endfor %}"
+            "{% if html %}{{ html }}{% endif %}</p>{% endautoescape %}"
+            "<p>{{ html }}{% if html %}{{ html }}{% endif %}</p>",
+            [{"html": "<b>&</b>", "items": ["<i>", 1.5]}],
+        )
+
+    def test_callables(self):
+        class Student:
+            name = "<Student>"
+
+            def get_name(self):
+                return self.name
+
+        def get_grades():
+            return {"math": 9}
+
+        def not_called():
+            return "called"
+
+        not_called.do_not_call_in_templates = True
+
+        self.assertRendersSourceLikeUncompiled(
+            "{{ student.get_name }} {{ get_grades.math }} {{ data.get_grades.math }} "
+            "{{ data.count }} {{ not_called }} {{ student.name }} {{ data.items }}",
+            [
+                {
+                    "student": Student(),
+                    "get_grades": get_grades,
+                    "data": {"get_grades": get_grades, "count": lambda: 3},
+                    "not_called": not_called,
+                }
+            ],
+        )
+
+    def test_dict_subclasses(self):
+        class Grades(dict):
+            @property
+            def average(self):
+                return sum(self.values()) / len(self)
+
+        self.assertRendersSourceLikeUncompiled(
+            "{% for grades in rows %}{{ grades.math }} {{ grades.average }} "
+            "{{ grades.missing }} {{ grades.items }}|{% endfor %}"
+            "{{ ordered.first }} {{ default.missing }} {{ plain.keys }} "
+            "{{ plain.nested.value }} {{ plain.nested.missing.value }}",
+            [
+                {
+                    "rows": [Grades(math=8, art=9.5)],
+                    "ordered": OrderedDict(first="<1>"),
+                    "default": defaultdict(lambda: "default"),
+                    "plain": {"keys": "own key", "nested": {"value": 1}},
+                }
+            ],
+        )
+
+    def test_filters(self):
+        self.assertRendersSourceLikeUncompiled(
+            '{{ grade|floatformat:1 }} {{ name|upper }} {{ missing|default:"-" }} '
+            '{{ html|safe }} {{ html|striptags }} {{ start|time:"H:i" }} '
+            "{% for g in grades %}{{ g|floatformat }}{{ g|add:1 }}{% endfor %}",
+            [
+                {
+                    "grade": 8.25,
+                    "name": "<n>",
+                    "html": "<b>x</b>",
+                    "start": time(7, 30),
+                    "grades": [1, 2.5, -0.0],
+                }
+            ],
+        )
+
+    @override_settings(USE_L10N=True, USE_THOUSAND_SEPARATOR=True)
+    def test_cached_values_per_language(self):
+        render_cached_value.cache_clear()
+        contexts = [
+            {"values": [1234.5, 1234, 1.0, 1, True, -0.0, 0.0, date(2022, 5, 1)]},
+        ]
+        source = "{% for value in values %}{{ value }}|{% endfor %}{{ at }}"
+
+        for language in ("en", "de", "en"):
+            with self.subTest(language=language), translation.override(language):
+                self.assertRendersSourceLikeUncompiled(
+                    source, [dict(contexts[0], at=time(7, 5))]
+                )
+
+        with translation.override("de"):
+            template = self.get_template("mail.html", **{"mail.html": source})
+            self.assertIn(
+                "1.234,5", EmailTemplate(template).render(contexts[0]).html
+            )
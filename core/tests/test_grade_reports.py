@@ -0,0 +1,234 @@
+import random
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+
+from core.grade_reports import (
+    GRADE_TYPES,
+    GradeReportJob,
+    GradeReportSource,
+    compute_averages,
+    compute_gpas,
+    round_grades,
+)
+from utils.helper import cal_avg_grade, cal_gpa
+
+# Grades of which the weighted averages and GPAs land on or next to a half when
+# scaled by ten, where the rounding of NumPy and Python can differ.
+TIE_GRADES = [0.05, 0.15, 0.25, 0.35, 1.45, 2.675, 4.55, 8.25, 8.35, 9.95, 10]
+
+
+def generate_subjects(count, seed):
+    """
+    :return: The assignment, middle and final grade of every subject. A grade is
+        missing, zero or a value on a 0.05 grid, or one of the tie values.
+    :rtype: list
+    """
+
+    generator = random.Random(seed)
+
+    def grade():
+        kind = generator.random()
+        if kind < 0.1:
+            return None
+        if kind < 0.15:
+            return 0
+        if kind < 0.4:
+            return generator.choice(TIE_GRADES)
+        return round(generator.randrange(0, 201) * 0.05, 2)
+
+    return [[grade() for _ in GRADE_TYPES] for _ in range(count)]
+
+
+class GradeComputationTestCase(SimpleTestCase):
+    def test_round_grades(self):
+        values = [value / 100 for value in range(0, 1001)] + [
+            0.05,
+            0.15,
+            0.25,
+            2.675,
+            8.45,
+            -0.05,
+        ]
+        self.assertEqual(
+            round_grades(np.array(values)).tolist(),
+            [round(value, 1) for value in values],
+        )
+
+    def test_averages_and_gpas_like_the_helpers(self):
+        for seed in range(5):
+            subjects = generate_subjects(2000, seed)
+            # Ten subjects per student and term.
+            groups = np.arange(len(subjects)) // 10
+
+            with self.subTest(seed=seed):
+                averages = compute_averages(
+                    np.array(
+                        [
+                            [np.nan if value is None else value for value in grades]
+                            for grades in subjects
+                        ],
+                        dtype=float,
+                    )
+                )
+                expected_averages = [
+                    cal_avg_grade(dict(zip(GRADE_TYPES, grades)))
+                    for grades in subjects
+                ]
+                self.assertEqual(
+                    [None if np.isnan(a) else a for a in averages.tolist()],
+                    expected_averages,
+                )
+
+                gpas = compute_gpas(averages, groups, groups[-1] + 1)
+                for group, gpa in enumerate(gpas.tolist()):
+                    rows = [
+                        {"AVG": average}
+                        for average, average_group in zip(expected_averages, groups)
+                        if average_group == group and average is not None
+                    ]
+                    if rows:
+                        self.assertEqual(gpa, cal_gpa(rows))
+                    else:
+                        self.assertTrue(np.isnan(gpa))
+
+    def test_tie_values(self):
+        subjects = [[value, value, value] for value in TIE_GRADES] + [
+            [8.25, None, None],
+            [None, 4.55, 0],
+            [0.05, 0.15, 0.25],
+        ]
+        averages = compute_averages(np.array(subjects, dtype=float))
+
+        self.assertEqual(
+            averages.tolist(),
+            [cal_avg_grade(dict(zip(GRADE_TYPES, grades))) for grades in subjects],
+        )
+        self.assertEqual(
+            compute_gpas(averages, np.zeros(len(subjects), dtype=np.int64), 1)[0],
+            cal_gpa([{"AVG": average} for average in averages.tolist()]),
+        )
+
+
+class MemorySource(GradeReportSource):
+    def __init__(self, students):
+        self.students = students
+
+    def count_students(self, class_id):
+        return len(self.students)
+
+    def get_students(self, class_id, after, limit):
+        return [s for s in self.students if s[0] > after][:limit]
+
+    def get_grades(self, student_ids):
+        return [
+            (student_id, 1, "Math", grade_type, 8)
+            for student_id in student_ids
+            for grade_type in GRADE_TYPES
+        ]
+
+
+class MemoryProgress:
+    def __init__(self):
+        self.jobs = {}
+        self.updates = []
+
+    def create(self, class_id, total):
+        self.jobs["job"] = {
+            "class_id": class_id,
+            "status": "running",
+            "total": total,
+            "processed": 0,
+            "skipped": 0,
+            "queued_chunks": 0,
+            "last_student_id": 0,
+        }
+        return "job"
+
+    def get(self, job_id):
+        return dict(self.jobs[job_id]) if job_id in self.jobs else None
+
+    def update(self, job_id, **fields):
+        self.jobs[job_id].update(fields)
+        self.updates.append(fields)
+
+
+@override_settings(BULK_MAIL_CHUNK_SIZE=3, FROM_EMAIL="school@example.com")
+class GradeReportJobTestCase(SimpleTestCase):
+    def setUp(self):
+        # Students 4 and 8 don't have an email address.
+        self.students = [
+            (index, f"Student {index}", None if index % 4 == 0 else f"{index}@x.io")
+            for index in range(1, 11)
+        ]
+        self.source = MemorySource(self.students)
+        self.progress = MemoryProgress()
+        self.chunks = []
+
+        # Like outside of a transaction, the chunks are queued right away.
+        on_commit = mock.patch(
+            "core.bulk_mail.transaction.on_commit", lambda func: func()
+        )
+        on_commit.start()
+        self.addCleanup(on_commit.stop)
+
+    def queue_chunk(self, chunk):
+        self.chunks.append([message["to"][0] for message in chunk])
+
+    def create_job(self, **kwargs):
+        return GradeReportJob(
+            batch_size=5,
+            workers=1,
+            source=self.source,
+            progress=self.progress,
+            **kwargs,
+        )
+
+    def test_checkpoint_after_every_chunk(self):
+        with mock.patch("core.tasks.send_bulk_mail.delay", self.queue_chunk):
+            result = self.create_job().run()
+
+        self.assertEqual(
+            self.chunks,
+            [
+                ["1@x.io", "2@x.io", "3@x.io"],
+                ["5@x.io"],
+                ["6@x.io", "7@x.io", "9@x.io"],
+                ["10@x.io"],
+            ],
+        )
+        checkpoints = [
+            (update["last_student_id"], update["processed"], update["queued_chunks"])
+            for update in self.progress.updates
+            if "last_student_id" in update
+        ]
+        self.assertEqual(checkpoints, [(3, 3, 1), (5, 5, 2), (9, 9, 3), (10, 10, 4)])
+        self.assertEqual(
+            (result["processed"], result["skipped"], result["queued_chunks"]),
+            (10, 2, 4),
+        )
+
+    def test_resume_does_not_send_queued_chunks_again(self):
+        def fail_on_third_chunk(chunk):
+            if len(self.chunks) == 2:
+                raise ConnectionError("The broker is gone.")
+            self.queue_chunk(chunk)
+
+        # The second chunk of the first batch has been queued when the third one,
+        # in the middle of the second batch, fails.
+        with mock.patch("core.tasks.send_bulk_mail.delay", fail_on_third_chunk):
+            job = self.create_job()
+            with self.assertRaises(ConnectionError):
+                job.run()
+
+        self.assertEqual(self.progress.get("job")["last_student_id"], 5)
+
+        with mock.patch("core.tasks.send_bulk_mail.delay", self.queue_chunk):
+            result = self.create_job(job_id=job.job_id).run()
+
+        recipients = [recipient for chunk in self.chunks for recipient in chunk]
+        self.assertEqual(
+            recipients, [s[2] for s in self.students if s[2] is not None]
+        )
+        self.assertEqual((result["processed"], result["skipped"]), (10, 2))
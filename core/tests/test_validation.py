@@ -0,0 +1,217 @@
+from django.test import SimpleTestCase
+from rest_framework import serializers
+
+from api.user.serializers import (
+    ChangePasswordBodyValidationSerializer,
+    ForgotPasswordBodyValidationSerializer,
+    RegisterSerializer,
+    ResetPasswordBodyValidationSerializer,
+    SendResetPasswordEmailBodyValidationSerializer,
+)
+from core.exceptions import (
+    QueryParameterValidationException,
+    RequestBodyValidationException,
+)
+from core.utils import get_validation_plan, validate_data, validate_data_compiled
+
+
+class ProfileSerializer(serializers.Serializer):
+    nickname = serializers.CharField(
+        max_length=10, allow_null=True, allow_blank=True, required=False
+    )
+    age = serializers.IntegerField(min_value=0, max_value=150, required=False)
+    role = serializers.ChoiceField(choices=["student", "teacher"], default="student")
+    base_url = serializers.URLField(required=False)
+    born_at = serializers.DateTimeField(required=False)
+    scores = serializers.ListField(child=serializers.IntegerField(), required=False)
+    source_name = serializers.CharField(source="name", required=False)
+    read_only = serializers.CharField(read_only=True, default="ignored")
+
+
+class ObjectValidationSerializer(serializers.Serializer):
+    password = serializers.CharField()
+    repeat_password = serializers.CharField()
+
+    def validate(self, attrs):
+        if attrs["password"] != attrs["repeat_password"]:
+            raise serializers.ValidationError("The passwords don't match.")
+        return attrs
+
+
+class FieldValidationSerializer(serializers.Serializer):
+    name = serializers.CharField()
+
+    def validate_name(self, value):
+        if value == "admin":
+            raise serializers.ValidationError("The name is reserved.")
+        return value.upper()
+
+
+class NestedSerializer(serializers.Serializer):
+    profile = ProfileSerializer()
+    note = serializers.CharField(required=False)
+
+
+class UniqueTogetherSerializer(serializers.Serializer):
+    first = serializers.IntegerField()
+    second = serializers.IntegerField()
+
+    def get_validators(self):
+        def different(attrs):
+            if attrs["first"] == attrs["second"]:
+                raise serializers.ValidationError("The values must differ.")
+
+        return [different]
+
+
+REGISTER_PAYLOADS = [
+    {},
+    {
+        "family_name": "Doe",
+        "given_name": "John",
+        "email": "john@example.com",
+        "password": "a-long-secret-1",
+    },
+    {
+        "family_name": "  Doe  ",
+        "given_name": "John",
+        "email": "JOHN@example.com",
+        "password": "a-long-secret-1",
+        "authenticate": "true",
+        "unknown": "ignored",
+    },
+    {
+        "family_name": "D" * 151,
+        "given_name": "",
+        "email": "not-an-email",
+        "password": "123",
+        "authenticate": "maybe",
+    },
+    {
+        "family_name": None,
+        "given_name": None,
+        "email": None,
+        "password": None,
+        "authenticate": None,
+    },
+    {
+        "family_name": 1,
+        "given_name": ["John"],
+        "email": {"email": "john@example.com"},
+        "password": "password",
+    },
+]
+
+PASSWORD_PAYLOADS = [
+    {},
+    {"old_password": "old", "new_password": "a-long-secret-1"},
+    {"old_password": "", "new_password": "123"},
+    {"old_password": None, "new_password": "password"},
+    {"token": "token", "password": "a-long-secret-1"},
+    {"token": ["token"], "password": "12345678"},
+    {"token": "token", "password": None},
+]
+
+RESET_EMAIL_PAYLOADS = [
+    {},
+    {"email": "john@example.com", "base_url": "https://example.com/reset"},
+    {"email": " john@example.com ", "base_url": "example.com/reset"},
+    {"email": "john", "base_url": "ftp://example.com"},
+    {"email": None, "base_url": None},
+]
+
+PROFILE_PAYLOADS = [
+    {},
+    {"nickname": None, "age": "12", "role": "teacher", "source_name": "Name"},
+    {"nickname": "", "age": -1, "role": "admin", "base_url": "no url"},
+    {"nickname": "n" * 11, "age": 1.5, "born_at": "yesterday"},
+    {"born_at": "2022-05-01T10:00:00Z", "scores": ["1", 2], "read_only": "set"},
+    {"scores": "1,2", "age": None, "role": None},
+    {"scores": [1, "two"], "base_url": "https://example.com/reset"},
+]
+
+
+class ValidateDataCompiledTestCase(SimpleTestCase):
+    def validate(self, validate, serializer_class, data, **kwargs):
+        try:
+            return "ok", validate(serializer_class, data, **kwargs)
+        except (RequestBodyValidationException, QueryParameterValidationException) as e:
+            return "error", type(e), e.status_code, e.detail, e.get_codes()
+
+    def assertValidatesLikeValidateData(self, serializer_class, payloads, **kwargs):
+        for data in payloads:
+            with self.subTest(serializer=serializer_class.__name__, data=data):
+                expected = self.validate(
+                    validate_data, serializer_class, data, **kwargs
+                )
+                result = self.validate(
+                    validate_data_compiled, serializer_class, data, **kwargs
+                )
+                self.assertEqual(result, expected)
+                if expected[0] == "ok":
+                    self.assertEqual(list(result[1]), list(expected[1]))
+
+    def test_compiled_serializers_of_the_user_api(self):
+        payloads = {
+            RegisterSerializer: REGISTER_PAYLOADS,
+            ChangePasswordBodyValidationSerializer: PASSWORD_PAYLOADS,
+            ResetPasswordBodyValidationSerializer: PASSWORD_PAYLOADS,
+            SendResetPasswordEmailBodyValidationSerializer: RESET_EMAIL_PAYLOADS,
+        }
+
+        for serializer_class, serializer_payloads in payloads.items():
+            self.assertIsNotNone(get_validation_plan(serializer_class))
+            self.assertValidatesLikeValidateData(serializer_class, serializer_payloads)
+
+    def test_field_types(self):
+        self.assertIsNotNone(get_validation_plan(ProfileSerializer))
+        self.assertValidatesLikeValidateData(ProfileSerializer, PROFILE_PAYLOADS)
+
+    def test_exception_to_raise(self):
+        self.assertValidatesLikeValidateData(
+            RegisterSerializer,
+            REGISTER_PAYLOADS,
+            exception_to_raise=QueryParameterValidationException,
+        )
+
+    def test_unsupported_serializers_fall_back(self):
+        payloads = {
+            ObjectValidationSerializer: [
+                {"password": "a", "repeat_password": "a"},
+                {"password": "a", "repeat_password": "b"},
+                {"password": "a"},
+            ],
+            FieldValidationSerializer: [{"name": "admin"}, {"name": "user"}, {}],
+            NestedSerializer: [
+                {"profile": PROFILE_PAYLOADS[1], "note": "note"},
+                {"profile": PROFILE_PAYLOADS[2]},
+                {"profile": None},
+                {},
+            ],
+            UniqueTogetherSerializer: [
+                {"first": 1, "second": 1},
+                {"first": 1, "second": 2},
+            ],
+        }
+
+        for serializer_class, serializer_payloads in payloads.items():
+            self.assertIsNone(get_validation_plan(serializer_class))
+            self.assertValidatesLikeValidateData(serializer_class, serializer_payloads)
+
+        # Its object level validation selects the pin of the user.
+        self.assertIsNone(get_validation_plan(ForgotPasswordBodyValidationSerializer))
+
+    def test_partial_and_unsupported_data_fall_back(self):
+        self.assertValidatesLikeValidateData(
+            ProfileSerializer, PROFILE_PAYLOADS, partial=True
+        )
+        self.assertValidatesLikeValidateData(
+            RegisterSerializer, [None, [], "data", [REGISTER_PAYLOADS[1]]]
+        )
+
+    def test_plan_is_reused(self):
+        validate_data_compiled(RegisterSerializer, REGISTER_PAYLOADS[1])
+        plan = get_validation_plan(RegisterSerializer)
+
+        validate_data_compiled(RegisterSerializer, REGISTER_PAYLOADS[2])
+        self.assertIs(get_validation_plan(RegisterSerializer), plan)
@@ -7,7 +7,6 @@ from urllib.parse import (
 from itsdangerous import URLSafeTimedSerializer
 
 from django.core.mail import send_mail
-from django.template.loader import render_to_string
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
@@ -22,6 +21,7 @@ from rest_framework_simplejwt.tokens import (
 from custom_service.models.ModelTechwiz import Student
 from .errors import ERROR_INVALID_TOKEN
 from core.utils import encode_base_64
+from core.email_templates import email_templates
 from core.constants import RoleName
 from core.handler import CoreHandler
 from core.exceptions import (
@@ -525,7 +525,9 @@ class UserHandler:
             "logo_url": logo_url,
             "privary_policy_url": settings.PRIVACY_POLICY_URL,
         }
-        content = render_to_string(template_mail_invite, context)
+        content = email_templates.render(
+            template_mail_invite, context, body=False
+        ).html
         send_mail(
             subject="Invite",
             message=f"{settings.URL_MERCHANT}/set-pw?token=",
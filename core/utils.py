@@ -1,14 +1,18 @@
 import base64
+from collections import OrderedDict
+from collections.abc import Mapping
 from contextlib import contextmanager
 from typing import Dict, Union, Tuple, Callable, Optional, Type
 
 from django.core.exceptions import ValidationError
 
 from django.utils.encoding import force_str
-from rest_framework import status
+from rest_framework import serializers, status
 from rest_framework.exceptions import APIException
+from rest_framework.fields import SkipField, get_error_detail, set_value
 from rest_framework.request import Request
 from rest_framework.serializers import ModelSerializer
+from rest_framework.utils.serializer_helpers import ReturnDict
 
 from core.exceptions import InstanceTypeDoesNotExist
 from .exceptions import RequestBodyValidationException
@@ -84,43 +88,113 @@ def map_exceptions_utility(mapping: ExceptionMappingType):
       # SomeException will be thrown directly if the provided callable returns None.
     """
 
+    if not isinstance(mapping, CompiledExceptionMapping):
+        mapping = CompiledExceptionMapping(mapping)
+
     try:
         yield
-    except tuple(mapping.keys()) as e:
-        value = _search_up_class_hierarchy_for_mapping(e, mapping)
-        status_code = status.HTTP_400_BAD_REQUEST
-
-        if callable(value):
-            value = value(e)
-            if value is None:
-                raise e
-        if isinstance(value, str):
-            error = value
-        if isinstance(value, tuple):
-            error = value[0]
-            if len(value) > 1 and value[1] is not None:
-                status_code = value[1]
-            if len(value) > 2 and value[2] is not None:
-                detail = value[2].format(e=e)
-
-        exc = APIException({
-            "error": [
-                {
-                    error: e,
-                }
-            ]
-        })
-        exc.status_code = status_code
-
-        raise exc
-
-
-def _search_up_class_hierarchy_for_mapping(e, mapping):
-    for clazz in e.__class__.mro():
-        value = mapping.get(clazz)
-        if value:
-            return value
-    return None
+    except mapping.exception_classes as e:
+        raise_mapped_exception(e, mapping)
+
+
+class CompiledExceptionMapping:
+    """
+    A precomputed version of an exception mapping. The tuple of exception classes
+    that must be caught is created once and the handler of every raised exception
+    class is resolved via its mro only the first time it's raised.
+    """
+
+    def __init__(self, mapping: ExceptionMappingType):
+        self.mapping = dict(mapping)
+        self.exception_classes = tuple(self.mapping.keys())
+        self._handlers = {}
+
+    def get_handler(self, exception_class):
+        """
+        Returns the mapped value of the most specific class in the mro of the
+        provided exception class.
+
+        :param exception_class: The class of the raised exception.
+        :type exception_class: Type[Exception]
+        :return: The mapped value or None if not found.
+        """
+
+        try:
+            return self._handlers[exception_class]
+        except KeyError:
+            pass
+
+        handler = None
+        for clazz in exception_class.__mro__:
+            value = self.mapping.get(clazz)
+            if value:
+                handler = value
+                break
+
+        self._handlers[exception_class] = handler
+        return handler
+
+
+def raise_mapped_exception(e, compiled_mapping: CompiledExceptionMapping):
+    """
+    Raises the api exception related to the provided exception. Must be called while
+    handling the exception because it's raised again if a callable in the mapping
+    returns None.
+
+    :param e: The exception that was raised.
+    :type e: Exception
+    :param compiled_mapping: The compiled mapping containing the exception classes.
+    :type compiled_mapping: CompiledExceptionMapping
+    :raises APIException: The mapped api exception.
+    """
+
+    value = compiled_mapping.get_handler(e.__class__)
+    status_code = status.HTTP_400_BAD_REQUEST
+
+    if callable(value):
+        value = value(e)
+        if value is None:
+            raise e
+    if isinstance(value, str):
+        error = value
+    if isinstance(value, tuple):
+        error = value[0]
+        if len(value) > 1 and value[1] is not None:
+            status_code = value[1]
+        if len(value) > 2 and value[2] is not None:
+            detail = value[2].format(e=e)
+
+    exc = APIException({
+        "error": [
+            {
+                error: e,
+            }
+        ]
+    })
+    exc.status_code = status_code
+
+    raise exc
+
+
+def serialize_errors_recursive(error):
+    """
+    Converts the errors of a serializer into a machine readable structure where every
+    error contains the message and the error code.
+
+    :param error: The errors of the serializer.
+    :type error: dict or list or ErrorDetail
+    :return: The converted errors.
+    :rtype: dict or list
+    """
+
+    if isinstance(error, dict):
+        return {
+            key: serialize_errors_recursive(errors) for key, errors in error.items()
+        }
+    elif isinstance(error, list):
+        return [serialize_errors_recursive(errors) for errors in error]
+    else:
+        return {"error": force_str(error), "code": error.code}
 
 
 def validate_data(
@@ -144,16 +218,6 @@ def validate_data(
     :rtype: dict
     """
 
-    def serialize_errors_recursive(error):
-        if isinstance(error, dict):
-            return {
-                key: serialize_errors_recursive(errors) for key, errors in error.items()
-            }
-        elif isinstance(error, list):
-            return [serialize_errors_recursive(errors) for errors in error]
-        else:
-            return {"error": force_str(error), "code": error.code}
-
     serializer = serializer_class(data=data, partial=partial)
     if not serializer.is_valid():
         detail = serialize_errors_recursive(serializer.errors)
@@ -162,6 +226,127 @@ def validate_data(
     return serializer.data
 
 
+class ValidationPlan:
+    """
+    A flat validation plan derived once from a serializer class. It holds a bound
+    prototype serializer and its writable fields, so that validating a dict doesn't
+    require instantiating the serializer and deep copying its fields every time.
+    """
+
+    def __init__(self, serializer, fields):
+        self.serializer = serializer
+        self.fields = fields
+
+
+_validation_plans = {}
+
+
+def _build_validation_plan(serializer_class):
+    """
+    Creates the validation plan of the serializer class. None is returned if the
+    serializer depends on something the plan can't reproduce exactly, like object
+    level validation, field level `validate_<name>` methods, nested serializers or
+    defaults that need the serializer context.
+    """
+
+    if not issubclass(serializer_class, serializers.Serializer):
+        return None
+
+    if serializer_class.validate is not serializers.Serializer.validate:
+        return None
+
+    prototype = serializer_class()
+
+    if prototype.get_validators():
+        return None
+
+    fields = []
+    for field in prototype._writable_fields:
+        if isinstance(field, serializers.BaseSerializer):
+            return None
+        if hasattr(prototype, "validate_" + field.field_name):
+            return None
+        if getattr(field.default, "requires_context", False):
+            return None
+        fields.append(field)
+
+    return ValidationPlan(prototype, fields)
+
+
+def get_validation_plan(serializer_class):
+    """
+    Returns the memoized validation plan of the serializer class or None if the
+    serializer can't be validated via a plan.
+
+    :param serializer_class: The serializer class to derive the plan from.
+    :type serializer_class: Serializer
+    :return: The validation plan.
+    :rtype: ValidationPlan or None
+    """
+
+    try:
+        return _validation_plans[serializer_class]
+    except KeyError:
+        plan = _build_validation_plan(serializer_class)
+        _validation_plans[serializer_class] = plan
+        return plan
+
+
+def validate_data_compiled(
+        serializer_class,
+        data,
+        partial=False,
+        exception_to_raise=RequestBodyValidationException,
+):
+    """
+    Validates the provided data like `validate_data` does, but via the precompiled
+    validation plan of the serializer class. The validated data and the error
+    structure are the same as the ones of `validate_data`. If the serializer or the
+    data is not supported by the plan then it falls back to `validate_data`.
+
+    :param serializer_class: The serializer that must be used for validating.
+    :type serializer_class: Serializer
+    :param data: The data that needs to be validated.
+    :type data: dict
+    :param partial: Whether the data is a partial update.
+    :type partial: bool
+    :return: The data after being validated by the serializer.
+    :rtype: dict
+    """
+
+    plan = None
+    if not partial and isinstance(data, Mapping):
+        plan = get_validation_plan(serializer_class)
+
+    if plan is None:
+        return validate_data(
+            serializer_class, data, partial=partial, exception_to_raise=exception_to_raise
+        )
+
+    validated_data = OrderedDict()
+    errors = OrderedDict()
+
+    for field in plan.fields:
+        primitive_value = field.get_value(data)
+        try:
+            validated_value = field.run_validation(primitive_value)
+        except serializers.ValidationError as exc:
+            errors[field.field_name] = exc.detail
+        except ValidationError as exc:
+            errors[field.field_name] = get_error_detail(exc)
+        except SkipField:
+            pass
+        else:
+            set_value(validated_data, field.source_attrs, validated_value)
+
+    if errors:
+        raise exception_to_raise(serialize_errors_recursive(errors))
+
+    return ReturnDict(
+        plan.serializer.to_representation(validated_data), serializer=plan.serializer
+    )
+
+
 def validate_data_custom_fields(
         type_name,
         registry,
@@ -0,0 +1,77 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from utils.error import ServiceOverloaded
+
+
+class BoundedDatabaseExecutor:
+    """
+    A dedicated thread pool that runs blocking ORM code for async views. Django runs
+    thread sensitive sync code in one shared thread, this pool allows `max_workers`
+    calls in parallel. At most `max_pending` calls can be running or waiting for a
+    thread, every call above that fails right away with `ServiceOverloaded`, so a slow
+    database results in fast 503 responses instead of an ever growing queue.
+    """
+
+    def __init__(self, max_workers, max_pending):
+        self.max_workers = max_workers
+        self.max_pending = max(max_pending, max_workers)
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix="db-executor"
+                    )
+        return self._executor
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Runs the provided function in the pool and waits for the result without
+        blocking the event loop.
+
+        :param func: The sync function that must be called.
+        :type func: Callable
+        :raises ServiceOverloaded: When `max_pending` calls are already in progress.
+        :return: The return value of the function.
+        """
+
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise ServiceOverloaded()
+            self.pending += 1
+
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor,
+                functools.partial(self._run_in_thread, func, *args, **kwargs),
+            )
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    @staticmethod
+    def _run_in_thread(func, *args, **kwargs):
+        # Same connection handling as the request cycle, so that connections that
+        # are broken or exceeded their max age are not reused by the pool.
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+
+database_executor = BoundedDatabaseExecutor(
+    settings.ASYNC_DB_POOL_SIZE, settings.ASYNC_DB_POOL_MAX_PENDING
+)
@@ -1,7 +1,72 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
 from rest_framework import generics
+from rest_framework.renderers import JSONRenderer
 from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
+from utils.async_db import database_executor
+from utils.error import ServiceOverloaded
+
+
+def _get_http_response(response):
+    """
+    Renders a DRF response and converts it into a plain `HttpResponse`. The async
+    request handler would otherwise hop to the sync thread only to call `render`.
+    """
+
+    if hasattr(response, "render"):
+        if not getattr(response, "accepted_renderer", None):
+            response.accepted_renderer = JSONRenderer()
+            response.accepted_media_type = JSONRenderer.media_type
+            response.renderer_context = {}
+        response.render()
+
+    http_response = HttpResponse(response.content, status=response.status_code)
+    for header, value in response.items():
+        http_response[header] = value
+    http_response.cookies = response.cookies
+    return http_response
+
+
+def _dispatch(view, request, *args, **kwargs):
+    return _get_http_response(view(request, *args, **kwargs))
+
+
+class AsyncApiViewMixin:
+    """
+    Serves an APIView as a native async view. Requests having one of the
+    `async_methods` are dispatched in the bounded database executor, so they don't
+    queue up behind each other in the single thread Django uses for sync views under
+    ASGI. Other methods are dispatched like a regular sync view.
+
+    Example:
+        class AsyncUserView(AsyncApiViewMixin, UserView):
+            pass
+    """
+
+    async_methods = ("GET", "HEAD", "OPTIONS")
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            try:
+                if request.method in cls.async_methods:
+                    return await database_executor.run(
+                        _dispatch, view, request, *args, **kwargs
+                    )
+                return await sync_to_async(_dispatch)(view, request, *args, **kwargs)
+            except ServiceOverloaded as exc:
+                response = api_settings.EXCEPTION_HANDLER(exc, {"request": request})
+                return _get_http_response(response)
+
+        async_view.cls = view.cls
+        async_view.initkwargs = view.initkwargs
+        async_view.csrf_exempt = True
+        return async_view
+
 
 class BaseViewWithPagination(generics.GenericAPIView):
     def get_paginated(self, data):
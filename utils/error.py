@@ -39,3 +39,9 @@ class RequireValue(APIException):
     status_code = 400
     default_detail = 'required valu'
     default_code = 'required_value'
+
+
+class ServiceOverloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The server is overloaded, please try again later.'
+    default_code = 'service_overloaded'
@@ -0,0 +1,27 @@
+import threading
+
+from django.conf import settings
+
+_lock = threading.Lock()
+_connection = None
+
+
+def get_redis_connection():
+    """
+    Returns a Redis client for `settings.REDIS_URL`. The client is created once per
+    process and has its own connection pool, so it can be shared by all threads.
+
+    :return: The Redis client.
+    :rtype: redis.Redis
+    """
+
+    global _connection
+
+    if _connection is None:
+        with _lock:
+            if _connection is None:
+                import redis
+
+                _connection = redis.Redis.from_url(settings.REDIS_URL)
+
+    return _connection
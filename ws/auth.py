@@ -1,9 +1,14 @@
+import asyncio
+import threading
+import time
 import uuid
+from collections import OrderedDict
 from urllib.parse import parse_qs
 
 import jwt
 from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework_jwt.settings import api_settings
 
@@ -11,16 +16,15 @@ jwt_get_username_from_payload = api_settings.JWT_PAYLOAD_GET_USERNAME_HANDLER
 jwt_decode_token = api_settings.JWT_DECODE_HANDLER
 
 
-@database_sync_to_async
-def get_user(token):
+def get_username(token):
     """
-    Selects a user related to the provided JWT token. If the token is invalid or if the
-    user does not exist then None is returned.
+    Decodes the JWT token and returns the username in its payload. This doesn't touch
+    the database, so it's done in the event loop.
 
-    :param token: The JWT token for which the user must be fetched.
+    :param token: The JWT token.
     :type token: str
-    :return: The user related to the JWT token.
-    :rtype: User or None
+    :return: The username or None if the token is invalid.
+    :rtype: str or None
     """
 
     try:
@@ -28,21 +32,182 @@ def get_user(token):
     except jwt.InvalidTokenError:
         return
 
+    return jwt_get_username_from_payload(payload) or None
+
+
+def get_users_by_username(usernames):
+    """
+    Selects the active users having one of the provided usernames in one query.
+
+    :param usernames: The usernames of the users.
+    :type usernames: list
+    :return: The users keyed by username.
+    :rtype: dict
+    """
+
     User = get_user_model()
-    username = jwt_get_username_from_payload(payload)
+    users = User.objects.filter(**{f"{User.USERNAME_FIELD}__in": usernames})
+    return {user.get_username(): user for user in users if user.is_active}
 
-    if not username:
-        return
 
-    try:
-        user = User.objects.get_by_natural_key(username)
-    except User.DoesNotExist:
-        return
+class UserLoader:
+    """
+    Resolves usernames to users for the web socket handshakes in this process. The
+    results, also the missing ones, are cached for `WS_AUTH_USER_CACHE_TTL` seconds
+    and concurrent lookups of the same username wait for the same query. If batch
+    loading is enabled, then all the usernames requested in the same iteration of
+    the event loop are selected with a single query, which keeps reconnect storms
+    from flooding the database and the sync thread.
+
+    Invalidations only reach the cache of the process that changed the user, the
+    other processes keep using their copy until it expires.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._loading = {}
+        self._batch = None
+        # Incremented by every invalidation, users that were selected while the
+        # version changed might be stale and are not cached.
+        self.version = 0
+
+    def get_cached(self, username):
+        """
+        :raises KeyError: When the username is not cached or has expired.
+        """
+
+        with self._lock:
+            expires_at, user = self._cache[username]
+
+            if expires_at < time.monotonic():
+                del self._cache[username]
+                raise KeyError(username)
+
+            self._cache.move_to_end(username)
+            return user
+
+    def set_cached(self, username, user, version):
+        """
+        :param version: The `version` from before the user was selected.
+        :type version: int
+        """
+
+        expires_at = time.monotonic() + settings.WS_AUTH_USER_CACHE_TTL
+        with self._lock:
+            if version != self.version:
+                return
+
+            self._cache[username] = (expires_at, user)
+            self._cache.move_to_end(username)
+            while len(self._cache) > settings.WS_AUTH_USER_CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, username):
+        """
+        Removes the user from the cache of this process, for example because it has
+        been changed. It's called from sync code while the event loop uses the
+        cache. Other processes use their copy for at most `WS_AUTH_USER_CACHE_TTL`
+        seconds.
+
+        :param username: The username of the user.
+        :type username: str
+        """
+
+        with self._lock:
+            self.version += 1
+            self._cache.pop(username, None)
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self._cache.clear()
+
+    async def load(self, username):
+        """
+        Returns the active user having the provided username.
+
+        :param username: The username of the user.
+        :type username: str
+        :return: The user or None if it does not exist or is not active.
+        :rtype: User or None
+        """
+
+        try:
+            return self.get_cached(username)
+        except KeyError:
+            pass
+
+        future = self._loading.get(username)
+
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._loading[username] = future
+
+            if settings.WS_AUTH_BATCH_LOADING:
+                self.add_to_batch(username)
+            else:
+                asyncio.ensure_future(self.load_batch([username]))
+
+        # The future is shared, so cancelling one handshake must not cancel the
+        # lookup of the others.
+        return await asyncio.shield(future)
+
+    def add_to_batch(self, username):
+        if self._batch is None:
+            self._batch = []
+            asyncio.get_running_loop().call_soon(self.start_batch)
+        self._batch.append(username)
+
+    def start_batch(self):
+        usernames, self._batch = self._batch, None
+        asyncio.ensure_future(self.load_batch(usernames))
+
+    async def load_batch(self, usernames):
+        version = self.version
+        users, error = None, None
+
+        try:
+            users = await database_sync_to_async(get_users_by_username)(usernames)
+            for username in usernames:
+                self.set_cached(username, users.get(username), version)
+        except Exception as e:
+            error = e
+        finally:
+            # Every waiting handshake gets an outcome, also when the batch is
+            # cancelled, and the next lookups start a new batch.
+            for username in usernames:
+                future = self._loading.pop(username, None)
+                if future is None or future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                elif users is None:
+                    future.cancel()
+                else:
+                    future.set_result(users.get(username))
+
+
+user_loader = UserLoader()
+
+
+async def get_user(token):
+    """
+    Selects a user related to the provided JWT token. If the token is invalid or if the
+    user does not exist then None is returned.
+
+    :param token: The JWT token for which the user must be fetched.
+    :type token: str
+    :return: The user related to the JWT token.
+    :rtype: User or None
+    """
+
+    username = get_username(token)
 
-    if not user.is_active:
+    if not username:
         return
 
-    return user
+    return await user_loader.load(username)
 
 
 class JWTTokenAuthMiddleware(BaseMiddleware):
@@ -1,65 +1,294 @@
+import asyncio
+import uuid
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
 from channels.db import database_sync_to_async
-from channels.generic.websocket import AsyncJsonWebsocketConsumer, JsonWebsocketConsumer
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
 
+from core.chat.handler import ChatHandler
+from core.chat.utils import get_conversation_id
+from ws.frames import AsyncFrameConsumerMixin
+from ws.presence import presence_tracker
+from ws.queues import CLOSE, SendQueueConsumerMixin
 from ws.registries import page_registry
-from django.conf import settings
-from asgiref.sync import async_to_sync
+from ws.subscriptions import PageSubscriptions
+from ws.utils import get_chat_user_group_name, get_user_group_name
 
 
-class ChatConsumer(JsonWebsocketConsumer):
-    def connect(self):
-        async_to_sync(self.channel_layer.group_add)(settings.CHANNEL_CHAT_REDIS, self.channel_name)
-        self.accept()
+class ChatConsumer(
+    SendQueueConsumerMixin, AsyncFrameConsumerMixin, AsyncJsonWebsocketConsumer
+):
+    """
+    Delivers chat messages between users. Every connection joins the chat group of
+    its user, so a message is only delivered to the connections of the two
+    participants of the conversation.
 
-    def disconnect(self, message):
-        async_to_sync(self.channel_layer.group_discard)(settings.CHANNEL_CHAT_REDIS, self.channel_name)
+    The client can send the following events:
 
-    def receive_json(self, content, **kwargs):
-        print("Received event: {}".format(content))
-        self.send_json(content)
+    {"event": "message", "receiver_id": 2, "message": "Hi", "client_message_id": "a"}
+        Sends a message. The sender receives a `message_sent` event containing the
+        message id, the connections of both users receive the `message` event.
 
-    def send_message(self, content):
-        '''
-        @param content: {receiver_id: 'abc', message: 'string', event: 'string'}
-        @return:
-        '''
-        receiver_id = content['receiver_id']
-        message = content['message']
-        event = content['event']
+    {"event": "ack", "message_id": "...", "sender_id": 1}
+        Acknowledges that a message the sender sent to the user has been received.
+        The sender receives a `delivered` event.
 
-        print(f"receiver_id: {receiver_id}")
-        print(f"message: {message}")
-        print(f"event: {event}")
+    {"event": "history", "user_id": 2}
+        Requests the recent messages of the conversation with the other user, for
+        example after reconnecting. The client receives a `history` event. Older
+        messages can be fetched with the chat history endpoint.
 
-        self.send_json(content)
+    Chat messages must not be lost, so if a client can't keep up and its send queue
+    is full, then the connection is closed. The client can reconnect and fetch the
+    history instead.
+    """
 
+    send_queue_policy = CLOSE
+
+    def get_send_queue_size(self):
+        return settings.WS_CHAT_OUTBOUND_QUEUE_SIZE
 
-class CoreConsumer(AsyncJsonWebsocketConsumer):
     async def connect(self):
-        await self.accept()
+        user = self.scope.get("user")
+
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+
+        self.user_group_name = get_chat_user_group_name(user.id)
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+        await self.accept(self.get_subprotocol())
+        await presence_tracker.connect(user.id, self.channel_name)
+
+    async def disconnect(self, message):
+        if hasattr(self, "user_group_name"):
+            await presence_tracker.disconnect(self.scope["user"].id, self.channel_name)
+            await self.channel_layer.group_discard(
+                self.user_group_name, self.channel_name
+            )
+
+    async def receive_json(self, content, **kwargs):
+        event = content.get("event") if isinstance(content, dict) else None
+
+        if event == "message":
+            await self.receive_message(content)
+        elif event == "ack":
+            await self.receive_ack(content)
+        elif event == "history":
+            await self.receive_history(content)
+        else:
+            await self.send_json({"event": "error", "error": "ERROR_UNKNOWN_EVENT"})
+
+    async def receive_message(self, content):
+        """
+        Stores a message of the user and routes it to the connections of the receiver
+        and the other connections of the sender.
+
+        :param content: The event containing the receiver id, the message and
+            optionally a client message id.
+        :type content: dict
+        """
+
+        user = self.scope["user"]
+        receiver_id = content.get("receiver_id")
+        message = content.get("message")
+
+        if not isinstance(receiver_id, int) or not isinstance(message, str):
+            await self.send_json(
+                {
+                    "event": "error",
+                    "error": "ERROR_INVALID_MESSAGE",
+                    "client_message_id": content.get("client_message_id"),
+                }
+            )
+            return
+
+        stored_message = {
+            "message_id": uuid.uuid4().hex,
+            "conversation_id": get_conversation_id(user.id, receiver_id),
+            "sender_id": user.id,
+            "receiver_id": receiver_id,
+            "message": message,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        await sync_to_async(ChatHandler().store_message, thread_sensitive=False)(
+            stored_message
+        )
+
+        payload = {"event": "message", **stored_message}
+
+        await self.send_to_users(
+            {user.id, receiver_id},
+            {
+                "type": "chat_message",
+                "payload": payload,
+                "sender_channel_name": self.channel_name,
+            },
+        )
+        await self.send_json(
+            {
+                "event": "message_sent",
+                "message_id": payload["message_id"],
+                "client_message_id": content.get("client_message_id"),
+                "conversation_id": payload["conversation_id"],
+            }
+        )
+
+    async def receive_ack(self, content):
+        """
+        Notifies the sender of a message that the message has been delivered. Only
+        messages that were sent by the sender to the user can be acknowledged.
+
+        :param content: The event containing the message id and the sender id.
+        :type content: dict
+        """
+
+        user = self.scope["user"]
+        sender_id = content.get("sender_id")
+        message_id = content.get("message_id")
+
+        if not isinstance(sender_id, int) or not isinstance(message_id, str):
+            return
+
+        is_sent_message = await database_sync_to_async(
+            ChatHandler().is_sent_message
+        )(message_id, sender_id, user.id)
+
+        if not is_sent_message:
+            return
+
+        await self.send_to_users(
+            {sender_id},
+            {
+                "type": "chat_ack",
+                "payload": {
+                    "event": "delivered",
+                    "message_id": message_id,
+                    "receiver_id": user.id,
+                },
+            },
+        )
+
+    async def receive_history(self, content):
+        """
+        Sends the recent messages of the conversation with the provided user.
+
+        :param content: The event containing the id of the other user.
+        :type content: dict
+        """
+
+        user_id = content.get("user_id")
+
+        if not isinstance(user_id, int):
+            return
+
+        conversation_id = get_conversation_id(self.scope["user"].id, user_id)
+        messages = await database_sync_to_async(ChatHandler().get_recent_messages)(
+            conversation_id
+        )
+        await self.send_json(
+            {
+                "event": "history",
+                "conversation_id": conversation_id,
+                "messages": messages,
+            }
+        )
+
+    async def send_to_users(self, user_ids, message):
+        await asyncio.gather(
+            *[
+                self.channel_layer.group_send(
+                    get_chat_user_group_name(user_id), message
+                )
+                for user_id in user_ids
+            ]
+        )
+
+    async def chat_message(self, event):
+        # The sending connection already received the `message_sent` event.
+        if event.get("sender_channel_name") != self.channel_name:
+            await self.send_json(event["payload"])
+
+    async def chat_ack(self, event):
+        await self.send_json(event["payload"])
+
+    async def send_message(self, content):
+        """
+        Sends a message that was sent to the chat group of the user by the server.
+
+        :param content: {receiver_id: 1, message: 'string', event: 'string'}
+        :type content: dict
+        """
+
+        if content["receiver_id"] != self.scope["user"].id:
+            return
+
+        await self.send_json(
+            {
+                "event": content["event"],
+                "receiver_id": content["receiver_id"],
+                "message": content["message"],
+            }
+        )
+
+
+class CoreConsumer(
+    SendQueueConsumerMixin, AsyncFrameConsumerMixin, AsyncJsonWebsocketConsumer
+):
+    async def connect(self):
+        self.subscriptions = PageSubscriptions(self)
+        await self.accept(self.get_subprotocol())
 
         user = self.scope["user"]
         web_socket_id = self.scope["web_socket_id"]
 
+        # The frames are written via the send queue, so the connection is closed
+        # after the frame is sent instead of right away.
         await self.send_json(
             {
                 "type": "authentication",
                 "success": user is not None,
                 "web_socket_id": web_socket_id,
-            }
+            },
+            close=not user,
         )
 
         if not user:
-            await self.close()
             return
 
         await self.channel_layer.group_add("users", self.channel_name)
+        await self.channel_layer.group_add(
+            get_user_group_name(user.id), self.channel_name
+        )
+        await presence_tracker.connect(user.id, self.channel_name)
 
     async def receive_json(self, content, **parameters):
         if "page" in content:
-            await self.add_to_page(content)
+            await self.add_to_page(content, content["page"], exclusive=True)
+        elif "add_page" in content:
+            await self.add_to_page(content, content["add_page"])
+        elif "remove_page" in content:
+            await self.remove_page(content)
+
+    def get_page(self, page, content):
+        """
+        Returns the page type and the parameters requested by the user or None if the
+        page type does not exist.
+        """
+
+        try:
+            page_type = page_registry.get(page)
+        except page_registry.does_not_exist_exception_class:
+            return None, None
 
-    async def add_to_page(self, content):
+        parameters = {
+            parameter: content.get(parameter) for parameter in page_type.parameters
+        }
+        return page_type, parameters
+
+    async def add_to_page(self, content, page, exclusive=False):
         """
         Subscribes the connection to a page abstraction. Based on the provided the page
         type we can figure out to which page the connection wants to subscribe to. This
@@ -69,75 +298,84 @@ class CoreConsumer(AsyncJsonWebsocketConsumer):
         :param content: The provided payload by the user. This should contain the page
             type and additional parameters.
         :type content: dict
+        :param page: The requested page type.
+        :type page: str
+        :param exclusive: Whether the connection must be unsubscribed from all the
+            other pages. This is the case when the user navigates to another page.
+        :type exclusive: bool
         """
 
-        user = self.scope["user"]
-        web_socket_id = self.scope["web_socket_id"]
-
-        if not user:
+        if not self.scope["user"]:
             return
 
-        # If the user has already joined another page we need to discard that
-        # page first before we can join a new one.
-        await self.discard_current_page()
-
-        try:
-            page_type = page_registry.get(content["page"])
-        except page_registry.does_not_exist_exception_class:
-            return
+        page_type, parameters = self.get_page(page, content)
+        key = self.subscriptions.get_key(page_type, parameters) if page_type else None
 
-        parameters = {
-            parameter: content.get(parameter) for parameter in page_type.parameters
-        }
+        # If the user has already joined other pages we need to discard those pages
+        # first. The page itself is kept if the user is already subscribed to it.
+        if exclusive:
+            await self.discard_pages(except_key=key)
 
-        can_add = await database_sync_to_async(page_type.can_add)(
-            user, web_socket_id, **parameters
-        )
-
-        if not can_add:
+        if not page_type or not await self.subscriptions.add(page_type, parameters):
             return
 
-        group_name = page_type.get_group_name(**parameters)
-        await self.channel_layer.group_add(group_name, self.channel_name)
-        self.scope["page"] = page_type
-        self.scope["page_parameters"] = parameters
-
         await self.send_json(
             {"type": "page_add", "page": page_type.type, "parameters": parameters}
         )
 
-    async def discard_current_page(self, send_confirmation=True):
+    async def remove_page(self, content):
         """
-        If the user has subscribed to another page then he will be unsubscribed from
-        the last page.
+        Unsubscribes the connection from one of the pages it has subscribed to.
+
+        :param content: The provided payload by the user. This should contain the page
+            type and additional parameters.
+        :type content: dict
         """
 
-        page = self.scope.get("page")
-        if not page:
+        page_type, parameters = self.get_page(content["remove_page"], content)
+
+        if not page_type:
             return
 
-        page_type = page.type
-        page_parameters = self.scope["page_parameters"]
+        subscription = await self.subscriptions.remove(
+            self.subscriptions.get_key(page_type, parameters)
+        )
+
+        if subscription:
+            await self.send_page_discard(subscription)
+
+    async def discard_pages(self, send_confirmation=True, except_key=None):
+        """
+        Unsubscribes the connection from all the pages it has subscribed to.
+
+        :param send_confirmation: Whether a `page_discard` message must be sent for
+            every page.
+        :type send_confirmation: bool
+        :param except_key: The key of a subscription that must be kept.
+        :type except_key: tuple
+        """
 
-        group_name = page.get_group_name(**self.scope["page_parameters"])
-        await self.channel_layer.group_discard(group_name, self.channel_name)
-        del self.scope["page"]
-        del self.scope["page_parameters"]
+        removed = await self.subscriptions.remove_all(except_key=except_key)
 
         if send_confirmation:
-            await self.send_json(
-                {
-                    "type": "page_discard",
-                    "page": page_type,
-                    "parameters": page_parameters,
-                }
-            )
+            for subscription in removed:
+                await self.send_page_discard(subscription)
+
+    async def send_page_discard(self, subscription):
+        await self.send_json(
+            {
+                "type": "page_discard",
+                "page": subscription.page_type.type,
+                "parameters": subscription.parameters,
+            }
+        )
 
     async def broadcast_to_users(self, event):
         """
         Broadcasts a message to all the users that are in the provided user_ids list.
         Optionally the ignore_web_socket_id is ignored because that is often the
-        sender.
+        sender. The message is normally sent to the group of the user, so the
+        user_ids list only contains that user.
 
         :param event: The event containing the payload, user ids and the web socket
             id that must be ignored.
@@ -145,14 +383,13 @@ class CoreConsumer(AsyncJsonWebsocketConsumer):
         """
 
         web_socket_id = self.scope["web_socket_id"]
-        payload = event["payload"]
         user_ids = event["user_ids"]
         ignore_web_socket_id = event["ignore_web_socket_id"]
 
         if (
                 not ignore_web_socket_id or ignore_web_socket_id != web_socket_id
         ) and self.scope["user"].id in user_ids:
-            await self.send_json(payload)
+            await self.send_event_payload(event)
 
     async def broadcast_to_group(self, event):
         """
@@ -164,12 +401,76 @@ class CoreConsumer(AsyncJsonWebsocketConsumer):
         """
 
         web_socket_id = self.scope["web_socket_id"]
-        payload = event["payload"]
         ignore_web_socket_id = event["ignore_web_socket_id"]
 
         if not ignore_web_socket_id or ignore_web_socket_id != web_socket_id:
-            await self.send_json(payload)
+            await self.send_event_payload(event)
+
+    async def send_event_payload(self, event):
+        """
+        Sends the payload of a broadcasted event. If the event has an id, then the
+        payload is encoded once per process and shared by all the connections that
+        receive the same event.
+
+        :param event: The event containing the payload and optionally the event id.
+        :type event: dict
+        """
+
+        event_id = event.get("event_id")
+        if event_id is None:
+            await self.send_json(event["payload"])
+        else:
+            await self.send_cached_json(event_id, event["payload"])
+
+    async def broadcast_batch(self, event):
+        """
+        Sends the coalesced events of a channel group. A single event is sent as is,
+        multiple events are sent as one frame containing all the payloads.
+
+        :param event: The event containing the event id and a list of events, each
+            having a payload and the web socket id that must be ignored.
+        :type event: dict
+        """
+
+        web_socket_id = self.scope["web_socket_id"]
+        included = tuple(
+            index
+            for index, e in enumerate(event["events"])
+            if not e["ignore_web_socket_id"]
+            or e["ignore_web_socket_id"] != web_socket_id
+        )
+
+        if not included:
+            return
+
+        if len(included) == 1:
+            content = event["events"][included[0]]["payload"]
+        else:
+            content = {
+                "type": "batch",
+                "events": [event["events"][index]["payload"] for index in included],
+            }
+
+        # A single event that has been declared as superseding earlier ones also
+        # replaces those that are still in the send queue.
+        coalesce_key = (
+            event["events"][included[0]].get("coalesce_key")
+            if len(included) == 1
+            else None
+        )
+
+        # All the connections that include the same events share the encoded frame.
+        await self.send_cached_json(
+            (event["event_id"], included), content, coalesce_key=coalesce_key
+        )
 
     async def disconnect(self, message):
-        await self.discard_current_page(send_confirmation=False)
+        await self.discard_pages(send_confirmation=False)
         await self.channel_layer.group_discard("users", self.channel_name)
+
+        user = self.scope["user"]
+        if user:
+            await presence_tracker.disconnect(user.id, self.channel_name)
+            await self.channel_layer.group_discard(
+                get_user_group_name(user.id), self.channel_name
+            )
@@ -0,0 +1,134 @@
+import json
+from collections import OrderedDict
+
+import msgpack
+from django.conf import settings
+
+MSGPACK_SUBPROTOCOL = "msgpack.v1"
+"""The subprotocol a client can request to receive binary msgpack frames."""
+
+
+def encode_frame(content, binary):
+    """
+    Encodes the content into a web socket frame.
+
+    :param content: The JSON serializable content.
+    :type content: dict
+    :param binary: Whether the frame must be encoded with msgpack instead of JSON.
+    :type binary: bool
+    :return: The encoded frame.
+    :rtype: bytes or str
+    """
+
+    if binary:
+        return msgpack.packb(content, use_bin_type=True)
+    return json.dumps(content)
+
+
+def decode_frame(text_data=None, bytes_data=None):
+    """
+    Decodes a received web socket frame. Binary frames are decoded with msgpack and
+    text frames with JSON.
+
+    :raises ValueError: When the frame has no content.
+    :return: The decoded content.
+    :rtype: dict
+    """
+
+    if bytes_data is not None:
+        return msgpack.unpackb(bytes_data, raw=False)
+    if text_data is not None:
+        return json.loads(text_data)
+    raise ValueError("No content in the incoming WebSocket frame!")
+
+
+class FrameCache:
+    """
+    A per process cache of encoded frames. All the consumers in the same process
+    receive their own copy of a channel layer message, so they can't share the
+    payload object. Instead the messages carry an event id and the first consumer
+    that sends the event encodes it, all the others send the cached frame.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._frames = OrderedDict()
+
+    def get_frame(self, key, content, binary):
+        """
+        Returns the encoded frame of the content and caches it under the provided
+        key.
+
+        :param key: A hashable key that uniquely identifies the content.
+        :param content: The content that must be encoded if not cached yet.
+        :type content: dict
+        :param binary: Whether the frame must be encoded with msgpack.
+        :type binary: bool
+        :return: The encoded frame.
+        :rtype: bytes or str
+        """
+
+        cache_key = (key, binary)
+
+        try:
+            frame = self._frames[cache_key]
+        except KeyError:
+            frame = encode_frame(content, binary)
+            self._frames[cache_key] = frame
+            if len(self._frames) > self.max_size:
+                self._frames.popitem(last=False)
+        else:
+            self._frames.move_to_end(cache_key)
+
+        return frame
+
+
+frame_cache = FrameCache(settings.WS_FRAME_CACHE_SIZE)
+
+
+class AsyncFrameConsumerMixin:
+    """
+    Adds the `msgpack.v1` subprotocol to an async JSON web socket consumer. If the
+    client requests it, then all the frames are sent and received as msgpack encoded
+    binary frames instead of JSON text frames. It also allows sending frames that are
+    shared with other consumers via the `frame_cache`.
+    """
+
+    binary = False
+
+    def get_subprotocol(self):
+        if MSGPACK_SUBPROTOCOL in self.scope.get("subprotocols", []):
+            self.binary = True
+            return MSGPACK_SUBPROTOCOL
+        return None
+
+    async def receive(self, text_data=None, bytes_data=None, **kwargs):
+        await self.receive_json(decode_frame(text_data, bytes_data), **kwargs)
+
+    async def send_json(self, content, close=False):
+        await self.send_frame(encode_frame(content, self.binary), close)
+
+    async def send_cached_json(self, key, content, coalesce_key=None):
+        """
+        Sends the content, but encodes it only if no other consumer in this process
+        has sent the content under the same key with the same encoding.
+
+        :param key: The key that uniquely identifies the content, like the id of the
+            event that is broadcasted.
+        :param content: The content that must be sent.
+        :type content: dict
+        :param coalesce_key: Passed on to `send_frame`.
+        :type coalesce_key: str
+        """
+
+        await self.send_frame(
+            frame_cache.get_frame(key, content, self.binary),
+            coalesce_key=coalesce_key,
+        )
+
+    async def send_frame(self, frame, close=False, coalesce_key=None):
+        # The coalesce key is only used when the frames are sent via a send queue.
+        if self.binary:
+            await self.send(bytes_data=frame, close=close)
+        else:
+            await self.send(text_data=frame, close=close)
@@ -0,0 +1,321 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import time
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from functools import lru_cache
+
+import msgpack
+from channels_redis.core import RedisChannelLayer
+
+logger = logging.getLogger(__name__)
+
+GROUP_SEND_LUA = """
+    local over_capacity = 0
+    local current_time = ARGV[#ARGV - 1]
+    local expiry = ARGV[#ARGV]
+    for i=1,#KEYS do
+        redis.call('ZREMRANGEBYSCORE', KEYS[i], 0, current_time - expiry)
+        local capacity = tonumber(ARGV[i + #KEYS])
+        if redis.call('ZCOUNT', KEYS[i], '-inf', '+inf') < capacity then
+            redis.call('ZADD', KEYS[i], current_time, ARGV[i])
+            redis.call('EXPIRE', KEYS[i], expiry)
+        else
+            over_capacity = over_capacity + 1
+        end
+    end
+    return over_capacity
+"""
+
+
+def get_hash(value):
+    if isinstance(value, str):
+        value = value.encode("utf8")
+    return int.from_bytes(hashlib.md5(value).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring mapping keys to node indexes. Every node is placed on the
+    ring `virtual_nodes` times, so the keys are spread evenly and adding a node
+    only moves about 1/N of the keys to it instead of reshuffling all of them like
+    a modulo would.
+    """
+
+    def __init__(self, size, virtual_nodes=160):
+        points = sorted(
+            (get_hash(f"{node}-{replica}"), node)
+            for node in range(size)
+            for replica in range(virtual_nodes)
+        )
+        self.size = size
+        self.hashes = [point for point, node in points]
+        self.nodes = [node for point, node in points]
+        self.get_node = lru_cache(maxsize=65536)(self._get_node)
+
+    def _get_node(self, key):
+        """
+        :param key: The key that must be mapped, for example a group name.
+        :type key: str
+        :return: The index of the node the key belongs to.
+        :rtype: int
+        """
+
+        if self.size == 1:
+            return 0
+
+        index = bisect.bisect(self.hashes, get_hash(key))
+        return self.nodes[index % len(self.nodes)]
+
+
+class ShardedRedisChannelLayer(RedisChannelLayer):
+    """
+    Redis channel layer that spreads the groups and channels over all the
+    configured hosts with a consistent hash ring.
+
+    With the local fast path, group messages are put straight into the receive
+    buffer of the members of this process that are waiting for one. The member that
+    waits on Redis on behalf of all the consumers of the process, members that are
+    busy and members of other processes get the message through Redis. This way no
+    buffer is filled for a channel that stopped receiving, and no message waits in
+    a buffer while its consumer waits on Redis.
+
+    The messages this process sends to a channel arrive in the order they were
+    sent. When a message to a local channel goes through Redis, the fast path is not
+    used for that channel until the message has been received, so that later
+    messages can't overtake it. Messages of different processes are not ordered.
+    """
+
+    # The key of the (client prefix, sequence) of a message this process sent to its
+    # own channels through Redis.
+    sequence_key = "__local_sequence__"
+
+    def __init__(self, *args, virtual_nodes=160, local_fast_path=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ring = HashRing(self.ring_size, virtual_nodes)
+        self.local_fast_path = local_fast_path
+        # The local channels with a `receive` in progress and the ones of those
+        # that are waiting on Redis while holding the receive lock.
+        self.receiving = Counter()
+        self.receiving_from_redis = set()
+        self.receiving_channel = ContextVar("receiving_channel", default=None)
+        # The local channels with a message in Redis that this process sent, mapped
+        # to the (sequence, expires at) of the last one, oldest first.
+        self.remote_pending = OrderedDict()
+        self.sequence = 0
+
+    def consistent_hash(self, value):
+        return self.ring.get_node(value)
+
+    def is_local_channel(self, channel):
+        """
+        :return: Whether the channel has been created by this layer, which means
+            that its consumer is receiving in this process.
+        :rtype: bool
+        """
+
+        return "!" in channel and self.non_local_name(channel).endswith(
+            self.client_prefix + "!"
+        )
+
+    async def receive(self, channel):
+        if not self.is_local_channel(channel):
+            return await super().receive(channel)
+
+        token = self.receiving_channel.set(channel)
+        self.receiving[channel] += 1
+        try:
+            return await super().receive(channel)
+        finally:
+            self.receiving[channel] -= 1
+            if not self.receiving[channel]:
+                del self.receiving[channel]
+                # Upstream leaves the empty buffer behind when the consumer holding
+                # the receive lock is cancelled.
+                buffer = self.receive_buffer.get(channel)
+                if buffer is not None and buffer.empty():
+                    del self.receive_buffer[channel]
+            self.receiving_channel.reset(token)
+
+    async def receive_single(self, channel):
+        receiving = self.receiving_channel.get()
+        if receiving is None:
+            message_channel, message = await super().receive_single(channel)
+            self.received_remote(message_channel, message)
+            return message_channel, message
+
+        # A message could have been delivered locally between acquiring the receive
+        # lock and getting here. Returning no messages makes `receive` release the
+        # lock and take it from the buffer instead of waiting on Redis.
+        buffer = self.receive_buffer.get(receiving)
+        if buffer is not None and not buffer.empty():
+            return [], None
+
+        self.receiving_from_redis.add(receiving)
+        try:
+            message_channel, message = await super().receive_single(channel)
+        finally:
+            self.receiving_from_redis.discard(receiving)
+
+        self.received_remote(message_channel, message)
+        return message_channel, message
+
+    def received_remote(self, message_channel, message):
+        """
+        Removes the sequence from a message received from Redis and marks the local
+        channels as caught up if it's the last message this process sent to them.
+        """
+
+        client_prefix, sequence = message.pop(self.sequence_key, (None, None))
+        if client_prefix != self.client_prefix:
+            return
+
+        if not isinstance(message_channel, list):
+            message_channel = [message_channel]
+
+        for channel in message_channel:
+            pending = self.remote_pending.get(channel)
+            if pending is not None and pending[0] <= sequence:
+                del self.remote_pending[channel]
+
+    def add_remote_pending(self, channel_names, message):
+        """
+        Marks the local channels as having a message in Redis.
+
+        :return: The message including its sequence if it's sent to local channels.
+        :rtype: dict
+        """
+
+        local_channels = [c for c in channel_names if self.is_local_channel(c)]
+        if not local_channels:
+            return message
+
+        now = time.time()
+        while self.remote_pending:
+            channel, (sequence, expires_at) = next(iter(self.remote_pending.items()))
+            if expires_at > now:
+                break
+            del self.remote_pending[channel]
+
+        self.sequence += 1
+        for channel in local_channels:
+            self.remote_pending.pop(channel, None)
+            self.remote_pending[channel] = (self.sequence, now + self.expiry)
+
+        return {**message, self.sequence_key: (self.client_prefix, self.sequence)}
+
+    async def group_channels(self, group):
+        """
+        Discards the expired members of the group and returns the others with one
+        round trip.
+
+        :param group: The name of the group.
+        :type group: str
+        :return: The channel names of the members.
+        :rtype: list
+        """
+
+        key = self._group_key(group)
+
+        async with self.connection(self.consistent_hash(group)) as connection:
+            pipe = connection.pipeline()
+            pipe.zremrangebyscore(
+                key, min=0, max=int(time.time()) - self.group_expiry
+            )
+            pipe.zrange(key, 0, -1)
+            __, channel_names = await pipe.execute()
+
+        return [channel_name.decode("utf8") for channel_name in channel_names]
+
+    async def group_send(self, group, message):
+        assert self.valid_group_name(group), "Group name not valid"
+
+        channel_names = await self.group_channels(group)
+
+        if self.local_fast_path:
+            local_channels = [c for c in channel_names if self.can_send_local(c)]
+            remote_channels = [
+                c for c in channel_names if not self.can_send_local(c)
+            ]
+        else:
+            local_channels, remote_channels = [], channel_names
+
+        if local_channels:
+            self.send_local(local_channels, message)
+
+        if remote_channels:
+            await self.send_remote(group, remote_channels, message)
+
+    def can_send_local(self, channel):
+        """
+        :return: Whether the channel is waiting for its receive buffer in this
+            process and has no message in Redis that would be overtaken, so that
+            the message can be put in there.
+        :rtype: bool
+        """
+
+        if channel not in self.receiving or channel in self.receiving_from_redis:
+            return False
+
+        # A message that expired in Redis is never received.
+        pending = self.remote_pending.get(channel)
+        return pending is None or pending[1] <= time.time()
+
+    def send_local(self, channel_names, message):
+        """
+        Delivers the message to consumers of this process without Redis. Every
+        consumer gets its own copy, just like when it would have been received from
+        Redis. The receive buffers drop the oldest message when they are full.
+        """
+
+        packed = msgpack.packb(message, use_bin_type=True)
+
+        for channel in channel_names:
+            self.receive_buffer[channel].put_nowait(msgpack.unpackb(packed, raw=False))
+
+    async def send(self, channel, message):
+        if self.local_fast_path:
+            message = self.add_remote_pending([channel], message)
+        await super().send(channel, message)
+
+    async def send_remote(self, group, channel_names, message):
+        if self.local_fast_path:
+            message = self.add_remote_pending(channel_names, message)
+
+        (
+            connection_to_channel_keys,
+            channel_keys_to_message,
+            channel_keys_to_capacity,
+        ) = self._map_channel_keys_to_connection(channel_names, message)
+
+        async def send(connection_index, channel_keys):
+            args = [channel_keys_to_message[key] for key in channel_keys]
+            args += [channel_keys_to_capacity[key] for key in channel_keys]
+            args += [time.time(), self.expiry]
+
+            async with self.connection(connection_index) as connection:
+                return await connection.eval(
+                    GROUP_SEND_LUA, keys=channel_keys, args=args
+                )
+
+        # The hosts are written to concurrently and the expired messages are
+        # discarded by the script instead of an extra round trip per host.
+        results = await asyncio.gather(
+            *[
+                send(connection_index, channel_keys)
+                for connection_index, channel_keys in (
+                    connection_to_channel_keys.items()
+                )
+            ]
+        )
+
+        channels_over_capacity = sum(results)
+        if channels_over_capacity > 0:
+            logger.info(
+                "%s of %s channels over capacity in group %s",
+                channels_over_capacity,
+                len(channel_names),
+                group,
+            )
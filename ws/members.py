@@ -0,0 +1,295 @@
+import logging
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from redis.exceptions import RedisError
+
+from utils.redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+
+class RedisGroupMemberIndex:
+    """
+    Keeps the user ids of the members of every group in a Redis set, so that the
+    recipients of a group broadcast are resolved with a single round trip.
+
+    A set is only considered complete when its `loaded` key exists. If it doesn't,
+    then the set only contains the members that were added since it expired, so the
+    members are loaded from the database once and replace the set.
+
+    Every change increments the `version` key of the group. The load watches it, so
+    that a change committed while loading is never overwritten, even when it didn't
+    modify the set, like removing a member that wasn't in it yet.
+
+    Reading a set extends its TTL, so only unused sets expire. Without a TTL the
+    sets never expire, which is required when the members can't be loaded from the
+    database, because the set is then the only record of them.
+    """
+
+    key_prefix = "group:members"
+
+    def get_keys(self, group_id):
+        key = f"{self.key_prefix}:{group_id}"
+        return key, f"{key}:loaded", f"{key}:version"
+
+    def expire(self, pipe, key, ttl):
+        if ttl is None:
+            pipe.persist(key)
+        else:
+            pipe.expire(key, ttl)
+
+    def add(self, group_id, user_id, ttl):
+        key, loaded_key, version_key = self.get_keys(group_id)
+
+        with get_redis_connection().pipeline() as pipe:
+            pipe.sadd(key, user_id)
+            self.expire(pipe, key, ttl)
+            self.expire(pipe, loaded_key, ttl)
+            self.increment_version(pipe, version_key, ttl)
+            pipe.execute()
+
+    def remove(self, group_id, user_id, ttl):
+        key, _, version_key = self.get_keys(group_id)
+
+        with get_redis_connection().pipeline() as pipe:
+            pipe.srem(key, user_id)
+            self.increment_version(pipe, version_key, ttl)
+            pipe.execute()
+
+    def delete(self, group_id, ttl):
+        key, loaded_key, version_key = self.get_keys(group_id)
+
+        with get_redis_connection().pipeline() as pipe:
+            pipe.delete(key, loaded_key)
+            self.increment_version(pipe, version_key, ttl)
+            pipe.execute()
+
+    def increment_version(self, pipe, version_key, ttl):
+        pipe.incr(version_key)
+        self.expire(pipe, version_key, ttl)
+
+    def get(self, group_id, load_user_ids, ttl):
+        """
+        Returns the user ids of the members of the group.
+
+        :param group_id: The id of the group.
+        :type group_id: int
+        :param load_user_ids: Called without arguments if the set is not complete.
+            Must return the user ids of the members from the database or None if
+            they can't be loaded.
+        :type load_user_ids: callable
+        :param ttl: The number of seconds after which an unused set expires or None
+            if it must never expire.
+        :type ttl: int or None
+        :return: The user ids.
+        :rtype: list
+        """
+
+        key, loaded_key, version_key = self.get_keys(group_id)
+        redis = get_redis_connection()
+
+        with redis.pipeline() as pipe:
+            pipe.exists(loaded_key)
+            pipe.smembers(key)
+            if ttl is not None:
+                pipe.expire(key, ttl)
+                pipe.expire(loaded_key, ttl)
+            loaded, cached = pipe.execute()[:2]
+
+        if loaded:
+            return sorted(int(user_id) for user_id in cached)
+
+        def replace(pipe):
+            # Members that are added or removed while loading change the version,
+            # which aborts the transaction. It's then retried with a fresh query.
+            user_ids = load_user_ids()
+
+            if user_ids is None:
+                # The set is the only record of the members, so it's complete.
+                user_ids = sorted(int(user_id) for user_id in pipe.smembers(key))
+                pipe.multi()
+                pipe.set(loaded_key, 1, ex=ttl)
+                return user_ids
+
+            pipe.multi()
+            pipe.delete(key)
+            if user_ids:
+                pipe.sadd(key, *user_ids)
+            self.expire(pipe, key, ttl)
+            pipe.set(loaded_key, 1, ex=ttl)
+            return sorted(user_ids)
+
+        return redis.transaction(
+            replace, key, version_key, value_from_callable=True
+        )
+
+
+class LocalGroupMemberIndex:
+    """
+    Keeps the members in memory. It only knows the changes made by this process, so
+    it's meant for development and single process deployments. Loaded members are
+    loaded again when they haven't been read for `ttl` seconds, like the Redis sets.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._members = {}
+        # The time at which the loaded members of every group expire, None if they
+        # never do.
+        self._loaded = {}
+
+    def add(self, group_id, user_id, ttl):
+        with self._lock:
+            self._members.setdefault(group_id, set()).add(user_id)
+
+    def remove(self, group_id, user_id, ttl):
+        with self._lock:
+            self._members.get(group_id, set()).discard(user_id)
+
+    def delete(self, group_id, ttl):
+        with self._lock:
+            self._members.pop(group_id, None)
+            self._loaded.pop(group_id, None)
+
+    def get_expires_at(self, ttl):
+        return None if ttl is None else time.monotonic() + ttl
+
+    def get(self, group_id, load_user_ids, ttl):
+        with self._lock:
+            expires_at = self._loaded.get(group_id, 0)
+            if expires_at is None or expires_at > time.monotonic():
+                self._loaded[group_id] = self.get_expires_at(ttl)
+                return sorted(self._members.get(group_id, ()))
+
+        user_ids = load_user_ids()
+
+        with self._lock:
+            if user_ids is None:
+                user_ids = self._members.get(group_id, ())
+
+            self._members[group_id] = set(user_ids)
+            self._loaded[group_id] = self.get_expires_at(ttl)
+            return sorted(user_ids)
+
+
+group_member_indexes = {
+    "redis": RedisGroupMemberIndex,
+    "local": LocalGroupMemberIndex,
+}
+
+
+def get_group_user_model():
+    """
+    :return: The group user model or None if there is none, in which case only the
+        signalled memberships are known.
+    :rtype: Model or None
+    """
+
+    try:
+        return apps.get_model("core", "GroupUser")
+    except LookupError:
+        return None
+
+
+def load_group_user_ids(group_id):
+    """
+    Selects the user ids of the members of the group from the database.
+
+    :param group_id: The id of the group.
+    :type group_id: int
+    :return: The user ids or None if there is no group user model to select them
+        from.
+    :rtype: list or None
+    """
+
+    GroupUser = get_group_user_model()
+
+    if GroupUser is None:
+        return None
+
+    return list(
+        GroupUser.objects.filter(group_id=group_id).values_list("user_id", flat=True)
+    )
+
+
+class GroupMembers:
+    """
+    Resolves the members of groups via the index. The index is maintained
+    incrementally from the group user signals, the changes are applied after the
+    transaction that made them commits.
+    """
+
+    def __init__(self, index):
+        self.index = index
+
+    def get_ttl(self):
+        # Members that can't be loaded from the database again must never expire.
+        if get_group_user_model() is None:
+            return None
+        return settings.WS_GROUP_MEMBERS_TTL
+
+    def get_user_ids(self, group_id):
+        """
+        :param group_id: The id of the group.
+        :type group_id: int
+        :return: The user ids of the members. If the index is unavailable, then they
+            are selected from the database. If that's not possible either, then an
+            error is logged and there are none.
+        :rtype: list
+        """
+
+        try:
+            return self.index.get(
+                group_id, lambda: load_group_user_ids(group_id), self.get_ttl()
+            )
+        except RedisError:
+            user_ids = load_group_user_ids(group_id)
+
+            if user_ids is None:
+                logger.error(
+                    "Could not read the members of group %s, the broadcast does not "
+                    "reach them.",
+                    group_id,
+                    exc_info=True,
+                )
+                return []
+
+            logger.warning("Could not read the group members.", exc_info=True)
+            return user_ids
+
+    def add(self, group_id, user_id):
+        self.on_commit(self.index.add, group_id, user_id, self.get_ttl())
+
+    def remove(self, group_id, user_id):
+        self.on_commit(self.index.remove, group_id, user_id, self.get_ttl())
+
+    def delete(self, group_id):
+        self.on_commit(self.index.delete, group_id, self.get_ttl())
+
+    def on_commit(self, func, *args):
+        def run():
+            try:
+                func(*args)
+            except RedisError:
+                if get_group_user_model() is None:
+                    # The set can't be loaded again, so it's kept without the
+                    # change rather than losing all the other members.
+                    logger.error("Could not update the group members.", exc_info=True)
+                    return
+
+                # Dropping the whole set makes sure that it's loaded again instead
+                # of missing this change until it expires.
+                logger.warning("Could not update the group members.", exc_info=True)
+                try:
+                    self.index.delete(args[0], self.get_ttl())
+                except RedisError:
+                    pass
+
+        transaction.on_commit(run)
+
+
+group_members = GroupMembers(group_member_indexes[settings.WS_GROUP_MEMBERS_BACKEND]())
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from utils.redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+
+class RedisPresenceStore:
+    """
+    Stores the connections of every user in a Redis sorted set. The members are the
+    channel names of the connections and the scores are the timestamps at which they
+    expire, so connections of a process that died without disconnecting simply stop
+    counting once their last heartbeat has expired.
+    """
+
+    key_prefix = "presence:user"
+
+    def get_key(self, user_id):
+        return f"{self.key_prefix}:{user_id}"
+
+    def touch(self, connections, ttl):
+        """
+        Marks the connections as alive for the next `ttl` seconds.
+
+        :param connections: A list of (user id, channel name) tuples.
+        :type connections: list
+        :param ttl: The number of seconds after which the connections expire.
+        :type ttl: int
+        """
+
+        now = time.time()
+
+        with get_redis_connection().pipeline(transaction=False) as pipe:
+            for user_id, channel_name in connections:
+                key = self.get_key(user_id)
+                pipe.zadd(key, {channel_name: now + ttl})
+                pipe.zremrangebyscore(key, "-inf", now)
+                pipe.expire(key, ttl)
+            pipe.execute()
+
+    def remove(self, user_id, channel_name):
+        get_redis_connection().zrem(self.get_key(user_id), channel_name)
+
+    def get_connection_counts(self, user_ids):
+        """
+        :param user_ids: The ids of the users.
+        :type user_ids: list
+        :return: The number of live connections keyed by user id.
+        :rtype: dict
+        """
+
+        now = time.time()
+
+        with get_redis_connection().pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.zcount(self.get_key(user_id), now, "+inf")
+            counts = pipe.execute()
+
+        return dict(zip(user_ids, counts))
+
+
+class LocalPresenceStore:
+    """
+    Keeps the connections in memory. It only knows the connections of this process,
+    so it's meant for development and single process deployments.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections = {}
+
+    def touch(self, connections, ttl):
+        expires_at = time.time() + ttl
+
+        with self._lock:
+            for user_id, channel_name in connections:
+                self._connections.setdefault(user_id, {})[channel_name] = expires_at
+
+    def remove(self, user_id, channel_name):
+        with self._lock:
+            user_connections = self._connections.get(user_id, {})
+            user_connections.pop(channel_name, None)
+            if not user_connections:
+                self._connections.pop(user_id, None)
+
+    def get_connection_counts(self, user_ids):
+        now = time.time()
+
+        with self._lock:
+            return {
+                user_id: sum(
+                    1
+                    for expires_at in self._connections.get(user_id, {}).values()
+                    if expires_at > now
+                )
+                for user_id in user_ids
+            }
+
+
+presence_stores = {
+    "redis": RedisPresenceStore,
+    "local": LocalPresenceStore,
+}
+
+presence_store = presence_stores[settings.WS_PRESENCE_BACKEND]()
+
+
+class PresenceTracker:
+    """
+    Tracks the connections of this process. Instead of a heartbeat per connection,
+    a single task refreshes all the connections of the process with one pipeline
+    every `WS_PRESENCE_HEARTBEAT_INTERVAL` seconds. Nothing is written to the
+    database.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.connections = {}
+        self._heartbeat = None
+
+    async def connect(self, user_id, channel_name):
+        self.connections[channel_name] = user_id
+
+        if self._heartbeat is None or self._heartbeat.done():
+            self._heartbeat = asyncio.ensure_future(self.send_heartbeats())
+
+        await self.run(self.store.touch, [(user_id, channel_name)], self.get_ttl())
+
+    async def disconnect(self, user_id, channel_name):
+        if self.connections.pop(channel_name, None) is None:
+            return
+
+        await self.run(self.store.remove, user_id, channel_name)
+
+    async def send_heartbeats(self):
+        while True:
+            await asyncio.sleep(settings.WS_PRESENCE_HEARTBEAT_INTERVAL)
+
+            if not self.connections:
+                continue
+
+            connections = [
+                (user_id, channel_name)
+                for channel_name, user_id in self.connections.items()
+            ]
+            await self.run(self.store.touch, connections, self.get_ttl())
+
+    def get_ttl(self):
+        # A few heartbeats can be missed before a connection expires.
+        return settings.WS_PRESENCE_HEARTBEAT_INTERVAL * 3
+
+    async def run(self, func, *args):
+        try:
+            await sync_to_async(func, thread_sensitive=False)(*args)
+        except RedisError:
+            logger.warning("Could not update the presence.", exc_info=True)
+
+
+presence_tracker = PresenceTracker(presence_store)
+
+
+def is_online(user_ids):
+    """
+    Checks which of the provided users have at least one live web socket
+    connection. The users are checked with a single round trip.
+
+    :param user_ids: The ids of the users.
+    :type user_ids: list
+    :return: Whether the user is online keyed by user id. All the users are offline
+        if the presence can't be checked.
+    :rtype: dict
+    """
+
+    user_ids = list(user_ids)
+
+    if not user_ids:
+        return {}
+
+    try:
+        counts = presence_store.get_connection_counts(user_ids)
+    except RedisError:
+        logger.warning("Could not check the presence.", exc_info=True)
+        return {user_id: False for user_id in user_ids}
+
+    return {user_id: counts[user_id] > 0 for user_id in user_ids}
@@ -0,0 +1,469 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+from ws.runtime import async_runtime
+from ws.utils import get_group_user_ids, get_user_group_name, group_send_many
+
+logger = logging.getLogger(__name__)
+
+
+class _PublisherState(threading.local):
+    def __init__(self):
+        self.events = []
+        self.last_marker = None
+        # The number of requests and tasks the thread is handling, they publish the
+        # events that are left behind when they finish.
+        self.scopes = 0
+
+
+_state = _PublisherState()
+
+
+def _add_event(event):
+    """
+    Adds the event to the current transaction. Every event gets its own on commit
+    hook, so events added in a savepoint that is rolled back are discarded just like
+    before. The hooks only collect the events, the last registered hook publishes
+    all of them at once. If not in a transaction, the event is published right away.
+
+    If the last registered hook was discarded with a rolled back savepoint, then the
+    collected events are published when the request or task finishes. Outside of a
+    request or task, like in a management command, every hook publishes right away
+    so that no event is left behind.
+    """
+
+    marker = object()
+    _state.last_marker = marker
+
+    def on_commit():
+        _state.events.append(event)
+        if _state.last_marker is marker or not _state.scopes:
+            flush()
+
+    transaction.on_commit(on_commit)
+
+
+def enter_scope():
+    """Called when the thread starts handling a request or running a task."""
+
+    _state.scopes += 1
+
+
+def exit_scope():
+    """
+    Called when the thread has finished a request or task. Publishes the events
+    that are left behind.
+    """
+
+    _state.scopes = max(0, _state.scopes - 1)
+    flush()
+
+
+def broadcast_to_users(user_ids, payload, ignore_web_socket_id=None, coalesce_key=None):
+    """
+    Broadcasts a JSON payload to the provided users after the current transaction
+    commits.
+
+    :param user_ids: A list containing the user ids that should receive the payload.
+    :type user_ids: list
+    :param payload: A dictionary object containing the payload that must be
+        broadcasted.
+    :type payload: dict
+    :param ignore_web_socket_id: The web socket id to which the message must not be
+        send. This is normally the web socket id that has originally made the change
+        request.
+    :type ignore_web_socket_id: str
+    :param coalesce_key: If provided, then a pending event having the same key for
+        the same recipient is superseded by this one.
+    :type coalesce_key: str
+    """
+
+    _add_event(("users", list(user_ids), payload, ignore_web_socket_id, coalesce_key))
+
+
+def broadcast_to_channel_group(
+        group, payload, ignore_web_socket_id=None, coalesce_key=None
+):
+    """
+    Broadcasts a JSON payload to all the connections within the channel group having
+    the provided name after the current transaction commits.
+
+    :param group: The name of the channel group.
+    :type group: str
+    :param payload: A dictionary object containing the payload that must be
+        broadcasted.
+    :type payload: dict
+    :param ignore_web_socket_id: The web socket id to which the message must not be
+        send.
+    :type ignore_web_socket_id: str
+    :param coalesce_key: If provided, then a pending event having the same key for
+        the same recipient is superseded by this one.
+    :type coalesce_key: str
+    """
+
+    _add_event(("channel_group", group, payload, ignore_web_socket_id, coalesce_key))
+
+
+def broadcast_to_group(group_id, payload, ignore_web_socket_id=None, coalesce_key=None):
+    """
+    Broadcasts a JSON payload to all the users that are in the provided group (Group
+    model) id after the current transaction commits.
+
+    :param group_id: The id of the group.
+    :type group_id: int
+    :param payload: A dictionary object containing the payload that must be
+        broadcasted.
+    :type payload: dict
+    :param ignore_web_socket_id: The web socket id to which the message must not be
+        send.
+    :type ignore_web_socket_id: str
+    :param coalesce_key: If provided, then a pending event having the same key for
+        the same recipient is superseded by this one.
+    :type coalesce_key: str
+    """
+
+    _add_event(("group", group_id, payload, ignore_web_socket_id, coalesce_key))
+
+
+def get_group_events(events):
+    """
+    Converts the events into the events per channel group. Every user has its own
+    channel group, so the user events are split per recipient.
+
+    :param events: The events that were added during the transaction.
+    :type events: list
+    :return: A list of (group name, coalesce key, event) tuples.
+    :rtype: list
+    """
+
+    group_events = []
+
+    for event_type, target, payload, ignore_web_socket_id, coalesce_key in events:
+        event = {"payload": payload, "ignore_web_socket_id": ignore_web_socket_id}
+
+        if coalesce_key is None:
+            # Without a declared key only identical events are merged.
+            key = json.dumps(event, sort_keys=True, default=str)
+        else:
+            key = ("coalesce_key", coalesce_key)
+            # Allows the consumers to also coalesce the frames in their send queue.
+            event["coalesce_key"] = coalesce_key
+
+        if event_type == "channel_group":
+            group_events.append((target, key, event))
+            continue
+
+        if event_type == "group":
+            user_ids = get_group_user_ids(target)
+        else:
+            user_ids = target
+
+        for user_id in dict.fromkeys(user_ids):
+            group_events.append((get_user_group_name(user_id), key, event))
+
+    return group_events
+
+
+def add_group_events(pending, group_events):
+    """
+    Adds the events to the pending events per channel group. A pending event having
+    the same key for the same group is superseded.
+
+    :param pending: The pending events keyed by group name and then by key.
+    :type pending: OrderedDict
+    :param group_events: A list of (group name, coalesce key, event) tuples.
+    :type group_events: list
+    """
+
+    for group, key, event in group_events:
+        events = pending.setdefault(group, OrderedDict())
+        events.pop(key, None)
+        events[key] = event
+
+
+def get_batch_messages(pending):
+    """
+    Converts the pending events into one `broadcast_batch` message per channel group.
+
+    :param pending: The pending events keyed by group name and then by key.
+    :type pending: OrderedDict
+    :return: A list of (group name, message) tuples.
+    :rtype: list
+    """
+
+    # Groups that receive exactly the same events, like the groups of the users that
+    # receive the same payload, share the event id so that their frames are encoded
+    # once per process.
+    event_ids = {}
+    messages = []
+
+    for group, events in pending.items():
+        events = list(events.values())
+        events_key = tuple(id(event) for event in events)
+        if events_key not in event_ids:
+            event_ids[events_key] = uuid.uuid4().hex
+        messages.append(
+            (
+                group,
+                {
+                    "type": "broadcast_batch",
+                    "event_id": event_ids[events_key],
+                    "events": events,
+                },
+            )
+        )
+
+    return messages
+
+
+def send_messages(messages):
+    """
+    Sends the messages to the channel layer from this process if direct publishing
+    is enabled. Otherwise, or if the channel layer is unavailable, they are handed
+    over to Celery.
+
+    :param messages: A list of (group name, message) tuples.
+    :type messages: list
+    """
+
+    if not messages:
+        return
+
+    channel_layer = get_channel_layer() if settings.WS_DIRECT_PUBLISH else None
+
+    if channel_layer is not None:
+        failed = async_runtime.submit(group_send_many, channel_layer, messages)
+        if not failed:
+            return
+        logger.warning(
+            "The channel layer is unavailable, %s of %s messages are sent via Celery.",
+            len(failed),
+            len(messages),
+        )
+        messages = failed
+
+    from ws.tasks import group_send_messages
+
+    group_send_messages.delay(messages)
+
+
+class EventCoalescer:
+    """
+    Collects the events of all the transactions in this process for a short window
+    and then sends a single `broadcast_batch` message per channel group. Events for
+    the same group having the same key supersede each other, so bursts of edits
+    result in one channel layer message and one frame per connection.
+
+    The windows are flushed by one long lived thread per process that waits on a
+    condition until the window expires. It sends via the async runtime, so all the
+    windows use the same event loop and channel layer connections. The thread is
+    started on the first add and again in a forked child process.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._pending = OrderedDict()
+        self._deadline = None
+        self._thread = None
+        self._pid = None
+
+    def add(self, group_events, window):
+        """
+        Adds the events and sends them when the window of the first pending event
+        expires.
+
+        :param group_events: A list of (group name, coalesce key, event) tuples.
+        :type group_events: list
+        :param window: The window in milliseconds. If 0, then the events are sent
+            right away.
+        :type window: int
+        """
+
+        with self._condition:
+            self._ensure_flusher()
+            add_group_events(self._pending, group_events)
+
+            if window > 0:
+                if self._deadline is None:
+                    self._deadline = time.monotonic() + window / 1000
+                    self._condition.notify_all()
+                return
+
+        self.flush()
+
+    def flush(self):
+        """Sends all the pending events in the calling thread."""
+
+        with self._condition:
+            if self._pid != os.getpid():
+                # Nothing was added in this process.
+                return
+
+            pending = self._take_pending()
+
+        send_messages(get_batch_messages(pending))
+
+    def _ensure_flusher(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+
+        # The thread of a parent process doesn't exist in a forked child and the
+        # events it copied are sent by the parent.
+        self._pending = OrderedDict()
+        self._deadline = None
+        self._pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._run, name="ws-event-coalescer", daemon=True
+        )
+        self._thread.start()
+
+    def _take_pending(self):
+        pending, self._pending = self._pending, OrderedDict()
+        self._deadline = None
+        return pending
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._deadline is None or self._deadline > time.monotonic():
+                    self._condition.wait(
+                        None
+                        if self._deadline is None
+                        else self._deadline - time.monotonic()
+                    )
+                pending = self._take_pending()
+
+            try:
+                send_messages(get_batch_messages(pending))
+            except Exception:
+                logger.exception("Could not send the coalesced events.")
+
+
+coalescer = EventCoalescer()
+atexit.register(coalescer.flush)
+
+
+def flush():
+    """
+    Hands all the collected events of the current thread over to the coalescer.
+    """
+
+    events, _state.events = _state.events, []
+
+    if not events:
+        return
+
+    coalescer.add(get_group_events(events), settings.WS_COALESCE_WINDOW_MS)
+
+
+class TaskBatcher:
+    """
+    Collects the events that must be broadcasted by Celery and hands them over as a
+    single `broadcast_batch` task once `WS_TASK_BATCH_WINDOW_MS` milliseconds have
+    passed since the first pending event or `WS_TASK_BATCH_SIZE` events are pending.
+    This keeps bulk operations from sending a Celery message per event.
+
+    The batching is opt-in via the `delay_broadcast_*` functions. Signal handlers
+    of events that are emitted in bulk use them, interactive events are broadcasted
+    from the process that made the change because that's faster.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events = []
+        self._timer = None
+
+    def add(self, event):
+        """
+        :param event: An (event type, target, payload, ignore web socket id,
+            coalesce key) tuple.
+        :type event: tuple
+        """
+
+        with self._lock:
+            self._events.append(event)
+
+            if (
+                len(self._events) < settings.WS_TASK_BATCH_SIZE
+                and settings.WS_TASK_BATCH_WINDOW_MS > 0
+            ):
+                if self._timer is None:
+                    self._timer = threading.Timer(
+                        settings.WS_TASK_BATCH_WINDOW_MS / 1000, self.flush
+                    )
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+
+        self.flush()
+
+    def flush(self):
+        """Sends all the pending events as one task."""
+
+        with self._lock:
+            events, self._events = self._events, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        if not events:
+            return
+
+        from ws.tasks import broadcast_batch
+
+        broadcast_batch.delay(events)
+
+
+task_batcher = TaskBatcher()
+atexit.register(task_batcher.flush)
+
+
+def _add_task_event(event):
+    transaction.on_commit(lambda: task_batcher.add(event))
+
+
+def delay_broadcast_to_users(
+        user_ids, payload, ignore_web_socket_id=None, coalesce_key=None
+):
+    """
+    Same as `broadcast_to_users`, but the event is always broadcasted by a batched
+    Celery task instead of from this process.
+    """
+
+    _add_task_event(
+        ("users", list(user_ids), payload, ignore_web_socket_id, coalesce_key)
+    )
+
+
+def delay_broadcast_to_channel_group(
+        group, payload, ignore_web_socket_id=None, coalesce_key=None
+):
+    """
+    Same as `broadcast_to_channel_group`, but the event is always broadcasted by a
+    batched Celery task instead of from this process.
+    """
+
+    _add_task_event(
+        ("channel_group", group, payload, ignore_web_socket_id, coalesce_key)
+    )
+
+
+def delay_broadcast_to_group(
+        group_id, payload, ignore_web_socket_id=None, coalesce_key=None
+):
+    """
+    Same as `broadcast_to_group`, but the event is always broadcasted by a batched
+    Celery task instead of from this process.
+    """
+
+    _add_task_event(("group", group_id, payload, ignore_web_socket_id, coalesce_key))
@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"
+"""A full queue drops its oldest frame to make room for the new one."""
+
+DROP_NEWEST = "drop_newest"
+"""A full queue drops the new frame."""
+
+CLOSE = "close"
+"""A full queue closes the connection, for when frames must never be lost."""
+
+
+class SendQueueMetrics:
+    """
+    Process wide counters of all the send queues. The depth is the number of frames
+    that are currently waiting to be written, the other counters only go up.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.depth = 0
+        self.max_connection_depth = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.evicted = 0
+
+    def increment(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def observe_connection_depth(self, depth):
+        if depth > self.max_connection_depth:
+            self.max_connection_depth = depth
+
+    def snapshot(self):
+        """
+        :return: The current values of all the counters.
+        :rtype: dict
+        """
+
+        with self._lock:
+            return {
+                "connections": self.connections,
+                "depth": self.depth,
+                "max_connection_depth": self.max_connection_depth,
+                "sent": self.sent,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "evicted": self.evicted,
+            }
+
+
+send_queue_metrics = SendQueueMetrics()
+
+
+class QueuedFrame:
+    __slots__ = ("frame", "close", "coalesce_key", "queued_at")
+
+    def __init__(self, frame, close, coalesce_key):
+        self.frame = frame
+        self.close = close
+        self.coalesce_key = coalesce_key
+        self.queued_at = time.monotonic()
+
+
+class SendQueueConsumerMixin:
+    """
+    Writes the frames of an async consumer via a bounded per connection queue, so
+    that a client that doesn't keep up can't hold up the handling of the channel
+    layer messages. Must be placed before the `AsyncFrameConsumerMixin`.
+
+    If the queue is full, then the `send_queue_policy` decides what happens. A frame
+    sent with a coalesce key replaces a queued frame having the same key. If a frame
+    hasn't been written `WS_SLOW_CONSUMER_TIMEOUT` seconds after it was queued,
+    then the client is considered stalled and the connection is closed. This is
+    checked when a frame is sent and by the writer, so a client that stopped
+    reading is also noticed when nothing else is sent to it.
+    """
+
+    send_queue_size = None
+    """The maximum number of queued frames, defaults to `WS_SEND_QUEUE_SIZE`."""
+
+    send_queue_policy = DROP_OLDEST
+    """One of `DROP_OLDEST`, `DROP_NEWEST` or `CLOSE`."""
+
+    send_queue = None
+    send_queue_writer = None
+    send_queue_stalled = False
+
+    def start_send_queue(self):
+        self.send_queue = deque()
+        self.send_queue_ready = asyncio.Event()
+        self.send_queue_stalled = False
+        self.send_queue_writer = asyncio.ensure_future(self.write_send_queue())
+        send_queue_metrics.increment(connections=1)
+
+    def stop_send_queue(self):
+        if self.send_queue_writer is None:
+            return
+
+        writer, self.send_queue_writer = self.send_queue_writer, None
+        # The writer stops by itself when it evicts the connection.
+        if writer is not asyncio.current_task():
+            writer.cancel()
+        send_queue_metrics.increment(connections=-1, depth=-len(self.send_queue))
+        self.send_queue.clear()
+
+    async def send_frame(self, frame, close=False, coalesce_key=None):
+        """
+        Adds the frame to the send queue of the connection.
+
+        :param frame: The encoded frame.
+        :type frame: str or bytes
+        :param close: Whether the connection must be closed after the frame is sent.
+        :type close: bool
+        :param coalesce_key: If provided, then a queued frame having the same key is
+            replaced by this one.
+        :type coalesce_key: str
+        """
+
+        if self.send_queue_writer is None or self.send_queue_writer.done():
+            # The connection has been evicted or a closing frame has been sent.
+            return
+
+        queue = self.send_queue
+
+        if queue and time.monotonic() - queue[0].queued_at > self.get_slow_timeout():
+            await self.evict("the oldest frame has not been sent in time")
+            return
+
+        if coalesce_key is not None:
+            for queued_frame in queue:
+                if queued_frame.coalesce_key == coalesce_key:
+                    queue.remove(queued_frame)
+                    send_queue_metrics.increment(coalesced=1, depth=-1)
+                    break
+
+        if len(queue) >= self.get_send_queue_size():
+            if self.send_queue_policy == CLOSE:
+                await self.evict("the send queue is full")
+                return
+            send_queue_metrics.increment(dropped=1)
+            if self.send_queue_policy == DROP_NEWEST:
+                return
+            queue.popleft()
+            send_queue_metrics.increment(depth=-1)
+
+        queue.append(QueuedFrame(frame, close, coalesce_key))
+        send_queue_metrics.increment(depth=1)
+        send_queue_metrics.observe_connection_depth(len(queue))
+        self.send_queue_ready.set()
+
+    def get_send_queue_size(self):
+        return self.send_queue_size or settings.WS_SEND_QUEUE_SIZE
+
+    def get_slow_timeout(self):
+        return settings.WS_SLOW_CONSUMER_TIMEOUT
+
+    async def write_send_queue(self):
+        queue = self.send_queue
+        writer = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+
+        def stalled():
+            self.send_queue_stalled = True
+            writer.cancel()
+
+        while True:
+            if not queue:
+                self.send_queue_ready.clear()
+                await self.send_queue_ready.wait()
+                continue
+
+            queued_frame = queue.popleft()
+            send_queue_metrics.increment(depth=-1)
+
+            remaining = (
+                queued_frame.queued_at + self.get_slow_timeout() - time.monotonic()
+            )
+            if remaining <= 0:
+                await self.evict("a frame has not been sent in time")
+                return
+
+            # Writing blocks while the client doesn't read, the timer interrupts it
+            # once the frame has been waiting for too long.
+            timer = loop.call_later(remaining, stalled)
+            try:
+                await super().send_frame(queued_frame.frame, queued_frame.close)
+            except asyncio.CancelledError:
+                if not self.send_queue_stalled:
+                    raise
+                await self.evict("a frame has not been sent in time")
+                return
+            finally:
+                timer.cancel()
+
+            send_queue_metrics.increment(sent=1)
+
+            if queued_frame.close:
+                return
+
+    async def evict(self, reason):
+        """
+        Closes the connection of a slow client. The client can reconnect and fetch
+        the current state instead of receiving all the frames it has missed.
+
+        :param reason: Why the connection is closed, only used for logging.
+        :type reason: str
+        """
+
+        logger.warning(
+            "Closing web socket connection %s because %s.", self.channel_name, reason
+        )
+        send_queue_metrics.increment(evicted=1)
+        self.stop_send_queue()
+        # 1013 means try again later.
+        await self.close(code=1013)
+
+    async def websocket_connect(self, message):
+        self.start_send_queue()
+        await super().websocket_connect(message)
+
+    async def websocket_disconnect(self, message):
+        self.stop_send_queue()
+        await super().websocket_disconnect(message)
@@ -1,6 +1,6 @@
 from core.registry import Instance, Registry
 
-from ws.tasks import broadcast_to_channel_group
+from ws import publisher
 
 
 class PageType(Instance):
@@ -25,6 +25,14 @@ class PageType(Instance):
     dynamic groups.
     """
 
+    cache_can_add = True
+    """
+    Whether the result of `can_add` may be cached per user and parameters. The
+    cached results of a user are invalidated when their group memberships change,
+    page types that depend on anything else, like the web socket id, must disable
+    it.
+    """
+
     def can_add(self, user, web_socket_id, **kwargs):
         """
         Indicates whether the user can be added to the page group. Here can for
@@ -61,7 +69,9 @@ class PageType(Instance):
             "Each web socket page must have his own get_group_name method."
         )
 
-    def broadcast(self, payload, ignore_web_socket_id=None, **kwargs):
+    def broadcast(
+            self, payload, ignore_web_socket_id=None, coalesce_key=None, **kwargs
+    ):
         """
         Broadcasts a payload to everyone within the group.
 
@@ -71,12 +81,15 @@ class PageType(Instance):
         :param ignore_web_socket_id: If provided then the payload will not be broad
             casted to that web socket id. This is often the sender.
         :type ignore_web_socket_id: str
+        :param coalesce_key: If provided, then a pending payload with the same key for
+            the same group is superseded by this one.
+        :type coalesce_key: str
         :param kwargs: The additional parameters including their provided values.
         :type kwargs: dict
         """
 
-        broadcast_to_channel_group.delay(
-            self.get_group_name(**kwargs), payload, ignore_web_socket_id
+        publisher.broadcast_to_channel_group(
+            self.get_group_name(**kwargs), payload, ignore_web_socket_id, coalesce_key
         )
 
 
@@ -1,11 +1,12 @@
+from channels.auth import AuthMiddlewareStack
 from django.urls import re_path
 
-from .consumers import (
-    # CoreConsumer,
-    ChatConsumer,
-)
+from .auth import JWTTokenAuthMiddleware
+from .consumers import ChatConsumer, CoreConsumer
 
+# The core connections authenticate via the `jwt_token` GET parameter, the chat
+# connections via the session of the user.
 websocket_urlpatterns = [
-    # re_path(r"^ws/core/", CoreConsumer.as_asgi()),
-    re_path(r"^ws/chat/", ChatConsumer.as_asgi()),
+    re_path(r"^ws/core/", JWTTokenAuthMiddleware(CoreConsumer.as_asgi())),
+    re_path(r"^ws/chat/", AuthMiddlewareStack(ChatConsumer.as_asgi())),
 ]
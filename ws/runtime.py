@@ -0,0 +1,124 @@
+import asyncio
+import os
+import threading
+
+from asgiref.sync import async_to_sync
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+
+
+class AsyncRuntime:
+    """
+    A long lived event loop running in a daemon thread of the process. Sync code,
+    like the Celery tasks, submits coroutines to it instead of wrapping every call in
+    `async_to_sync`, which creates a new event loop and thus new channel layer
+    connections every time. Because the loop lives as long as the process, the
+    connection pools of the channel layer are reused by all the tasks.
+
+    The loop is started on the first submit and again in a forked child process,
+    so it's safe to use with the prefork pool of Celery.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._pid = None
+
+    def get_loop(self):
+        """
+        :return: The running event loop of this process, it's started if needed.
+        :rtype: asyncio.AbstractEventLoop
+        """
+
+        loop = self._loop
+        if loop is not None and self._pid == os.getpid():
+            return loop
+
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                # The loop and thread of a parent process don't exist in a forked
+                # child, so a new loop is started.
+                self._start()
+            return self._loop
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(started.set)
+            try:
+                loop.run_forever()
+            finally:
+                # Closing the loop also closes the channel layer connection pools
+                # that were created for it.
+                loop.close()
+
+        self._thread = threading.Thread(target=run, name="ws-async-runtime")
+        self._thread.daemon = True
+        self._thread.start()
+        started.wait()
+        self._loop = loop
+        self._pid = os.getpid()
+
+    def submit(self, coroutine_function, *args, timeout=None, **kwargs):
+        """
+        Runs the coroutine function in the event loop of the runtime and waits for
+        its result.
+
+        :param coroutine_function: The async function that must be called.
+        :type coroutine_function: callable
+        :param timeout: The maximum number of seconds to wait for the result,
+            defaults to WS_ASYNC_RUNTIME_TIMEOUT.
+        :type timeout: float
+        :raises RuntimeError: When called from the thread of the runtime itself,
+            because waiting for the result would block the loop forever.
+        :raises concurrent.futures.TimeoutError: When the timeout has passed. The
+            coroutine is cancelled, so it doesn't keep running in the loop.
+        :return: The result of the coroutine function.
+        """
+
+        if not settings.WS_ASYNC_RUNTIME:
+            return async_to_sync(coroutine_function)(*args, **kwargs)
+
+        loop = self.get_loop()
+
+        if threading.current_thread() is self._thread:
+            raise RuntimeError("Can't submit to the runtime from its own thread.")
+
+        if timeout is None:
+            timeout = settings.WS_ASYNC_RUNTIME_TIMEOUT
+
+        future = asyncio.run_coroutine_threadsafe(
+            coroutine_function(*args, **kwargs), loop
+        )
+        try:
+            return future.result(timeout)
+        except BaseException:
+            # Also when the wait is interrupted, like by the soft time limit of
+            # Celery, the coroutine must not keep running without anyone waiting.
+            future.cancel()
+            raise
+
+    def stop(self):
+        """Stops the event loop of this process if it's running."""
+
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                return
+
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = self._pid = None
+
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+
+async_runtime = AsyncRuntime()
+
+
+@worker_process_shutdown.connect
+def stop_async_runtime(**kwargs):
+    async_runtime.stop()
@@ -1,53 +1,131 @@
-from django.db import transaction
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
 
 from core import signals
-from .tasks import broadcast_to_group, broadcast_to_users
+from . import publisher
+from .auth import user_loader
+from .members import group_members
+from .subscriptions import page_permission_cache
+
+
+@receiver(signals.group_created)
+@receiver(signals.group_restored)
+def group_membership_changed(sender, **kwargs):
+    # The memberships of a created or restored group are not known here, so all the
+    # cached page permissions of this process are dropped.
+    page_permission_cache.clear()
 
 
 @receiver(signals.group_deleted)
 def group_deleted(sender, group_id, group, group_users, user=None, **kwargs):
-    transaction.on_commit(
-        lambda: broadcast_to_users.delay(
-            [u.id for u in group_users],
-            {"type": "group_deleted", "group_id": group_id},
-            getattr(user, "web_socket_id", None),
-        )
+    for u in group_users:
+        page_permission_cache.invalidate_user(u.id)
+    group_members.delete(group_id)
+
+    # Deleting a group reaches all its members and groups are often deleted in bulk,
+    # so the events are handed to Celery in batches.
+    publisher.delay_broadcast_to_users(
+        [u.id for u in group_users],
+        {"type": "group_deleted", "group_id": group_id},
+        getattr(user, "web_socket_id", None),
     )
 
 
 @receiver(signals.group_user_deleted)
 def group_user_deleted(sender, group_user, user, **kwargs):
-    transaction.on_commit(
-        lambda: broadcast_to_users.delay(
-            [group_user.user_id],
-            {"type": "group_deleted", "group_id": group_user.group_id},
-            getattr(user, "web_socket_id", None),
-        )
+    page_permission_cache.invalidate_user(group_user.user_id)
+    group_members.remove(group_user.group_id, group_user.user_id)
+
+    publisher.broadcast_to_users(
+        [group_user.user_id],
+        {"type": "group_deleted", "group_id": group_user.group_id},
+        getattr(user, "web_socket_id", None),
     )
 
 
+@receiver(signals.group_user_updated)
+def group_user_updated(sender, group_user, user, **kwargs):
+    page_permission_cache.invalidate_user(group_user.user_id)
+    group_members.add(group_user.group_id, group_user.user_id)
+
+
 @receiver(signals.application_deleted)
 def application_deleted(sender, application_id, application, user, **kwargs):
-    transaction.on_commit(
-        lambda: broadcast_to_group.delay(
-            application.group_id,
-            {"type": "application_deleted", "application_id": application_id},
-            getattr(user, "web_socket_id", None),
-        )
+    # Applications are often deleted in bulk, see `group_deleted`.
+    publisher.delay_broadcast_to_group(
+        application.group_id,
+        {"type": "application_deleted", "application_id": application_id},
+        getattr(user, "web_socket_id", None),
     )
 
 
 @receiver(signals.applications_reordered)
 def applications_reordered(sender, group, order, user, **kwargs):
-    transaction.on_commit(
-        lambda: broadcast_to_group.delay(
-            group.id,
-            {
-                "type": "applications_reordered",
-                "group_id": group.id,
-                "order": order,
-            },
-            getattr(user, "web_socket_id", None),
-        )
+    publisher.broadcast_to_group(
+        group.id,
+        {
+            "type": "applications_reordered",
+            "group_id": group.id,
+            "order": order,
+        },
+        getattr(user, "web_socket_id", None),
+        coalesce_key=f"applications_reordered-{group.id}",
     )
+
+
+@receiver(request_started)
+@receiver(task_prerun)
+def enter_publisher_scope(**kwargs):
+    publisher.enter_scope()
+
+
+@receiver(request_finished)
+@receiver(task_postrun)
+def exit_publisher_scope(**kwargs):
+    # Publishes the events that are left behind if the last event of a transaction
+    # was added in a savepoint that has been rolled back.
+    publisher.exit_scope()
+
+
+# The fields of the user that the page permission checks can depend on.
+USER_PERMISSION_FIELDS = ("role", "is_active", "is_staff", "is_superuser", "deleted_at")
+
+
+def get_user_permission_values(user):
+    # Deferred fields are not loaded, they can only differ once they're assigned.
+    return tuple(user.__dict__.get(name) for name in USER_PERMISSION_FIELDS)
+
+
+@receiver(post_init, sender=settings.AUTH_USER_MODEL)
+def remember_user_permission_values(sender, instance, **kwargs):
+    instance._ws_permission_values = get_user_permission_values(instance)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    # The web socket handshakes of this process must not use the old user. Other
+    # processes use it until their cached copy expires.
+    user_loader.invalidate(instance.get_username())
+
+    # Most saves, like updating when the user was last active, can't change the
+    # page permissions, so the other processes are only notified when they can.
+    if update_fields is not None and set(update_fields).isdisjoint(
+        USER_PERMISSION_FIELDS
+    ):
+        return
+
+    values = get_user_permission_values(instance)
+    changed = not created and values != instance._ws_permission_values
+    instance._ws_permission_values = values
+
+    if changed:
+        page_permission_cache.invalidate_user(instance.id)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_deleted(sender, instance, **kwargs):
+    user_loader.invalidate(instance.get_username())
+    page_permission_cache.invalidate_user(instance.id)
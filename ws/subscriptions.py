@@ -0,0 +1,315 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+from redis.exceptions import RedisError
+
+from utils.redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+
+def get_parameters_key(parameters):
+    return tuple(sorted((name, str(value)) for name, value in parameters.items()))
+
+
+class PagePermissionCache:
+    """
+    Caches the `can_add` results of the page types per (user, page, parameters) in
+    this process. Entries expire after `WS_PAGE_PERMISSION_CACHE_TTL` seconds, so
+    navigating back and forth between pages doesn't query the database every time.
+
+    When the group memberships of a user change, the entries of the user are
+    invalidated in every process via a Redis channel once the transaction commits,
+    so that no process can cache a result computed from the old memberships after
+    the invalidation. Every process that caches
+    results listens to it in a thread and drops all its entries whenever it
+    (re)subscribes, because invalidations could have been missed. A result can only
+    be stale for longer while Redis is unreachable, at most until it expires.
+    """
+
+    invalidations_channel = "ws:page_permission_invalidations"
+    invalidate_all = b"*"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+        self._keys_by_user = {}
+        self._listener = None
+        # Incremented by every invalidation, a result that was computed while the
+        # version changed might be stale and is not cached.
+        self.version = 0
+
+    def get(self, user_id, key):
+        """
+        :raises KeyError: When there is no cached result or it has expired.
+        """
+
+        with self._lock:
+            expires_at, result = self._results[(user_id, key)]
+
+            if expires_at < time.monotonic():
+                self._remove((user_id, key))
+                raise KeyError(key)
+
+            self._results.move_to_end((user_id, key))
+            return result
+
+    def set(self, user_id, key, result, version):
+        """
+        :param version: The `version` from before the result was computed.
+        :type version: int
+        """
+
+        self.start_listening()
+
+        expires_at = time.monotonic() + settings.WS_PAGE_PERMISSION_CACHE_TTL
+        with self._lock:
+            if version != self.version:
+                return
+
+            self._results[(user_id, key)] = (expires_at, result)
+            self._results.move_to_end((user_id, key))
+            self._keys_by_user.setdefault(user_id, set()).add(key)
+
+            while len(self._results) > settings.WS_PAGE_PERMISSION_CACHE_SIZE:
+                self._remove(next(iter(self._results)))
+
+    def _remove(self, cache_key):
+        user_id, key = cache_key
+        self._results.pop(cache_key, None)
+        keys = self._keys_by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[user_id]
+
+    def invalidate_user(self, user_id):
+        """
+        Removes all the cached results of the user in every process after the
+        current transaction commits.
+
+        :param user_id: The id of the user.
+        :type user_id: int
+        """
+
+        def invalidate():
+            self._invalidate_user(user_id)
+            self._publish(str(user_id))
+
+        transaction.on_commit(invalidate)
+
+    def _invalidate_user(self, user_id):
+        with self._lock:
+            self.version += 1
+            for key in self._keys_by_user.pop(user_id, ()):
+                self._results.pop((user_id, key), None)
+
+    def clear(self):
+        """
+        Removes all the cached results in every process after the current
+        transaction commits.
+        """
+
+        def clear():
+            self._clear()
+            self._publish(self.invalidate_all)
+
+        transaction.on_commit(clear)
+
+    def _clear(self):
+        with self._lock:
+            self.version += 1
+            self._results.clear()
+            self._keys_by_user.clear()
+
+    def _publish(self, message):
+        try:
+            get_redis_connection().publish(self.invalidations_channel, message)
+        except RedisError:
+            logger.warning(
+                "Could not invalidate the page permissions of other processes.",
+                exc_info=True,
+            )
+
+    def start_listening(self):
+        """
+        Starts the thread that applies the invalidations of other processes, if it
+        isn't running yet.
+        """
+
+        if self._listener is not None:
+            return
+
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._listen,
+                    name="page-permission-invalidations",
+                    daemon=True,
+                )
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = get_redis_connection().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.invalidations_channel)
+                self._clear()
+
+                for message in pubsub.listen():
+                    if message["data"] == self.invalidate_all:
+                        self._clear()
+                        continue
+
+                    try:
+                        user_id = int(message["data"])
+                    except ValueError:
+                        logger.warning(
+                            "Ignored the invalid page permission invalidation %r.",
+                            message["data"],
+                        )
+                        continue
+
+                    self._invalidate_user(user_id)
+            except RedisError:
+                logger.warning(
+                    "Lost the page permission invalidations, reconnecting.",
+                    exc_info=True,
+                )
+                self._clear()
+                time.sleep(1)
+
+
+page_permission_cache = PagePermissionCache()
+
+
+class Subscription:
+    def __init__(self, page_type, parameters, group_name):
+        self.page_type = page_type
+        self.parameters = parameters
+        self.group_name = group_name
+
+
+class PageSubscriptions:
+    """
+    Keeps track of the pages a web socket connection has subscribed to. A
+    connection can be subscribed to multiple pages at the same time, subscribing to
+    a page it's already subscribed to doesn't do anything.
+    """
+
+    def __init__(self, consumer):
+        self.consumer = consumer
+        self.subscriptions = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self.subscriptions
+
+    def __len__(self):
+        return len(self.subscriptions)
+
+    def get_key(self, page_type, parameters):
+        return page_type.type, get_parameters_key(parameters)
+
+    async def can_add(self, page_type, parameters):
+        """
+        Checks whether the user of the connection can subscribe to the page. The
+        result is cached if the page type allows it.
+
+        :param page_type: The page type.
+        :type page_type: PageType
+        :param parameters: The parameters of the page.
+        :type parameters: dict
+        :return: Whether the user can subscribe.
+        :rtype: bool
+        """
+
+        user = self.consumer.scope["user"]
+        web_socket_id = self.consumer.scope["web_socket_id"]
+        key = self.get_key(page_type, parameters)
+
+        version = page_permission_cache.version
+        if page_type.cache_can_add:
+            try:
+                return page_permission_cache.get(user.id, key)
+            except KeyError:
+                pass
+
+        can_add = await database_sync_to_async(page_type.can_add)(
+            user, web_socket_id, **parameters
+        )
+
+        if page_type.cache_can_add:
+            page_permission_cache.set(user.id, key, can_add, version)
+
+        return can_add
+
+    async def add(self, page_type, parameters):
+        """
+        Subscribes the connection to the page if the user is allowed to.
+
+        :return: Whether the connection is subscribed to the page.
+        :rtype: bool
+        """
+
+        key = self.get_key(page_type, parameters)
+
+        if key in self.subscriptions:
+            return True
+
+        if not await self.can_add(page_type, parameters):
+            return False
+
+        group_name = page_type.get_group_name(**parameters)
+        await self.consumer.channel_layer.group_add(
+            group_name, self.consumer.channel_name
+        )
+        self.subscriptions[key] = Subscription(page_type, parameters, group_name)
+        return True
+
+    async def remove(self, key):
+        """
+        Unsubscribes the connection from the page.
+
+        :param key: The key of the subscription.
+        :type key: tuple
+        :return: The removed subscription or None if it was not subscribed.
+        :rtype: Subscription or None
+        """
+
+        subscription = self.subscriptions.pop(key, None)
+
+        if subscription is None:
+            return None
+
+        # Different parameters can result in the same group, it's only discarded
+        # when no other subscription uses it.
+        if not any(
+            s.group_name == subscription.group_name
+            for s in self.subscriptions.values()
+        ):
+            await self.consumer.channel_layer.group_discard(
+                subscription.group_name, self.consumer.channel_name
+            )
+
+        return subscription
+
+    async def remove_all(self, except_key=None):
+        """
+        Unsubscribes the connection from all the pages.
+
+        :param except_key: The key of a subscription that must be kept.
+        :type except_key: tuple
+        :return: The removed subscriptions.
+        :rtype: list
+        """
+
+        removed = []
+        for key in list(self.subscriptions.keys()):
+            if key != except_key:
+                removed.append(await self.remove(key))
+        return removed
@@ -1,4 +1,12 @@
+import uuid
+from collections import OrderedDict
+
+from channels.layers import get_channel_layer
+
 from config.celery import app
+from ws.publisher import add_group_events, get_batch_messages, get_group_events
+from ws.runtime import async_runtime
+from ws.utils import get_user_group_name, group_send_many
 
 
 @app.task(bind=True)
@@ -17,21 +25,32 @@ def broadcast_to_users(self, user_ids, payload, ignore_web_socket_id=None):
     :type ignore_web_socket_id: str
     """
 
-    from asgiref.sync import async_to_sync
-
-    from channels.layers import get_channel_layer
-
+    # Every user has its own channel group, so only the connections of the
+    # recipients receive the message. They all share the event id, so the payload
+    # is encoded once per process.
+    event_id = uuid.uuid4().hex
     channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        "users",
-        {
-            "type": "broadcast_to_users",
-            "user_ids": user_ids,
-            "payload": payload,
-            "ignore_web_socket_id": ignore_web_socket_id,
-        },
+    failed = async_runtime.submit(
+        group_send_many,
+        channel_layer,
+        [
+            (
+                get_user_group_name(user_id),
+                {
+                    "type": "broadcast_to_users",
+                    "event_id": event_id,
+                    "user_ids": [user_id],
+                    "payload": payload,
+                    "ignore_web_socket_id": ignore_web_socket_id,
+                },
+            )
+            for user_id in dict.fromkeys(user_ids)
+        ],
     )
 
+    if failed:
+        group_send_messages.apply_async(args=(failed,), countdown=1)
+
 
 @app.task(bind=True)
 def broadcast_to_channel_group(self, group, payload, ignore_web_socket_id=None):
@@ -51,15 +70,13 @@ def broadcast_to_channel_group(self, group, payload, ignore_web_socket_id=None):
     :type ignore_web_socket_id: str
     """
 
-    from asgiref.sync import async_to_sync
-
-    from channels.layers import get_channel_layer
-
     channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
+    async_runtime.submit(
+        channel_layer.group_send,
         group,
         {
             "type": "broadcast_to_group",
+            "event_id": uuid.uuid4().hex,
             "payload": payload,
             "ignore_web_socket_id": ignore_web_socket_id,
         },
@@ -83,15 +100,67 @@ def broadcast_to_group(self, group_id, payload, ignore_web_socket_id=None):
     :type ignore_web_socket_id: str
     """
 
-    # from core.models import GroupUser
-    #
-    # user_ids = [
-    #     user["user_id"]
-    #     for user in GroupUser.objects.filter(group_id=group_id).values("user_id")
-    # ]
-    user_ids = []
+    # The members are resolved and sent to in this task instead of running the
+    # `broadcast_to_users` task inline.
+    send_events([("group", group_id, payload, ignore_web_socket_id, None)])
+
+
+@app.task(bind=True)
+def broadcast_batch(self, events):
+    """
+    Broadcasts many events with a single task. This is the task the
+    `ws.publisher.delay_broadcast_*` functions hand their collected events to.
+
+    :param events: A list of (event type, target, payload, ignore web socket id,
+        coalesce key) lists.
+    :type events: list
+    """
+
+    send_events(events)
 
-    if len(user_ids) == 0:
+
+def send_events(events):
+    """
+    Resolves the recipients of the events and sends one `broadcast_batch` message
+    per channel group. All the messages are sent concurrently with one submit to
+    the event loop of the process instead of one per event.
+
+    :param events: A list of (event type, target, payload, ignore web socket id,
+        coalesce key) lists.
+    :type events: list
+    """
+
+    pending = OrderedDict()
+    add_group_events(pending, get_group_events(events))
+    messages = get_batch_messages(pending)
+
+    if not messages:
         return
 
-    broadcast_to_users(user_ids, payload, ignore_web_socket_id)
+    channel_layer = get_channel_layer()
+    failed = async_runtime.submit(group_send_many, channel_layer, messages)
+
+    if failed:
+        group_send_messages.apply_async(args=(failed,), countdown=1)
+
+
+@app.task(bind=True)
+def group_send_messages(self, messages):
+    """
+    Sends already prepared messages to their channel groups. This is used by the
+    publisher when the messages could not be sent directly from the process that
+    created them.
+
+    :param messages: A list of (group name, message) pairs.
+    :type messages: list
+    """
+
+    channel_layer = get_channel_layer()
+    failed = async_runtime.submit(
+        group_send_many,
+        channel_layer,
+        [(group, message) for group, message in messages],
+    )
+
+    if failed:
+        raise self.retry(args=(failed,), countdown=1, max_retries=3)
@@ -0,0 +1,222 @@
+import asyncio
+import os
+import socket
+from collections import Counter
+from unittest import SkipTest
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from ws.layers import HashRing, ShardedRedisChannelLayer
+
+
+def get_redis_urls():
+    """
+    The Redis stand-ins for the shards, three databases of the configured Redis
+    unless CHANNEL_TEST_REDIS_URLS provides comma separated URLs.
+    """
+
+    urls = os.getenv("CHANNEL_TEST_REDIS_URLS")
+    if urls:
+        return [url.strip() for url in urls.split(",") if url.strip()]
+
+    return [
+        f"{settings.REDIS_PROTOCOL}://{settings.REDIS_USERNAME}:"
+        f"{settings.REDIS_PASSWORD}@{settings.REDIS_HOST}:{settings.REDIS_PORT}/{db}"
+        for db in (1, 2, 3)
+    ]
+
+
+class HashRingTestCase(SimpleTestCase):
+    def test_keys_are_spread_evenly(self):
+        ring = HashRing(3)
+        nodes = Counter(ring.get_node(f"group-{index}") for index in range(30000))
+
+        self.assertEqual(set(nodes), {0, 1, 2})
+        for count in nodes.values():
+            self.assertAlmostEqual(count / 30000, 1 / 3, delta=0.05)
+
+    def test_adding_a_node_only_moves_keys_to_it(self):
+        before, after = HashRing(3), HashRing(4)
+        keys = [f"group-{index}" for index in range(30000)]
+        moved = [key for key in keys if before.get_node(key) != after.get_node(key)]
+
+        self.assertAlmostEqual(len(moved) / len(keys), 1 / 4, delta=0.05)
+        self.assertTrue(all(after.get_node(key) == 3 for key in moved))
+
+
+class ShardedRedisChannelLayerTestCase(SimpleTestCase):
+    """
+    Runs against several Redis stand-ins, see `get_redis_urls`. Two layer instances
+    act as two processes.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.hosts = get_redis_urls()
+        for url in cls.hosts:
+            url = urlparse(url)
+            try:
+                socket.create_connection((url.hostname, url.port or 6379), 1).close()
+            except OSError:
+                raise SkipTest(f"The Redis stand-in {url.netloc} is not reachable.")
+
+    def create_layer(self, **kwargs):
+        layer = ShardedRedisChannelLayer(hosts=self.hosts, **kwargs)
+        self.layers.append(layer)
+        return layer
+
+    async def run_with_layers(self, test):
+        self.layers = []
+        try:
+            await test()
+        finally:
+            if self.layers:
+                await self.layers[0].flush()
+            for layer in self.layers:
+                await layer.close_pools()
+
+    async def receive(self, layer, channel):
+        return await asyncio.wait_for(layer.receive(channel), 10)
+
+    async def test_groups_are_spread_over_the_hosts(self):
+        async def test():
+            layer = self.create_layer()
+            channel = await layer.new_channel()
+            groups = [f"group-{index}" for index in range(30)]
+            for group in groups:
+                await layer.group_add(group, channel)
+
+            for group in groups:
+                index = layer.consistent_hash(group)
+                for host in range(len(self.hosts)):
+                    async with layer.connection(host) as connection:
+                        exists = await connection.exists(layer._group_key(group))
+                    self.assertEqual(bool(exists), host == index)
+
+            self.assertEqual(
+                {layer.consistent_hash(group) for group in groups},
+                set(range(len(self.hosts))),
+            )
+
+        await self.run_with_layers(test)
+
+    async def test_group_send_reaches_members_of_all_processes(self):
+        async def test():
+            first = self.create_layer(local_fast_path=True)
+            second = self.create_layer(local_fast_path=True)
+            channels = [
+                (first, await first.new_channel()),
+                (first, await first.new_channel()),
+                (second, await second.new_channel()),
+            ]
+            for layer, channel in channels:
+                await layer.group_add("members", channel)
+
+            receivers = [
+                asyncio.ensure_future(self.receive(layer, channel))
+                for layer, channel in channels
+            ]
+            await asyncio.sleep(0.1)
+            await first.group_send("members", {"type": "test.message", "value": 1})
+
+            for message in await asyncio.gather(*receivers):
+                self.assertEqual(message, {"type": "test.message", "value": 1})
+
+        await self.run_with_layers(test)
+
+    async def test_local_fast_path_reaches_all_waiting_consumers(self):
+        async def test():
+            layer = self.create_layer(local_fast_path=True)
+            channels = [await layer.new_channel() for _ in range(5)]
+            for channel in channels:
+                await layer.group_add("local", channel)
+
+            # One of the consumers holds the receive lock and waits on Redis, it
+            # must get the messages as well.
+            for value in range(3):
+                receivers = [
+                    asyncio.ensure_future(self.receive(layer, channel))
+                    for channel in channels
+                ]
+                await asyncio.sleep(0.1)
+                await layer.group_send("local", {"type": "test.message", "n": value})
+
+                for message in await asyncio.gather(*receivers):
+                    self.assertEqual(message["n"], value)
+
+            self.assertEqual(dict(layer.receive_buffer), {})
+            self.assertEqual(layer.receiving, Counter())
+
+        await self.run_with_layers(test)
+
+    async def test_local_fast_path_skips_consumers_that_are_not_receiving(self):
+        async def test():
+            layer = self.create_layer(local_fast_path=True)
+            channel = await layer.new_channel()
+            await layer.group_add("idle", channel)
+
+            await layer.group_send("idle", {"type": "test.message"})
+            self.assertEqual(dict(layer.receive_buffer), {})
+
+            # The message went through Redis and is received once the consumer
+            # receives again.
+            self.assertEqual(
+                await self.receive(layer, channel), {"type": "test.message"}
+            )
+
+            # A consumer that stopped receiving doesn't leave a buffer behind.
+            receiver = asyncio.ensure_future(layer.receive(channel))
+            await asyncio.sleep(0.1)
+            receiver.cancel()
+            await asyncio.gather(receiver, return_exceptions=True)
+            await layer.group_send("idle", {"type": "test.message"})
+            self.assertEqual(dict(layer.receive_buffer), {})
+
+        await self.run_with_layers(test)
+
+    async def test_local_fast_path_keeps_the_order_of_the_messages(self):
+        async def test():
+            layer = self.create_layer(local_fast_path=True)
+            channel, other_channel = [await layer.new_channel() for _ in range(2)]
+            await layer.group_add("ordered", channel)
+
+            # The other consumer holds the receive lock, but doesn't get the
+            # messages from Redis until they're released.
+            released = asyncio.Event()
+            brpop_with_clean = layer._brpop_with_clean
+
+            async def brpop_after_release(*args, **kwargs):
+                await released.wait()
+                return await brpop_with_clean(*args, **kwargs)
+
+            layer._brpop_with_clean = brpop_after_release
+            other_receiver = asyncio.ensure_future(layer.receive(other_channel))
+            await asyncio.sleep(0.1)
+
+            # The first message goes through Redis because the consumer isn't
+            # receiving. The second one must not overtake it via the fast path.
+            await layer.group_send("ordered", {"type": "test.message", "n": 1})
+            receiver = asyncio.ensure_future(self.receive(layer, channel))
+            await asyncio.sleep(0.1)
+            await layer.group_send("ordered", {"type": "test.message", "n": 2})
+
+            released.set()
+            self.assertEqual(await receiver, {"type": "test.message", "n": 1})
+            self.assertEqual(
+                await self.receive(layer, channel), {"type": "test.message", "n": 2}
+            )
+
+            # The consumer caught up, so the fast path is used again.
+            receiver = asyncio.ensure_future(self.receive(layer, channel))
+            await asyncio.sleep(0.1)
+            await layer.group_send("ordered", {"type": "test.message", "n": 3})
+            self.assertEqual(await receiver, {"type": "test.message", "n": 3})
+            self.assertNotIn(channel, layer.remote_pending)
+
+            other_receiver.cancel()
+            await asyncio.gather(other_receiver, return_exceptions=True)
+
+        await self.run_with_layers(test)
@@ -0,0 +1,62 @@
+import asyncio
+
+from django.test import SimpleTestCase, override_settings
+
+from ws.queues import SendQueueConsumerMixin, send_queue_metrics
+
+
+class FrameConsumer:
+    """Writes frames like a client that only reads while `reading` is set."""
+
+    channel_name = "test.channel"
+
+    def __init__(self):
+        self.reading = asyncio.Event()
+        self.frames = []
+        self.close_codes = []
+
+    async def send_frame(self, frame, close=False):
+        await self.reading.wait()
+        self.frames.append(frame)
+
+    async def close(self, code=None):
+        self.close_codes.append(code)
+
+
+class QueuedFrameConsumer(SendQueueConsumerMixin, FrameConsumer):
+    pass
+
+
+@override_settings(WS_SEND_QUEUE_SIZE=10, WS_SLOW_CONSUMER_TIMEOUT=0.1)
+class SendQueueConsumerMixinTestCase(SimpleTestCase):
+    async def test_frames_are_written_in_order(self):
+        consumer = QueuedFrameConsumer()
+        consumer.reading.set()
+        consumer.start_send_queue()
+
+        for frame in ("a", "b", "c"):
+            await consumer.send_frame(frame)
+        await asyncio.sleep(0.2)
+
+        self.assertEqual(consumer.frames, ["a", "b", "c"])
+        self.assertEqual(consumer.close_codes, [])
+        consumer.stop_send_queue()
+
+    async def test_stalled_client_is_closed_without_further_frames(self):
+        consumer = QueuedFrameConsumer()
+        consumer.start_send_queue()
+        evicted = send_queue_metrics.snapshot()["evicted"]
+
+        with self.assertLogs("ws.queues", "WARNING"):
+            await consumer.send_frame("a")
+            await consumer.send_frame("b")
+            await asyncio.sleep(0.3)
+
+        self.assertEqual(consumer.frames, [])
+        self.assertEqual(consumer.close_codes, [1013])
+        self.assertEqual(send_queue_metrics.snapshot()["evicted"], evicted + 1)
+        self.assertIsNone(consumer.send_queue_writer)
+
+        # Frames sent after the eviction are ignored.
+        await consumer.send_frame("c")
+        self.assertEqual(len(consumer.send_queue), 0)
@@ -0,0 +1,72 @@
+import asyncio
+
+from django.conf import settings
+
+
+def get_user_group_name(user_id):
+    """
+    Returns the name of the channel group that contains all the connections of the
+    provided user.
+
+    :param user_id: The id of the user.
+    :type user_id: int
+    :return: The channel group name.
+    :rtype: str
+    """
+
+    return f"user-{user_id}"
+
+
+def get_chat_user_group_name(user_id):
+    """
+    Returns the name of the channel group that contains all the chat connections of
+    the provided user.
+
+    :param user_id: The id of the user.
+    :type user_id: int
+    :return: The channel group name.
+    :rtype: str
+    """
+
+    return f"{settings.CHANNEL_CHAT_REDIS}-user-{user_id}"
+
+
+def get_group_user_ids(group_id):
+    """
+    Returns the ids of the users that are in the provided group (Group model) id. They
+    are resolved via the group member index, without a query per broadcast.
+
+    :param group_id: The id of the group.
+    :type group_id: int
+    :return: The user ids of the group members.
+    :rtype: list
+    """
+
+    from ws.members import group_members
+
+    return group_members.get_user_ids(group_id)
+
+
+async def group_send_many(channel_layer, messages):
+    """
+    Sends multiple messages to their channel groups concurrently, so that the round
+    trips to the channel layer overlap instead of adding up.
+
+    :param channel_layer: The channel layer to send the messages with.
+    :type channel_layer: BaseChannelLayer
+    :param messages: A list of (group name, message) tuples.
+    :type messages: list
+    :return: The (group name, message) tuples that could not be sent.
+    :rtype: list
+    """
+
+    results = await asyncio.gather(
+        *[channel_layer.group_send(group, message) for group, message in messages],
+        return_exceptions=True,
+    )
+
+    return [
+        message
+        for message, result in zip(messages, results)
+        if isinstance(result, Exception)
+    ]